@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Convert many files, optionally with a pool of processes.
+
+Shared by the file format converters, which provide a function converting
+one file and the list of files to convert.
+"""
+# version: 0.1.0
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+# Default name of the manifest of incremental conversions, kept with the
+# targets
+MANIFEST_FILE = ".convert_manifest.json"
+MANIFEST_VERSION = 1
+
+# Sources modified this close to being recorded are hashed again (ns)
+RACY_WINDOW_NS = 2_000_000_000
+
+# Amount of a source read at a time when hashing it
+HASH_CHUNK_SIZE = 1 << 20
+
+# Converts a source file to a target file, or returns the converted text
+# when there is no target
+Converter = Callable[[str, Optional[str]], Optional[str]]
+
+
+class ConversionError(Exception):
+    """A file that could not be converted."""
+
+
+class ConversionSummary:  # pylint: disable=too-few-public-methods
+    """Totals of a batch conversion and the files that failed."""
+
+    def __init__(self) -> None:
+        self.converted = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.errors: List[Tuple[str, str]] = []
+
+    def __str__(self) -> str:
+        text = f"Converted {self.converted} files, {len(self.errors)} failed."
+        if self.skipped or self.deleted:
+            text += (
+                f" Skipped {self.skipped} unchanged, "
+                f"deleted {self.deleted} orphaned."
+            )
+        return text
+
+
+def open_source(path: str, encoding: str) -> TextIO:
+    """Open a source file for reading.
+
+    Raises:
+        ConversionError: The file is missing or cannot be opened.
+    """
+    try:
+        # pylint: disable-next=consider-using-with
+        return open(path, "r", encoding=encoding)
+    except FileNotFoundError as exc:
+        raise ConversionError(f"{path} not found") from exc
+    except OSError as exc:
+        raise ConversionError(f"{path} could not be read: {exc}") from exc
+
+
+def open_target(path: str, encoding: str, buffering: int = -1) -> TextIO:
+    """Create a target file for writing, refusing to overwrite one.
+
+    Raises:
+        ConversionError: The file exists or cannot be created.
+    """
+    try:
+        # pylint: disable-next=consider-using-with
+        return open(path, "x", encoding=encoding, buffering=buffering)
+    except FileExistsError as exc:
+        raise ConversionError(f"{path} already exists") from exc
+    except OSError as exc:
+        raise ConversionError(f"{path} could not be written: {exc}") from exc
+
+
+def convert_one(
+    convert: Converter, source_path: str, target_path: Optional[str]
+) -> bool:
+    """Convert a single file, printing the converted text or the error.
+
+    Args:
+        convert: The function converting the file.
+        source_path: The path to the source file.
+        target_path: The path to the target file, or None to print the
+            converted text.
+
+    Returns:
+        Whether the file was converted.
+    """
+    try:
+        output = convert(source_path, target_path)
+    except ConversionError as exc:
+        print(f"ERROR: {exc}")
+        return False
+    if output is not None:
+        print(output)
+    return True
+
+
+class _Result(NamedTuple):
+    """The outcome of converting a file in a worker."""
+
+    source_path: str
+    output: Optional[str] = None
+    error: Optional[str] = None
+    digest: Optional[str] = None
+    converted: bool = True
+
+
+def _convert_task(task: Tuple[Converter, str, Optional[str]]) -> _Result:
+    """Convert a file, possibly in a worker process."""
+    convert, source_path, target_path = task
+    try:
+        return _Result(source_path, convert(source_path, target_path))
+    except ConversionError as exc:
+        return _Result(source_path, error=str(exc))
+
+
+def _file_digest(path: str) -> str:
+    """Hash the content of a file."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as source_file:
+            while chunk := source_file.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+    except FileNotFoundError as exc:
+        raise ConversionError(f"{path} not found") from exc
+    except OSError as exc:
+        raise ConversionError(f"{path} could not be read: {exc}") from exc
+    return digest.hexdigest()
+
+
+def _update_task(task: Tuple[Converter, str, str, Optional[str]]) -> _Result:
+    """Convert a file whose content changed, replacing its target atomically.
+
+    The file is converted to a temporary file next to the target, which
+    then replaces it, so the target is never seen half written. Errors
+    name the target rather than the temporary file.
+    """
+    convert, source_path, target_path, known_digest = task
+    try:
+        digest = _file_digest(source_path)
+        if digest == known_digest and os.path.exists(target_path):
+            return _Result(source_path, digest=digest, converted=False)
+        target_dir, target_name = os.path.split(target_path)
+        temp_path = os.path.join(
+            target_dir, f".{target_name}.{os.getpid()}.tmp"
+        )
+        try:
+            if os.path.lexists(temp_path):
+                os.unlink(temp_path)
+            try:
+                convert(source_path, temp_path)
+            except ConversionError as exc:
+                raise ConversionError(
+                    str(exc).replace(temp_path, target_path)
+                ) from exc
+            os.replace(temp_path, target_path)
+        except OSError as exc:
+            raise ConversionError(
+                f"{target_path} could not be replaced: {exc}"
+            ) from exc
+        finally:
+            if os.path.lexists(temp_path):
+                os.unlink(temp_path)
+    except ConversionError as exc:
+        return _Result(source_path, error=str(exc))
+    return _Result(source_path, digest=digest)
+
+
+class Manifest:
+    """Sources converted by earlier runs, to skip those that did not change.
+
+    Entries are keyed by target path and hold the source path, its mtime
+    and size, and a hash of its content. Several source directories can
+    share a target directory: only the targets of sources in the one being
+    converted are deleted as orphans. A source whose mtime and size
+    match is skipped without being read; one whose content still hashes
+    the same is skipped without being converted. Sources modified within
+    RACY_WINDOW_NS of being recorded are always hashed again, because a
+    later change could leave their mtime unchanged.
+    """
+
+    def __init__(
+        self, path: str, options: str = "", source_dir: Optional[str] = None
+    ) -> None:
+        self.path = path
+        self.options = options
+        self.source_dir = (
+            None if source_dir is None else (os.path.abspath(source_dir))
+        )
+        self.entries: Dict[str, List[Any]] = {}
+        self._seen: Set[str] = set()
+        self._started = time.time_ns()
+        self._dirty = False
+
+    @classmethod
+    def load(
+        cls, path: str, options: str = "", source_dir: Optional[str] = None
+    ) -> "Manifest":
+        """Load a manifest, starting afresh if it is missing or outdated.
+
+        Args:
+            path: The manifest file.
+            options: The settings the targets are converted with. The
+                manifest is discarded if they changed since the last run.
+            source_dir: The directory the sources are converted from, or
+                None if every source recorded is.
+        """
+        manifest = cls(path, options, source_dir)
+        try:
+            with open(path, encoding="utf-8") as manifest_file:
+                state = json.load(manifest_file)
+        except (OSError, ValueError):
+            return manifest
+        if (
+            state.get("version") == MANIFEST_VERSION
+            and state.get("options") == options
+        ):
+            manifest.entries = state["files"]
+        return manifest
+
+    def _key(self, target_path: str) -> str:
+        return os.path.relpath(target_path, os.path.dirname(self.path))
+
+    def check(
+        self, source_path: str, target_path: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Check whether a target is up to date by its source's mtime.
+
+        Returns:
+            Whether the target can be skipped without reading the source,
+            and the hash of the source's content when it was converted.
+        """
+        key = self._key(target_path)
+        self._seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != os.path.abspath(source_path):
+            return False, None
+        try:
+            source_stat = os.stat(source_path)
+            target_exists = os.path.exists(target_path)
+        except OSError:
+            return False, None
+        fresh = (
+            target_exists
+            and entry[1] == source_stat.st_mtime_ns
+            and entry[2] == source_stat.st_size
+        )
+        return fresh, entry[3]
+
+    def record(
+        self, source_path: str, target_path: str, digest: Optional[str]
+    ) -> None:
+        """Record a converted source, or forget a failed one."""
+        key = self._key(target_path)
+        self._dirty = True
+        if digest is None:
+            self.entries.pop(key, None)
+            return
+        try:
+            source_stat = os.stat(source_path)
+        except OSError:
+            self.entries.pop(key, None)
+            return
+        mtime_ns = source_stat.st_mtime_ns
+        if mtime_ns >= self._started - RACY_WINDOW_NS:
+            mtime_ns = -1
+        self.entries[key] = [
+            os.path.abspath(source_path),
+            mtime_ns,
+            source_stat.st_size,
+            digest,
+        ]
+
+    def _converting(self, source_path: str) -> bool:
+        """Return whether a source is in the directory being converted."""
+        if self.source_dir is None:
+            return True
+        return (
+            os.path.commonpath([self.source_dir, source_path])
+            == self.source_dir
+        )
+
+    def remove_orphans(self) -> int:
+        """Delete the targets of sources that no longer exist.
+
+        Returns:
+            The number of targets deleted.
+        """
+        deleted = 0
+        orphans = [
+            key
+            for key, entry in self.entries.items()
+            if key not in self._seen and self._converting(entry[0])
+        ]
+        for key in orphans:
+            del self.entries[key]
+            self._dirty = True
+            try:
+                os.unlink(os.path.join(os.path.dirname(self.path), key))
+                deleted += 1
+            except FileNotFoundError:
+                continue
+        return deleted
+
+    def save(self) -> None:
+        """Atomically write the manifest, if anything changed."""
+        if not self._dirty:
+            return
+        state = {
+            "version": MANIFEST_VERSION,
+            "options": self.options,
+            "files": self.entries,
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(state, manifest_file, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+
+def convert_files(
+    convert: Converter,
+    paths: Iterable[Tuple[str, Optional[str]]],
+    jobs: int = 1,
+    manifest: Optional[Manifest] = None,
+) -> ConversionSummary:
+    """Convert files, printing their output and errors in order.
+
+    Parsing and dumping are CPU bound, so with more than one job the files
+    are spread over a pool of processes.
+
+    Args:
+        convert: The module level function converting a single file.
+        paths: The source files and their target files, or None to print
+            the converted text.
+        jobs: The number of worker processes, or 0 for one per CPU.
+        manifest: Convert incrementally: only convert sources that changed
+            since the manifest was saved, replace their targets atomically,
+            and delete the targets of sources that are gone. Every source
+            needs a target. The manifest is saved afterwards.
+
+    Returns:
+        The number of files converted, skipped and deleted, and the errors
+        of the files that failed.
+    """
+    if jobs < 0:
+        raise ValueError("jobs must not be negative")
+    jobs = jobs or os.cpu_count() or 1
+    summary = ConversionSummary()
+    incremental = None
+    if manifest is None:
+        task = _convert_task
+        tasks: List[Tuple[Any, ...]] = [
+            (convert, source, target) for source, target in paths
+        ]
+    else:
+        task = _update_task
+        tasks = []
+        incremental = (manifest, {})
+        for source, target in paths:
+            if target is None:
+                raise ValueError("incremental conversion needs targets")
+            fresh, digest = manifest.check(source, target)
+            if fresh:
+                summary.skipped += 1
+            else:
+                tasks.append((convert, source, target, digest))
+                incremental[1][source] = target
+    if jobs == 1 or len(tasks) <= 1:
+        _collect(map(task, tasks), summary, incremental)
+    else:
+        # Hand out files in chunks to keep inter-process traffic down
+        chunksize = max(1, min(64, len(tasks) // (jobs * 4)))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            _collect(
+                executor.map(task, tasks, chunksize=chunksize),
+                summary,
+                incremental,
+            )
+    if manifest is not None:
+        summary.deleted = manifest.remove_orphans()
+        manifest.save()
+    return summary
+
+
+def _collect(
+    results: Iterable[_Result],
+    summary: ConversionSummary,
+    incremental: Optional[Tuple[Manifest, Dict[str, str]]] = None,
+) -> None:
+    """Print the output and errors of conversions as they complete."""
+    for result in results:
+        if incremental is not None:
+            manifest, targets = incremental
+            manifest.record(
+                result.source_path, targets[result.source_path], result.digest
+            )
+        if result.error is not None:
+            print(f"ERROR: {result.error}")
+            summary.errors.append((result.source_path, result.error))
+        elif not result.converted:
+            summary.skipped += 1
+        else:
+            summary.converted += 1
+            if result.output is not None:
+                print(result.output)
+
+
+def _jobs(text: str) -> int:
+    """Parse a number of worker processes, rejecting negative ones."""
+    try:
+        jobs = int(text)
+    except ValueError:
+        jobs = -1
+    if jobs < 0:
+        raise argparse.ArgumentTypeError(
+            f"invalid number of processes: {text!r}"
+        )
+    return jobs
+
+
+def add_jobs_argument(parser: argparse.ArgumentParser) -> None:
+    """Add the option setting the number of worker processes."""
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=_jobs,
+        default=1,
+        help="number of processes converting a directory (0: one per CPU)",
+    )
+
+
+def add_incremental_argument(parser: argparse.ArgumentParser) -> None:
+    """Add the option converting a directory incrementally."""
+    parser.add_argument(
+        "-u",
+        "--incremental",
+        action="store_true",
+        help=(
+            "only convert files changed since the last run, replace their "
+            f"targets and delete orphaned ones, tracked in {MANIFEST_FILE} "
+            "in the target directory"
+        ),
+    )
+
+
+def check_incremental(
+    parser: argparse.ArgumentParser,
+    incremental: bool,
+    source_path: str,
+    target_path: Optional[str],
+) -> None:
+    """Exit with a usage error if there are no directories to track."""
+    if not incremental:
+        return
+    if not os.path.isdir(source_path):
+        parser.error("--incremental needs a source directory")
+    if target_path is None:
+        parser.error("--incremental needs a target directory")
+
+
+def report(summary: ConversionSummary, to_stdout: bool) -> None:
+    """Print a summary, and exit with an error if any file failed.
+
+    Args:
+        summary: The summary of a batch conversion.
+        to_stdout: Whether to print to stdout, which is not wanted when
+            the converted text itself went there.
+    """
+    print(summary, file=sys.stdout if to_stdout else sys.stderr)
+    if summary.errors:
+        sys.exit(1)
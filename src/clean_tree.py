@@ -4,70 +4,1050 @@
 Find and remove unwanted files and folders.
 
 Usage:
-    clean_tree.py [options] DIRECTORY
+    clean_tree.py [options] DIRECTORY...
 
 Options:
     -h, --help          Show this help message and exit.
     -s, --suppress      Suppress the list of unwanted items from being printed.
     -f, --force         Skip confirmation and remove unwanted items directly.
+    -d, --discover      Clean every directory with a '.clean_tree' file below
+                        the given directories.
+    -j, --jobs N        Number of threads walking and removing items in
+                        parallel.
+    -n, --dry-run       Report reclaimable space per pattern, remove nothing.
+    --json              Write the dry-run report as JSON Lines.
+    -i, --index [FILE]  Only list directories changed since the last run.
+    --rebuild-index     List every directory and rewrite the index.
+    --verify-index      List every directory and report wrong index entries.
 
 Clean Tree File:
 The clean tree file is a file named ".clean_tree" that contains a list of
 unwanted files and folders. The file should be located in the directory that
-you want to clean up. Each line in the file should contain the name of a file
-or folder that you want to remove.
+you want to clean up. Each line is a pattern in the style of '.gitignore':
+
+    name        Match files or folders with this name at any depth.
+    *.pyc       Wildcards: '*', '?' and '[abc]' match within a name,
+                '**' matches across folders.
+    build/      A trailing slash only matches folders.
+    /dist       A leading or inner slash anchors the pattern to the
+                directory being cleaned.
+    !keep.pyc   A leading '!' keeps items matched by earlier patterns.
+    # comment   Lines starting with '#' and blank lines are ignored.
+
+Later patterns take precedence over earlier ones. A '.clean_tree' file in a
+subfolder adds patterns relative to that subfolder, which take precedence
+over those of the folders above it.
 
 Example '.clean_tree' file contents:
 __pycache__
+*.py[cod]
 .coverage
 .pytest_cache
+build/
+**/tmp/*.log
 """
-# version: 0.3.7
+
+# version: 0.4.0
 # license: MIT
 # author: Anthony Pagan
 # repo: https://github.com/get-tony/pyutils
+# pylint: disable=too-many-lines
 
 
+import hashlib
+import json
+import os
+import queue
+import re
+import stat
 import sys
 import argparse
-import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+# Define system encoding
+ENCODING: str = sys.getfilesystemencoding() or sys.getdefaultencoding()
+
+# Name of the configuration file of a directory to clean
+CONFIG_FILE: str = ".clean_tree"
+
+# Number of matches buffered between walking threads and their consumer
+WALK_QUEUE_SIZE: int = 1024
+
+# Default name of the scan index file, kept in the directory being cleaned
+INDEX_FILE: str = ".clean_tree_index"
+INDEX_VERSION: int = 2
+
+# Directories modified this close to being listed are not trusted (ns)
+RACY_WINDOW_NS: int = 2_000_000_000
+
+# Number of items measured ahead of the report, per thread
+MEASURE_AHEAD: int = 4
+
+# Number of files a removal thread unlinks per task
+UNLINK_BATCH_SIZE: int = 256
+
+
+class PatternMatcher:  # pylint: disable=too-few-public-methods
+    """Match tree entries against '.gitignore' style patterns.
+
+    The patterns are compiled once: plain names go into dictionaries for
+    constant time lookups, and every other pattern is merged into a single
+    regular expression over the entry's path relative to the root. The
+    alternatives of the expression are in reverse order, so the first one
+    that matches is the last matching pattern, which decides the outcome.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: List[str] = []
+        # Plain names for any entry, and for directories only
+        self._names: Dict[str, int] = {}
+        self._dir_names: Dict[str, int] = {}
+        # Regular expressions for any entry, and for directories
+        file_rules: List[str] = []
+        dir_rules: List[str] = []
+
+        for line in patterns:
+            pattern = line.rstrip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negated = pattern.startswith("!")
+            body = pattern[1:] if negated else pattern
+            if body.startswith("\\"):
+                body = body[1:]
+            dir_only = body.endswith("/")
+            body = body.rstrip("/")
+            if not body:
+                continue
+
+            index = len(self.patterns)
+            self.patterns.append(pattern)
+            if "/" not in body and not _WILDCARDS.search(body):
+                names = self._dir_names if dir_only else self._names
+                names[body] = index
+                continue
+            if "/" in body:
+                regex = _translate(body.lstrip("/"))
+            else:
+                regex = "(?:.*/)?" + _translate(body)
+            rule = f"(?P<p{index}>{regex})"
+            dir_rules.insert(0, rule)
+            if not dir_only:
+                file_rules.insert(0, rule)
+
+        self._file_regex = _compile(file_rules)
+        self._dir_regex = _compile(dir_rules)
+
+    @property
+    def digest(self) -> str:
+        """A fingerprint of the patterns."""
+        return hashlib.sha256("\n".join(self.patterns).encode()).hexdigest()
+
+    def decide(self, rel_path: str, is_dir: bool) -> Optional[str]:
+        """Return the last pattern matching an entry, negated ones included.
+
+        Args:
+            rel_path: The entry's path relative to the root, using '/'.
+            is_dir: Whether the entry is a directory.
+
+        Returns:
+            The deciding pattern, or None if no pattern matches the entry.
+        """
+        name = rel_path.rpartition("/")[2]
+        index = self._names.get(name, -1)
+        if is_dir:
+            index = max(index, self._dir_names.get(name, -1))
+        regex = self._dir_regex if is_dir else self._file_regex
+        if regex is not None:
+            found = regex.fullmatch(rel_path)
+            if found is not None:
+                index = max(index, int(found.lastgroup[1:]))
+        return self.patterns[index] if index >= 0 else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[str]:
+        """Return the pattern that marks an entry as unwanted, if any.
 
+        Args:
+            rel_path: The entry's path relative to the root, using '/'.
+            is_dir: Whether the entry is a directory.
 
-def load_config(config_path: Path) -> set:
-    """Load the unwanted paths from the configuration file."""
+        Returns:
+            The deciding pattern, or None if the entry is not unwanted.
+        """
+        pattern = self.decide(rel_path, is_dir)
+        if pattern is None or pattern.startswith("!"):
+            return None
+        return pattern
+
+
+# Characters that make a pattern more than a plain name
+_WILDCARDS = re.compile(r"[*?\[]")
+
+
+def _translate(pattern: str) -> str:
+    """Translate a glob pattern into a regular expression."""
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[" and "]" in pattern[index + 2 :]:
+            end = pattern.index("]", index + 2)
+            members = pattern[index + 1 : end]
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            members = members.replace("\\", "\\\\")
+            parts.append(f"[{members}]")
+            index = end
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return "".join(parts)
+
+
+def _compile(rules: List[str]) -> Optional["re.Pattern[str]"]:
+    """Combine alternatives into one expression, if there are any."""
+    return re.compile("|".join(rules), re.DOTALL) if rules else None
+
+
+def _load_nested(config_path: str) -> PatternMatcher:
+    """Load a nested configuration file, ignoring it if it is unreadable."""
+    try:
+        with open(config_path, encoding=ENCODING) as open_conf_file:
+            return PatternMatcher(open_conf_file.read().splitlines())
+    except (OSError, UnicodeDecodeError):
+        return PatternMatcher([])
+
+
+def load_config(config_path: Path) -> PatternMatcher:
+    """Load the unwanted patterns from the configuration file."""
     try:
         with config_path.open() as open_conf_file:
             config_data = open_conf_file.read().splitlines()
-        return set(config_data)
+        return PatternMatcher(config_data)
     except FileNotFoundError:
         print(f"Removal list not found: {config_path}")
         print("Please make sure the removal list exists and try again.")
         sys.exit(1)
 
 
-def find_unwanted_items(dir_path: Path, unwanted_paths: set) -> list:
-    """Find the unwanted items in the directory."""
-    unwanted_items = []
-    for item in dir_path.rglob("*"):
-        if item.name in unwanted_paths:
-            unwanted_items.append(item)
-    return unwanted_items
+class ScanIndex:
+    """Directory listings from earlier runs, keyed by directory mtime.
+
+    A directory's modification time changes whenever an entry is added to,
+    removed from or renamed in it, so a directory whose mtime matches the
+    index does not need to be listed again. Directories modified within
+    RACY_WINDOW_NS of being listed are recorded as untrusted, because a
+    later change could leave their mtime unchanged.
+    """
+
+    def __init__(self, path: Path, digest: str, trusted: bool = True) -> None:
+        self.path = path
+        self.digest = digest
+        self.trusted = trusted
+        self.cached: Dict[str, list] = {}
+        self.fresh: Dict[str, list] = {}
+        self._started = time.time_ns()
+
+    @classmethod
+    def load(cls, path: Path, matcher: PatternMatcher) -> "ScanIndex":
+        """Load an index, starting afresh if it is missing or outdated."""
+        index = cls(path, matcher.digest)
+        try:
+            with path.open(encoding=ENCODING) as index_file:
+                state = json.load(index_file)
+        except (OSError, ValueError):
+            return index
+        if state.get("version") == INDEX_VERSION and state.get("patterns") == (
+            index.digest
+        ):
+            index.cached = state["dirs"]
+        return index
+
+    def lookup(self, rel_dir: str, mtime_ns: int) -> Optional[list]:
+        """Return the cached listing of a directory.
+
+        Returns:
+            The matches, the subdirectories, whether the directory has a
+            nested configuration file, and the digest of the patterns the
+            listing was made with; or None if it must be listed again.
+        """
+        entry = self.cached.get(rel_dir)
+        if not self.trusted or entry is None or entry[0] != mtime_ns:
+            return None
+        return entry[1:]
+
+    def record(self, rel_dir: str, mtime_ns: int, listing: list) -> None:
+        """Record the listing of a directory for the next run."""
+        if mtime_ns >= self._started - RACY_WINDOW_NS:
+            mtime_ns = -1
+        self.fresh[rel_dir] = [mtime_ns, *listing]
+
+    def stale(self) -> List[str]:
+        """Directories whose cached listing is wrong despite their mtime."""
+        return sorted(
+            rel_dir
+            for rel_dir, entry in self.fresh.items()
+            if rel_dir in self.cached
+            and self.cached[rel_dir][0] == entry[0]
+            and self.cached[rel_dir][1:] != entry[1:]
+        )
+
+    def save(self) -> None:
+        """Atomically write the listings recorded during this run."""
+        state = {
+            "version": INDEX_VERSION,
+            "patterns": self.digest,
+            "dirs": self.fresh,
+        }
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with temp_path.open("w", encoding=ENCODING) as index_file:
+            json.dump(state, index_file, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+
+# Patterns in effect in a directory: each matcher with the length of the
+# relative path prefix of the directory its configuration file is in
+_Layers = Tuple[Tuple[PatternMatcher, int], ...]
+
+
+def _scan(path: str) -> List[Tuple[str, bool]]:
+    """List the names in a folder and whether they are directories."""
+    with os.scandir(path) as entries:
+        return [
+            (entry.name, entry.is_dir(follow_symlinks=False))
+            for entry in entries
+        ]
+
+
+def _list_dir(
+    entries: List[Tuple[str, bool]], prefix: str, layers: _Layers
+) -> Tuple[List[List[str]], List[str]]:
+    """Split a folder into matched entries and the other subdirectories."""
+    matches = []
+    subdirs = []
+    for name, is_dir in entries:
+        rel_path = prefix + name
+        pattern = None
+        # Deeper configuration files take precedence
+        for matcher, offset in reversed(layers):
+            pattern = matcher.decide(rel_path[offset:], is_dir)
+            if pattern is not None:
+                break
+        if pattern is not None and not pattern.startswith("!"):
+            matches.append([name, pattern])
+        elif is_dir:
+            subdirs.append(name)
+    return matches, subdirs
+
+
+def find_unwanted_matches(
+    dir_path: Path,
+    unwanted_paths: Union[PatternMatcher, Iterable[str]],
+    index: Optional[ScanIndex] = None,
+    config_name: Optional[str] = None,
+) -> Iterator[Tuple[Path, str]]:
+    """Find the unwanted items in the directory and the patterns they match.
+
+    The tree is walked iteratively with os.scandir, using the type
+    information of each entry instead of stat calls. Matched directories
+    are not descended into, as everything in them is removed anyway.
+
+    Args:
+        dir_path: The directory to search.
+        unwanted_paths: The compiled patterns, or the patterns themselves.
+        index: Listings from earlier runs. Directories whose mtime has not
+            changed are not listed again, and every listing is recorded
+            in the index. Save it once the walk is complete.
+        config_name: The name of nested configuration files. Their
+            patterns apply below the folder they are in, relative to it,
+            and take precedence over the patterns of enclosing folders.
+
+    Yields:
+        The unwanted files and directories, with the pattern that matched.
+    """
+    matcher = unwanted_paths
+    if not isinstance(matcher, PatternMatcher):
+        matcher = PatternMatcher(matcher)
+    # Directories still to scan, with their path relative to dir_path and
+    # the patterns in effect there
+    pending = [(os.fspath(dir_path), "", ((matcher, 0),), matcher.digest)]
+    while pending:
+        path, prefix, *scope = pending.pop()
+        try:
+            matches, subdirs, scope = _read_dir(
+                path, prefix, scope, index, config_name
+            )
+        except (FileNotFoundError, PermissionError, NotADirectoryError):
+            continue
+        for name, pattern in matches:
+            yield Path(path, name), pattern
+        for name in subdirs:
+            pending.append(
+                (os.path.join(path, name), f"{prefix}{name}/", *scope)
+            )
+
+
+def _read_dir(
+    path: str,
+    prefix: str,
+    scope: List[Any],
+    index: Optional[ScanIndex],
+    config_name: Optional[str],
+) -> Tuple[List[List[str]], List[str], List[Any]]:
+    """List a folder, from the index if it has not changed.
+
+    Args:
+        path: The folder to list.
+        prefix: Its path relative to the root, with a trailing '/'.
+        scope: The patterns in effect, and a digest of them.
+        index: Listings from earlier runs, if any.
+        config_name: The name of nested configuration files, if any.
+
+    Returns:
+        The matches, the other subdirectories and the patterns in effect
+        in the subdirectories.
+    """
+    layers, digest = scope
+    cached = entries = None
+    if index is not None:
+        # Read the mtime first, so changes made while listing make the
+        # next run list the directory again
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = index.lookup(prefix[:-1], mtime_ns)
+    if cached is not None:
+        has_config = cached[2]
+    else:
+        entries = _scan(path)
+        has_config = bool(prefix) and (config_name, False) in entries
+    if has_config:
+        nested = _load_nested(os.path.join(path, config_name))
+        layers += ((nested, len(prefix)),)
+        digest = hashlib.sha256(
+            f"{digest}:{len(prefix)}:{nested.digest}".encode()
+        ).hexdigest()
+    if cached is not None and cached[3] == digest:
+        matches, subdirs = cached[0], cached[1]
+    else:
+        matches, subdirs = _list_dir(
+            _scan(path) if entries is None else entries, prefix, layers
+        )
+    if index is not None:
+        index.record(
+            prefix[:-1], mtime_ns, [matches, subdirs, has_config, digest]
+        )
+    return matches, subdirs, [layers, digest]
+
+
+def find_unwanted_items(
+    dir_path: Path,
+    unwanted_paths: Union[PatternMatcher, Iterable[str]],
+    index: Optional[ScanIndex] = None,
+    config_name: Optional[str] = None,
+) -> Iterator[Path]:
+    """Find the unwanted items in the directory.
+
+    Args:
+        dir_path: The directory to search.
+        unwanted_paths: The compiled patterns, or the patterns themselves.
+        index: Listings from earlier runs, see find_unwanted_matches.
+        config_name: The name of nested configuration files.
+
+    Yields:
+        The unwanted files and directories.
+    """
+    for path, _ in find_unwanted_matches(
+        dir_path, unwanted_paths, index, config_name
+    ):
+        yield path
+
+
+class CleanRoot(NamedTuple):
+    """A directory to clean, with its patterns and scan index."""
+
+    path: Path
+    matcher: PatternMatcher
+    index: Optional[ScanIndex] = None
+
+
+def discover_roots(
+    parent: Path, config_name: str = CONFIG_FILE
+) -> Iterator[Path]:
+    """Find the directories to clean below a parent directory.
+
+    Every directory with a configuration file is a root. The directories
+    below a root are not searched, as their configuration files cascade
+    from the root's.
+
+    Args:
+        parent: The directory to search.
+        config_name: The name of configuration files.
+
+    Yields:
+        The roots, in alphabetical order.
+    """
+    pending = [os.fspath(parent)]
+    while pending:
+        path = pending.pop()
+        try:
+            entries = _scan(path)
+        except OSError:
+            continue
+        if (config_name, False) in entries:
+            yield Path(path)
+            continue
+        pending.extend(
+            sorted(
+                (
+                    os.path.join(path, name)
+                    for name, is_dir in entries
+                    if is_dir
+                ),
+                reverse=True,
+            )
+        )
+
+
+def walk_roots(
+    roots: Iterable[CleanRoot],
+    jobs: int = 1,
+    config_name: Optional[str] = CONFIG_FILE,
+) -> Iterator[Tuple[Path, str]]:
+    """Find the unwanted items of many roots with a pool of threads.
+
+    Up to jobs roots are walked at a time. Their matches are passed on
+    through a bounded queue, so the walks only run so far ahead of the
+    consumer, which can be the removal or measuring pool.
+
+    Args:
+        roots: The directories to clean.
+        jobs: The number of threads walking roots in parallel.
+        config_name: The name of nested configuration files.
+
+    Yields:
+        The unwanted items of every root, with the pattern that matched.
+    """
+    if jobs < 1:
+        raise ValueError("jobs must be at least 1")
+    roots = list(roots)
+    if jobs == 1 or len(roots) <= 1:
+        for root in roots:
+            yield from find_unwanted_matches(
+                root.path, root.matcher, root.index, config_name
+            )
+        return
+
+    results: "queue.Queue[Optional[Tuple[Path, str]]]" = queue.Queue(
+        WALK_QUEUE_SIZE
+    )
+    stop = threading.Event()
+
+    def put(item: Optional[Tuple[Path, str]]) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def walk(root: CleanRoot) -> None:
+        try:
+            if stop.is_set():
+                return
+            for match in find_unwanted_matches(
+                root.path, root.matcher, root.index, config_name
+            ):
+                if not put(match):
+                    return
+        finally:
+            put(None)
+
+    with ThreadPoolExecutor(max_workers=min(jobs, len(roots))) as executor:
+        futures = [executor.submit(walk, root) for root in roots]
+        try:
+            remaining = len(futures)
+            while remaining:
+                match = results.get()
+                if match is None:
+                    remaining -= 1
+                else:
+                    yield match
+        finally:
+            stop.set()
+    for future in futures:
+        future.result()
+
+
+def disk_usage(path: str) -> Tuple[int, int]:
+    """Count the files under a path and their total size in bytes.
+
+    Symbolic links are counted as files and never followed, the same way
+    they are removed. Entries that vanish or cannot be read are skipped.
+
+    Args:
+        path: The file or directory to measure.
 
+    Returns:
+        The number of files and their apparent size in bytes.
+    """
+    try:
+        stat_result = os.lstat(path)
+    except OSError:
+        return 0, 0
+    if not stat.S_ISDIR(stat_result.st_mode):
+        return 1, stat_result.st_size
+    files = size = 0
+    pending = [path]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    try:
+                        size += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+                    files += 1
+        except OSError:
+            continue
+    return files, size
+
+
+class UnwantedItem(NamedTuple):
+    """An unwanted item and the space its removal would reclaim."""
+
+    path: Path
+    pattern: str
+    files: int
+    bytes: int
+
+
+def measure_unwanted_items(
+    matches: Iterable[Tuple[Path, str]], jobs: int = 1
+) -> Iterator[UnwantedItem]:
+    """Measure unwanted items with a pool of threads, in the order given.
+
+    At most a few items per thread are measured ahead of the one being
+    yielded, so matches are reported as the walk finds them and memory
+    use does not grow with the size of the tree.
+
+    Args:
+        matches: The unwanted items and the patterns they matched.
+        jobs: The number of threads measuring items in parallel.
+
+    Yields:
+        Each item with its file count and size.
+    """
+    if jobs < 1:
+        raise ValueError("jobs must be at least 1")
+    in_flight: Deque[Tuple[Path, str, "Future[Tuple[int, int]]"]] = deque()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for path, pattern in matches:
+            future = executor.submit(disk_usage, os.fspath(path))
+            in_flight.append((path, pattern, future))
+            if len(in_flight) >= jobs * MEASURE_AHEAD:
+                path, pattern, future = in_flight.popleft()
+                yield UnwantedItem(path, pattern, *future.result())
+        while in_flight:
+            path, pattern, future = in_flight.popleft()
+            yield UnwantedItem(path, pattern, *future.result())
+
+
+class SizeReport:
+    """Reclaimable space per pattern."""
+
+    def __init__(self) -> None:
+        # pattern -> [items, files, bytes]
+        self.patterns: Dict[str, List[int]] = {}
+
+    def add(self, item: UnwantedItem) -> None:
+        """Account for an unwanted item."""
+        totals = self.patterns.setdefault(item.pattern, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += item.files
+        totals[2] += item.bytes
+
+    @property
+    def bytes(self) -> int:
+        """The total reclaimable size."""
+        return sum(totals[2] for totals in self.patterns.values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The report as plain data, largest patterns first."""
+        patterns = sorted(
+            self.patterns.items(), key=lambda item: item[1][2], reverse=True
+        )
+        return {
+            "patterns": [
+                {
+                    "pattern": pattern,
+                    "items": items,
+                    "files": files,
+                    "bytes": size,
+                }
+                for pattern, (items, files, size) in patterns
+            ],
+            "items": sum(totals[0] for totals in self.patterns.values()),
+            "files": sum(totals[1] for totals in self.patterns.values()),
+            "bytes": self.bytes,
+        }
+
+    def __str__(self) -> str:
+        report = self.as_dict()
+        lines = ["Reclaimable space by pattern:"]
+        width = max(
+            (len(row["pattern"]) for row in report["patterns"]), default=0
+        )
+        for row in report["patterns"]:
+            lines.append(
+                f"  {row['pattern']:<{width}}  {format_size(row['bytes']):>10}"
+                f"  {row['items']} items, {row['files']} files"
+            )
+        lines.append(
+            f"Total: {format_size(report['bytes'])} in {report['items']} "
+            f"items and {report['files']} files."
+        )
+        return "\n".join(lines)
+
+
+class RemovalSummary:  # pylint: disable=too-few-public-methods
+    """Totals of a removal and the errors it ran into."""
+
+    def __init__(self) -> None:
+        self.items = 0
+        self.removed = 0
+        self.files = 0
+        self.dirs = 0
+        self.bytes = 0
+        self.errors: List[Tuple[str, OSError]] = []
+
+    def __str__(self) -> str:
+        return (
+            f"Freed {format_size(self.bytes)} in {self.files} files "
+            f"and {self.dirs} directories."
+        )
+
+
+class _DirNode:  # pylint: disable=too-few-public-methods
+    """A directory being removed, waiting for its contents to go."""
 
-def remove_unwanted_items(unwanted_items: list) -> None:
-    """Remove the unwanted items from the directory."""
+    __slots__ = ("path", "parent", "pending", "failed")
+
+    def __init__(self, path: str, parent: Optional["_DirNode"]) -> None:
+        self.path = path
+        self.parent = parent
+        # The scan of the directory itself holds one reference
+        self.pending = 1
+        self.failed = False
+
+
+class _Remover:
+    """Remove files and directory trees with a pool of threads.
+
+    Every directory is scanned by its own task, which removes the files in
+    it in batches and hands its subdirectories to further tasks. A
+    directory is removed once its last file and subdirectory are gone, so
+    large trees are removed bottom-up in parallel without any task
+    waiting on another.
+    """
+
+    def __init__(self, jobs: int) -> None:
+        self.summary = RemovalSummary()
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._outstanding = 0
+
+    def remove(self, path: str) -> None:
+        """Queue a file or directory for removal."""
+        with self._lock:
+            self.summary.items += 1
+        self._submit(self._remove_item, path)
+
+    def wait(self) -> RemovalSummary:
+        """Wait for every queued removal to finish."""
+        with self._idle:
+            while self._outstanding:
+                self._idle.wait()
+        self._executor.shutdown()
+        return self.summary
+
+    def _submit(self, func: Callable[..., None], *args: Any) -> None:
+        with self._lock:
+            self._outstanding += 1
+        self._executor.submit(self._run, func, *args)
+
+    def _run(self, func: Callable[..., None], *args: Any) -> None:
+        try:
+            func(*args)
+        finally:
+            with self._idle:
+                self._outstanding -= 1
+                if not self._outstanding:
+                    self._idle.notify_all()
+
+    def _error(self, path: str, exc: OSError) -> None:
+        with self._lock:
+            self.summary.errors.append((path, exc))
+
+    def _remove_item(self, path: str) -> None:
+        try:
+            stat_result = os.lstat(path)
+        except OSError as exc:
+            self._error(path, exc)
+            return
+        if stat.S_ISDIR(stat_result.st_mode):
+            self._scan_dir(_DirNode(path, None))
+        else:
+            self._unlink_batch(None, [(path, stat_result.st_size)])
+
+    def _scan_dir(self, node: _DirNode) -> None:
+        batch: List[Tuple[str, int]] = []
+        try:
+            with os.scandir(node.path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        self._hold(node)
+                        self._submit(
+                            self._scan_dir, _DirNode(entry.path, node)
+                        )
+                        continue
+                    try:
+                        size = entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        size = 0
+                    batch.append((entry.path, size))
+                    if len(batch) >= UNLINK_BATCH_SIZE:
+                        self._hold(node)
+                        self._submit(self._unlink_task, node, batch)
+                        batch = []
+        except OSError as exc:
+            self._error(node.path, exc)
+            node.failed = True
+        self._unlink_batch(node, batch)
+        self._release(node)
+
+    def _unlink_batch(
+        self, node: Optional[_DirNode], batch: List[Tuple[str, int]]
+    ) -> None:
+        files = freed = 0
+        for path, size in batch:
+            try:
+                os.unlink(path)
+            except OSError as exc:
+                self._error(path, exc)
+                if node is not None:
+                    node.failed = True
+                continue
+            files += 1
+            freed += size
+        with self._lock:
+            self.summary.files += files
+            self.summary.bytes += freed
+            if node is None:
+                # A file queued on its own
+                self.summary.removed += files
+
+    def _unlink_task(
+        self, node: _DirNode, batch: List[Tuple[str, int]]
+    ) -> None:
+        self._unlink_batch(node, batch)
+        self._release(node)
+
+    def _hold(self, node: _DirNode) -> None:
+        with self._lock:
+            node.pending += 1
+
+    def _release(self, node: Optional[_DirNode]) -> None:
+        """Drop a reference, removing directories whose contents are gone."""
+        while node is not None:
+            with self._lock:
+                node.pending -= 1
+                if node.pending:
+                    return
+            if not node.failed:
+                try:
+                    os.rmdir(node.path)
+                except OSError as exc:
+                    self._error(node.path, exc)
+                    node.failed = True
+                else:
+                    with self._lock:
+                        self.summary.dirs += 1
+                        if node.parent is None:
+                            self.summary.removed += 1
+            if node.failed and node.parent is not None:
+                node.parent.failed = True
+            node = node.parent
+
+
+def remove_unwanted_items(
+    unwanted_items: Iterable[Path], jobs: int = 1
+) -> RemovalSummary:
+    """Remove the unwanted items from the directory.
+
+    Args:
+        unwanted_items: The files and directories to remove.
+        jobs: The number of threads removing items in parallel.
+
+    Returns:
+        What was removed, and the errors that prevented removing the rest.
+    """
+    if jobs < 1:
+        raise ValueError("jobs must be at least 1")
+    remover = _Remover(jobs)
     for item in unwanted_items:
-        if item.is_file():
-            item.unlink()
-        elif item.is_dir():
-            shutil.rmtree(item)
+        remover.remove(os.fspath(item))
+    return remover.wait()
+
+
+def format_size(size: float) -> str:
+    """Format a number of bytes for humans."""
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+def _report(
+    matches: Iterable[Tuple[Path, str]],
+    args: argparse.Namespace,
+    roots: List[CleanRoot],
+) -> None:
+    """Stream the unwanted items with their sizes, then the totals."""
+    report = SizeReport()
+    for item in measure_unwanted_items(matches, jobs=args.jobs):
+        report.add(item)
+        if args.json:
+            print(json.dumps(item._replace(path=str(item.path))._asdict()))
+        elif not args.suppress:
+            print(f"{format_size(item.bytes):>10}  {item.path}")
+    _finish_indexes(
+        roots, args.verify_index, sys.stderr if args.json else sys.stdout
+    )
+    if args.json:
+        print(json.dumps({"summary": report.as_dict()}))
+    else:
+        print(report)
+
+
+def _announce(path: Path, quiet: bool) -> Path:
+    if not quiet:
+        print(f"Removing {path}")
+    return path
+
+
+def _root_paths(args: argparse.Namespace) -> List[Path]:
+    """The directories to clean, discovering them if asked to."""
+    if not args.discover:
+        return [Path(directory) for directory in args.directories]
+    return [
+        root
+        for parent in args.directories
+        for root in discover_roots(Path(parent))
+    ]
+
+
+def _open_root(path: Path, args: argparse.Namespace) -> CleanRoot:
+    """Load the patterns and the scan index of a directory to clean."""
+    matcher = load_config(path / CONFIG_FILE)
+    index = None
+    if args.index or args.rebuild_index or args.verify_index:
+        index = ScanIndex.load(path / (args.index or INDEX_FILE), matcher)
+        index.trusted = not (args.rebuild_index or args.verify_index)
+    return CleanRoot(path, matcher, index)
+
+
+def _finish_indexes(
+    roots: List[CleanRoot], verify: bool, stream: TextIO
+) -> None:
+    """Report stale entries if asked to, then save the indexes."""
+    for root in roots:
+        if root.index is None:
+            continue
+        if verify:
+            stale = root.index.stale()
+            print(
+                f"Index entries out of date in {root.path}: {len(stale)}",
+                file=stream,
+            )
+            for rel_dir in stale:
+                print(root.path / rel_dir, file=stream)
+        root.index.save()
+
+
+def _remove(
+    unwanted_items: Iterable[Path],
+    args: argparse.Namespace,
+    roots: List[CleanRoot],
+) -> None:
+    """Remove the unwanted items once confirmed, then report the totals."""
+    if not args.force and (
+        input("Do you want to remove these items? (y/N): ").lower() != "y"
+    ):
+        print("Operation cancelled.")
+        return
+    summary = remove_unwanted_items(unwanted_items, jobs=args.jobs)
+    if args.force:
+        _finish_indexes(roots, args.verify_index, sys.stdout)
+    print(f"Removed {summary.removed} of {summary.items} unwanted items.")
+    print(summary)
+    if summary.errors:
+        for path, exc in summary.errors:
+            print(f"Could not remove {path}: {exc.strerror or exc}")
+        sys.exit(1)
 
 
 def main():
     """Parse the command line arguments and run the cleanup process."""
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("directory", help="The directory to clean up.")
+    parser.add_argument(
+        "directories",
+        nargs="+",
+        metavar="directory",
+        help="The directories to clean up.",
+    )
+    parser.add_argument(
+        "-d",
+        "--discover",
+        action="store_true",
+        help=(
+            f"Clean every directory with a {CONFIG_FILE} file below the "
+            "given directories."
+        ),
+    )
     parser.add_argument(
         "-s",
         "--suppress",
@@ -80,27 +1060,85 @@ def main():
         action="store_true",
         help="Skip confirmation and remove unwanted items directly.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of threads walking and removing items in parallel.",
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help=(
+            "Report the unwanted items and the space they take up per "
+            "pattern as they are found, without removing anything."
+        ),
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help=(
+            "Write the dry-run report as JSON Lines: one object per item, "
+            "then a summary."
+        ),
+    )
+    parser.add_argument(
+        "-i",
+        "--index",
+        nargs="?",
+        const=INDEX_FILE,
+        default=None,
+        metavar="FILE",
+        help=(
+            "Only list directories changed since the last run, using an "
+            "index file in each directory "
+            f"(default: {INDEX_FILE})."
+        ),
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="List every directory and rewrite the index.",
+    )
+    parser.add_argument(
+        "--verify-index",
+        action="store_true",
+        help="List every directory and report index entries that are wrong.",
+    )
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
-    dir_path = Path(args.directory)
-    config_path = dir_path / ".clean_tree"
-    loaded_unwanted_items = load_config(config_path)
+    paths = _root_paths(args)
+    if not paths:
+        print(f"No {CONFIG_FILE} files found.")
+        return
+    if args.index and os.path.isabs(args.index) and len(paths) > 1:
+        parser.error("an absolute --index path needs a single directory")
+    roots = [_open_root(path, args) for path in paths]
 
-    unwanted_items = find_unwanted_items(dir_path, loaded_unwanted_items)
+    matches = walk_roots(roots, jobs=args.jobs)
 
-    if not args.suppress:
-        print("Unwanted items found:")
-        for item in unwanted_items:
-            print(item)
+    if args.dry_run or args.json:
+        _report(matches, args, roots)
+        return
 
-    if args.force or (
-        not args.force
-        and input("Do you want to remove these items? (y/N): ").lower() == "y"
-    ):
-        remove_unwanted_items(unwanted_items)
-        print(f"Removed {len(unwanted_items)} unwanted items.")
+    if args.force:
+        # Remove items as the walk finds them
+        unwanted_items: Iterable[Path] = (
+            _announce(path, args.suppress) for path, _ in matches
+        )
     else:
-        print("Operation cancelled.")
+        unwanted_items = [path for path, _ in matches]
+        _finish_indexes(roots, args.verify_index, sys.stdout)
+        if not args.suppress:
+            print("Unwanted items found:")
+            for item in unwanted_items:
+                print(item)
+
+    _remove(unwanted_items, args, roots)
 
 
 if __name__ == "__main__":
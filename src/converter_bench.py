@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark yaml_to_json and json_to_yaml on synthetic corpora."""
+# version: 0.1.0
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+# Requires: pyyaml
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import yaml
+
+import json_to_yaml
+import yaml_to_json
+from batch_convert import ConversionSummary
+from json_backend import HAS_ORJSON
+from yaml_backend import HAS_LIBYAML, safe_dumper
+
+# Define system encoding
+ENCODING: str = sys.getfilesystemencoding() or sys.getdefaultencoding()
+
+# Directions of conversion
+DIRECTIONS = ("yaml_to_json", "json_to_yaml")
+
+# Kinds of synthetic corpora: many small files, a few huge files, deeply
+# nested documents, and one multi-document stream
+CORPORA = ("small", "huge", "nested", "stream")
+
+# Nesting levels of the documents of the nested corpus, kept well below
+# the recursion limits of the pure Python YAML dumper and of orjson
+NESTED_DEPTH = 60
+
+
+class Corpus(NamedTuple):
+    """The same synthetic data written as YAML and as JSON.
+
+    The paths are directories, or files for a stream, which is converted
+    with convert_file instead of convert_directory.
+    """
+
+    name: str
+    yaml_path: str
+    json_path: str
+    yaml_bytes: int
+    json_bytes: int
+
+
+def _record(rng: random.Random, index: int) -> Dict[str, Any]:
+    """Return a record shaped like typical configuration or API data."""
+    return {
+        "id": index,
+        "name": f"item-{index}",
+        "active": rng.random() < 0.5,
+        "score": round(rng.random() * 100, 3),
+        "tags": rng.sample(["alpha", "beta", "gamma", "delta", "ünï"], 3),
+        "owner": {"email": f"user{rng.randrange(1000)}@example.com"},
+        "notes": None if index % 3 else "lorem ipsum " * rng.randrange(8),
+    }
+
+
+def _nested(depth: int) -> Any:
+    """Return a document whose objects and arrays nest depth times."""
+    value: Any = {"leaf": [1, "two", 3.0, True, None]}
+    for level in range(depth // 2):
+        value = {"level": level, "children": [value, level]}
+    return value
+
+
+def _documents(
+    name: str, scale: float, rng: random.Random
+) -> Iterator[List[Any]]:
+    """Yield the documents of each file of a corpus."""
+    if name == "small":
+        for index in range(int(2000 * scale)):
+            yield [[_record(rng, index * 4 + i) for i in range(4)]]
+    elif name == "huge":
+        for index in range(2):
+            count = int(10000 * scale)
+            yield [[_record(rng, index * count + i) for i in range(count)]]
+    elif name == "nested":
+        for _ in range(int(50 * scale)):
+            yield [[_nested(NESTED_DEPTH) for _ in range(10)]]
+    else:
+        yield [_record(rng, index) for index in range(int(20000 * scale))]
+
+
+def generate_corpus(name: str, directory: str, scale: float = 1.0) -> Corpus:
+    """Write a synthetic corpus as YAML and as JSON.
+
+    Args:
+        name: One of CORPORA.
+        directory: The directory to write the corpus in.
+        scale: The factor applied to the number of files or records.
+
+    Returns:
+        The paths and sizes of the corpus.
+    """
+    rng = random.Random(name)
+    yaml_dir = os.path.join(directory, name, "yaml")
+    json_dir = os.path.join(directory, name, "json")
+    os.makedirs(yaml_dir)
+    os.makedirs(json_dir)
+    dumper = safe_dumper()
+    stream = name == "stream"
+    sizes = [0, 0]
+    for index, documents in enumerate(_documents(name, scale, rng)):
+        base = "stream" if stream else f"{name}{index:05}"
+        yaml_file = os.path.join(yaml_dir, base + ".yaml")
+        json_file = os.path.join(
+            json_dir, base + (".jsonl" if stream else ".json")
+        )
+        with open(yaml_file, "w", encoding=ENCODING) as file:
+            yaml.dump_all(
+                documents, file, Dumper=dumper, explicit_start=stream
+            )
+        with open(json_file, "w", encoding=ENCODING) as file:
+            file.writelines(
+                json.dumps(document) + "\n" for document in documents
+            )
+        sizes[0] += os.path.getsize(yaml_file)
+        sizes[1] += os.path.getsize(json_file)
+    if stream:
+        yaml_dir, json_dir = yaml_file, json_file
+    return Corpus(name, yaml_dir, json_dir, sizes[0], sizes[1])
+
+
+def _peak_rss_mb(who: int) -> float:
+    """Return the peak RSS of this process or of its finished workers.
+
+    For RUSAGE_CHILDREN this is the peak of the largest worker, not the
+    sum over the pool, which may have used up to jobs times as much.
+    """
+    # Kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss * unit / 2**20, 1)
+
+
+def _run_case(
+    results: "multiprocessing.Queue[Dict[str, Any]]",
+    convert: Callable[..., Any],
+    paths: List[str],
+    options: Dict[str, Any],
+) -> None:
+    """Convert a corpus in a fresh process and report the metrics."""
+    start = time.perf_counter()
+    outcome = convert(*paths, **options)
+    elapsed = time.perf_counter() - start
+    if isinstance(outcome, ConversionSummary):
+        failed = len(outcome.errors)
+    else:
+        failed = int(not outcome)
+    results.put(
+        {
+            "elapsed": elapsed,
+            "failed": failed,
+            "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+            "worker_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+    )
+
+
+def _case_call(
+    case: Dict[str, Any], corpus: Corpus, target_dir: str
+) -> Tuple[Callable[..., Any], List[str], Dict[str, Any], int]:
+    """Pick the function, arguments and input size of a case."""
+    options: Dict[str, Any] = {"backend": case["yaml_backend"]}
+    if case["json_backend"] is not None:
+        options["json_backend"] = case["json_backend"]
+    streaming = corpus.name == "stream"
+    if case["direction"] == "yaml_to_json":
+        module: Any = yaml_to_json
+        source, size = corpus.yaml_path, corpus.yaml_bytes
+        options["lines"] = streaming
+        # Only compact output is written by the JSON backend being compared
+        options["compact"] = True
+    else:
+        module = json_to_yaml
+        source, size = corpus.json_path, corpus.json_bytes
+        options["stream"] = "documents" if streaming else None
+    if streaming:
+        extension = ".jsonl" if module is yaml_to_json else ".yaml"
+        target = os.path.join(target_dir, "stream" + extension)
+        return module.convert_file, [source, target], options, size
+    options["jobs"] = case["jobs"]
+    return module.convert_directory, [source, target_dir], options, size
+
+
+def _measure(
+    context: Any, case: Dict[str, Any], corpus: Corpus, target_dir: str
+) -> Dict[str, Any]:
+    """Run a case in a fresh process and return its metrics."""
+    convert, paths, options, size = _case_call(case, corpus, target_dir)
+    results = context.Queue()
+    process = context.Process(
+        target=_run_case, args=(results, convert, paths, options)
+    )
+    process.start()
+    metrics = results.get()
+    process.join()
+    shutil.rmtree(target_dir)
+    os.mkdir(target_dir)
+    metrics["bytes"] = size
+    metrics["mb_per_sec"] = size / 2**20 / metrics["elapsed"]
+    return metrics
+
+
+def run_benchmarks(
+    corpora: List[Corpus],
+    directions: List[str],
+    backends: List[List[str]],
+    jobs_settings: List[int],
+    target_dir: str,
+) -> List[Dict[str, Any]]:
+    """Convert every corpus with every combination of settings.
+
+    Each conversion runs in a fresh process, so its peak RSS is not
+    inflated by the ones before it. Streams converted to YAML are parsed
+    by the json module whatever the JSON backend, so they are converted
+    once, with no JSON backend recorded.
+
+    Args:
+        corpora: The generated corpora.
+        directions: The directions to convert in, from DIRECTIONS.
+        backends: The YAML backends and the JSON backends to use.
+        jobs_settings: The numbers of worker processes to use. A stream is
+            a single file, which is always converted by one process.
+        target_dir: An empty directory to write the output to.
+
+    Returns:
+        The metrics of each run.
+    """
+    context = multiprocessing.get_context()
+    cases = []
+    for settings in itertools.product(
+        corpora, directions, *backends, jobs_settings
+    ):
+        corpus, direction, yaml_backend, json_backend, jobs = settings
+        if corpus.name == "stream" and jobs != jobs_settings[0]:
+            continue
+        if corpus.name == "stream" and direction == "json_to_yaml":
+            if json_backend != backends[1][0]:
+                continue
+            json_backend = None
+        case = {
+            "corpus": corpus.name,
+            "direction": direction,
+            "yaml_backend": yaml_backend,
+            "json_backend": json_backend,
+            "jobs": 1 if corpus.name == "stream" else jobs,
+        }
+        case.update(_measure(context, case, corpus, target_dir))
+        cases.append(case)
+        print(
+            f"{corpus.name:<7} {direction:<13} yaml={yaml_backend:<6} "
+            f"json={json_backend or '-':<6} jobs={case['jobs']:>2} "
+            f"MB/s={case['mb_per_sec']:>7.2f} "
+            f"elapsed={case['elapsed']:>7.2f}s "
+            f"peak_rss={case['peak_rss_mb']:>6}MB "
+            f"worker_peak_rss={case['worker_peak_rss_mb']:>6}MB"
+            + (f" failed={case['failed']}" if case["failed"] else "")
+        )
+    return cases
+
+
+def _revision() -> Optional[str]:
+    """Return the git commit the benchmarked code is at, if known."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    """Parse command line arguments and run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--corpus",
+        choices=CORPORA,
+        nargs="+",
+        default=list(CORPORA),
+        help="Corpora to convert (default: all)",
+    )
+    parser.add_argument(
+        "--direction",
+        choices=DIRECTIONS,
+        nargs="+",
+        default=list(DIRECTIONS),
+        help="Directions to convert in (default: both)",
+    )
+    parser.add_argument(
+        "-s",
+        "--scale",
+        metavar="factor",
+        type=float,
+        default=1.0,
+        help="Factor applied to the size of each corpus (default: 1.0)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="count",
+        type=int,
+        nargs="+",
+        default=[1, 4],
+        help="Numbers of worker processes, 0 for one per CPU (default: 1 4)",
+    )
+    parser.add_argument(
+        "--yaml-backend",
+        choices=("c", "python"),
+        nargs="+",
+        default=["c", "python"] if HAS_LIBYAML else ["python"],
+        help="YAML backends to use (default: those available)",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=("orjson", "stdlib"),
+        nargs="+",
+        default=["orjson", "stdlib"] if HAS_ORJSON else ["stdlib"],
+        help="JSON backends to use (default: those available)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="json_file",
+        help="Save the results as JSON, to compare them across commits",
+    )
+    args = parser.parse_args()
+    if "c" in args.yaml_backend and not HAS_LIBYAML:
+        parser.error("PyYAML was built without libyaml")
+    if "orjson" in args.json_backend and not HAS_ORJSON:
+        parser.error("orjson is not installed")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpora = [
+            generate_corpus(name, work_dir, args.scale) for name in args.corpus
+        ]
+        target_dir = os.path.join(work_dir, "target")
+        os.mkdir(target_dir)
+        cases = run_benchmarks(
+            corpora,
+            args.direction,
+            [args.yaml_backend, args.json_backend],
+            args.jobs,
+            target_dir,
+        )
+
+    if args.output is not None:
+        results = {
+            "revision": _revision(),
+            "python": sys.version.split()[0],
+            "pyyaml": yaml.__version__,
+            "scale": args.scale,
+            "cases": cases,
+        }
+        with open(args.output, "w", encoding=ENCODING) as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
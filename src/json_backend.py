@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Read and write JSON with orjson when it is installed, or the json module.
+
+orjson parses and serializes several times faster than the standard
+library. By default values are written the way json.dumps writes them,
+with spaces after separators and non-ASCII characters escaped, which only
+the json module does. For compact or two-space indented output, with
+non-ASCII characters written as is, both backends produce the same text.
+orjson writes floats in exponent form differently ("1e100" instead of
+"1e+100") and NaN or infinity as null, so output holding an exponent or
+null is written again by the json module. So are values orjson cannot
+handle at all, such as integers beyond 64 bits or keys that are not
+strings, and invalid input, so errors read the same. Either way keys can
+be sorted and dates are written in ISO 8601.
+"""
+# version: 0.1.0
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+# Optional: orjson
+
+import argparse
+import datetime
+import json
+import re
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Backends to choose from: orjson if available, orjson, or the json module
+BACKENDS = ("auto", "orjson", "stdlib")
+
+# Whether orjson is installed
+HAS_ORJSON: bool = orjson is not None
+
+# How orjson writes exponents. Outside strings, JSON only has a digit
+# followed by "e" in numbers
+_EXPONENT = re.compile(rb"[0-9]e")
+
+# orjson is an extension module pylint cannot look into
+# pylint: disable=no-member
+
+
+def _use_orjson(backend: str) -> bool:
+    """Return whether a backend resolves to orjson."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown JSON backend: {backend}")
+    if backend == "orjson" and not HAS_ORJSON:
+        raise ValueError("orjson is not installed")
+    return HAS_ORJSON and backend != "stdlib"
+
+
+def _default(value: Any) -> str:
+    """Serialize the dates and times YAML timestamps are loaded as."""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable"
+    )
+
+
+def dumps(
+    value: Any,
+    *,
+    compact: bool = False,
+    indent: bool = False,
+    sort_keys: bool = False,
+    backend: str = "auto",
+) -> str:
+    """Serialize a value to JSON text.
+
+    Args:
+        value: The value to serialize.
+        compact: Whether to write everything on one line without spaces
+            and with non-ASCII characters as is.
+        indent: Whether to indent nested values by two spaces, with
+            non-ASCII characters as is.
+        sort_keys: Whether to sort the keys of objects.
+        backend: One of BACKENDS. Output that is neither compact nor
+            indented is always written by the json module.
+
+    Returns:
+        The JSON text.
+
+    Raises:
+        TypeError: The value cannot be serialized.
+        ValueError: The backend is unknown or not available, or both
+            compact and indent were asked for.
+    """
+    if compact and indent:
+        raise ValueError("compact output cannot be indented")
+    if not (compact or indent):
+        # Only the backend is checked, as orjson cannot write this format
+        _use_orjson(backend)
+        return json.dumps(value, sort_keys=sort_keys, default=_default)
+    if _use_orjson(backend):
+        option = orjson.OPT_INDENT_2 if indent else 0
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            text = orjson.dumps(value, option=option)
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            # A null may be NaN or infinity; strings looking like either
+            # are written again too, which is only slower
+            if b"null" not in text and not _EXPONENT.search(text):
+                return text.decode()
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        indent=2 if indent else None,
+        separators=(",", ": ") if indent else (",", ":"),
+        sort_keys=sort_keys,
+        default=_default,
+    )
+
+
+def loads(text: Union[str, bytes], backend: str = "auto") -> Any:
+    """Parse JSON text.
+
+    Args:
+        text: The JSON text.
+        backend: One of BACKENDS.
+
+    Returns:
+        The parsed value.
+
+    Raises:
+        json.JSONDecodeError: The text is not valid JSON.
+        ValueError: The backend is unknown or not available.
+    """
+    if _use_orjson(backend):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def add_json_backend_argument(parser: argparse.ArgumentParser) -> None:
+    """Add the option choosing the JSON backend."""
+    parser.add_argument(
+        "--json-backend",
+        choices=BACKENDS,
+        default="auto",
+        help=(
+            "JSON implementation: orjson when installed, orjson, or the "
+            "json module (default: auto)"
+        ),
+    )
+
+
+def check_json_backend(parser: argparse.ArgumentParser, backend: str) -> None:
+    """Exit with a usage error if a backend is not available."""
+    try:
+        _use_orjson(backend)
+    except ValueError as exc:
+        parser.error(str(exc))
@@ -1,57 +1,464 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Convert a JSON file to YAML"""
-# version: 0.2.0
+# version: 0.5.0
 # license: MIT
 # author: Anthony Pagan
 # repo: https://github.com/get-tony/pyutils
 # Requires: pyyaml
 
 import argparse
+import functools
 import json
 import os
+import re
 import sys
+from typing import Any, Iterator, Optional, TextIO, Tuple
 import yaml
 
+from batch_convert import (
+    ConversionError,
+    MANIFEST_FILE,
+    ConversionSummary,
+    Manifest,
+    Converter,
+    add_incremental_argument,
+    add_jobs_argument,
+    check_incremental,
+    convert_files,
+    convert_one,
+    open_source,
+    open_target,
+    report,
+)
+from json_backend import add_json_backend_argument, check_json_backend, loads
+from yaml_backend import (
+    add_backend_argument,
+    check_backend,
+    safe_dumper,
+)
 
 # Define system encoding
 ENCODING = sys.getfilesystemencoding() or sys.getdefaultencoding()
 
+# Ways to write a stream of records: one YAML sequence, or one document each
+STREAM_STYLES = ("sequence", "documents")
 
-def convert_file(source_path: str, target_path: str = None) -> None:
+# Extensions of JSON Lines files, whose every value is a record
+LINES_EXTENSIONS = (".jsonl", ".ndjson")
+
+# Amount of JSON read at a time, and buffer size of YAML being written
+READ_CHUNK_SIZE = 1 << 16
+WRITE_BUFFER_SIZE = 1 << 20
+
+# The manifest of incremental runs and the file it is saved through, which
+# are JSON files themselves when converting in place
+_MANIFEST_FILES = (MANIFEST_FILE, MANIFEST_FILE + ".tmp")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_SEPARATORS = frozenset(' \t\n\r,]}[{"')
+
+# A value cut off by the end of the buffer fails to decode within this
+# many characters of it, at the start of a token like the "Infinit" of
+# "-Infinity", unless it is cut off in a string
+_LONGEST_TOKEN = len("-Infinity")
+
+
+def _convert(
+    source_path: str,
+    target_path: Optional[str] = None,
+    backend: str = "auto",
+    json_backend: str = "auto",
+) -> Optional[str]:
     """Convert a JSON file to YAML.
 
     Args:
         source_path: The path to the source JSON file.
-        target_path: The path to the target YAML file, or None to print to stdout.
+        target_path: The path to the target YAML file, or None to return the YAML.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        json_backend: The JSON backend, see json_backend.BACKENDS.
 
     Returns:
-        None.
+        The YAML text if there is no target file, otherwise None.
+
+    Raises:
+        ConversionError: The file could not be read, parsed or written.
     """
     # Check if the source file exists
     if not os.path.exists(source_path):
-        print(f"ERROR: {source_path} not found")
-        return
+        raise ConversionError(f"{source_path} not found")
 
     # Load the JSON content
     try:
         with open(source_path, "r", encoding=ENCODING) as source_file:
-            source_content = json.load(source_file)
+            source_content = loads(source_file.read(), json_backend)
     except json.JSONDecodeError as exc:
-        print(f"ERROR: {source_path} is not valid JSON: {exc}")
-        return
+        raise ConversionError(
+            f"{source_path} is not valid JSON: {exc}"
+        ) from exc
+    except (OSError, UnicodeDecodeError) as exc:
+        raise ConversionError(
+            f"{source_path} could not be read: {exc}"
+        ) from exc
 
     # Convert the JSON to YAML
-    output = yaml.dump(source_content)
+    output = yaml.dump(source_content, Dumper=safe_dumper(backend))
 
     # Write to the target file or stdout
     if target_path is None:
-        print(output)
-    elif os.path.exists(target_path):
-        print(f"ERROR: {target_path} already exists")
-    else:
-        with open(target_path, "w", encoding=ENCODING) as target_file:
+        return output
+    try:
+        with open(target_path, "x", encoding=ENCODING) as target_file:
             target_file.write(output)
+    except FileExistsError as exc:
+        raise ConversionError(f"{target_path} already exists") from exc
+    except OSError as exc:
+        raise ConversionError(
+            f"{target_path} could not be written: {exc}"
+        ) from exc
+    return None
+
+
+class _RecordReader:  # pylint: disable=too-many-instance-attributes
+    """Parse JSON values from a file one at a time.
+
+    The file is read in chunks and each value is decoded from the buffer
+    with raw_decode. A value running past the end of the buffer is retried
+    after reading more, in chunks at least as large as what is buffered,
+    so huge values are still parsed in linear time. Errors anywhere else
+    are raised at once, with their position in the file.
+    """
+
+    def __init__(self, source_file: TextIO) -> None:
+        self._file = source_file
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        # Characters and lines read before the buffer, and where the last
+        # of those lines starts
+        self._offset = 0
+        self._lines = 0
+        self._line_start = 0
+
+    def _fill(self) -> bool:
+        """Read more of the file, returning False at its end."""
+        if self._eof:
+            return False
+        chunk = self._file.read(
+            max(READ_CHUNK_SIZE, len(self._buffer) - self._pos)
+        )
+        if not chunk:
+            # Positions in the buffer stay valid for the caller
+            self._eof = True
+            return False
+        newlines = self._buffer.count("\n", 0, self._pos)
+        if newlines:
+            self._lines += newlines
+            self._line_start = (
+                self._offset + self._buffer.rindex("\n", 0, self._pos) + 1
+            )
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _error(
+        self, message: str, pos: Optional[int] = None
+    ) -> json.JSONDecodeError:
+        """Build an error at a position of the buffer, as one of the file."""
+        pos = self._pos if pos is None else pos
+        error = json.JSONDecodeError(message, self._buffer, pos)
+        error.pos += self._offset
+        error.lineno += self._lines
+        if error.lineno == self._lines + 1:
+            error.colno = error.pos - self._line_start + 1
+        error.args = (
+            f"{message}: line {error.lineno} column {error.colno} "
+            f"(char {error.pos})",
+        )
+        return error
+
+    def _cut_off(self, pos: int) -> bool:
+        """Return whether the end of the buffer may be what stops a value."""
+        return len(self._buffer) - pos < _LONGEST_TOKEN
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, or '' at the end."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def value(self) -> Any:
+        """Parse the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as exc:
+                # An unterminated string is reported where it starts
+                if (
+                    self._cut_off(exc.pos)
+                    or exc.msg.startswith("Unterminated string")
+                ) and self._fill():
+                    continue
+                raise self._error(exc.msg, exc.pos) from None
+            # A number cut off by the end of the buffer, like "-1." of
+            # "-1.5", decodes to a shorter number, so the value is only
+            # complete if a separator follows it
+            if (
+                self._cut_off(end)
+                and (
+                    end == len(self._buffer)
+                    or self._buffer[end] not in _SEPARATORS
+                )
+                and self._fill()
+            ):
+                continue
+            self._pos = end
+            return value
+
+    def elements(self) -> Iterator[Any]:
+        """Parse the elements of an array, or a single other value."""
+        if self.peek() != "[":
+            yield self.value()
+        else:
+            self._pos += 1
+            if self.peek() == "]":
+                self._pos += 1
+            else:
+                while True:
+                    yield self.value()
+                    char = self.peek()
+                    if char not in ("]", ","):
+                        raise self._error("Expecting ',' delimiter")
+                    self._pos += 1
+                    if char == "]":
+                        break
+        if self.peek():
+            raise self._error("Extra data")
+
+    def values(self) -> Iterator[Any]:
+        """Parse every top-level value, as in JSON Lines."""
+        while self.peek():
+            yield self.value()
+
+
+def iter_json_records(
+    source_file: TextIO, lines: bool = False
+) -> Iterator[Any]:
+    """Parse the records of a JSON file one at a time.
+
+    Only the record being parsed is held in memory, however large the file.
+
+    Args:
+        source_file: The JSON file.
+        lines: Whether every top-level value is a record, as in JSON Lines.
+            Otherwise the records are the elements of a top-level array,
+            or the single value of a file holding something else.
+
+    Yields:
+        The records.
+
+    Raises:
+        json.JSONDecodeError: The file is not valid JSON.
+    """
+    reader = _RecordReader(source_file)
+    return reader.values() if lines else reader.elements()
+
+
+def _convert_stream(
+    source_path: str,
+    target_path: Optional[str] = None,
+    backend: str = "auto",
+    style: str = "sequence",
+) -> None:
+    """Convert a JSON array or JSON Lines file to YAML record by record.
+
+    Files with a JSON Lines extension are read as JSON Lines. Each record
+    is dumped and written through a buffered writer as soon as it is
+    parsed, so memory use is bounded by the largest record.
+
+    Args:
+        source_path: The path to the source JSON file.
+        target_path: The path to the target YAML file, or None to write the
+            records to stdout as they are converted.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        style: One of STREAM_STYLES: the items of a YAML sequence, or a
+            stream of YAML documents. A file holding a single value other
+            than an array is written as a single value either way.
+
+    Raises:
+        ConversionError: The file could not be read, parsed or written.
+            The records before the failing one are kept.
+    """
+    if style not in STREAM_STYLES:
+        raise ValueError(f"unknown stream style: {style}")
+    with open_source(source_path, ENCODING) as source_file:
+        if target_path is None:
+            _write_records(source_file, sys.stdout, backend, style)
+            return
+        with open_target(
+            target_path, ENCODING, WRITE_BUFFER_SIZE
+        ) as target_file:
+            _write_records(source_file, target_file, backend, style)
+
+
+def _write_records(
+    source_file: TextIO, target_file: TextIO, backend: str, style: str
+) -> None:
+    """Write every record of a JSON file as YAML."""
+    dumper = safe_dumper(backend)
+    lines = source_file.name.endswith(LINES_EXTENSIONS)
+    reader = _RecordReader(source_file)
+    empty = True
+    try:
+        # Only the records of an array or JSON Lines are written as the
+        # items of a sequence, a single other value as is
+        sequence = style == "sequence" and (lines or reader.peek() == "[")
+        for record in reader.values() if lines else reader.elements():
+            if sequence:
+                target_file.write(yaml.dump([record], Dumper=dumper))
+            else:
+                target_file.write(
+                    yaml.dump(
+                        record,
+                        Dumper=dumper,
+                        explicit_start=style == "documents",
+                    )
+                )
+            empty = False
+    except json.JSONDecodeError as exc:
+        raise ConversionError(
+            f"{source_file.name} is not valid JSON: {exc}"
+        ) from exc
+    except (OSError, UnicodeDecodeError) as exc:
+        raise ConversionError(
+            f"{source_file.name} could not be converted: {exc}"
+        ) from exc
+    if empty and sequence:
+        target_file.write("[]\n")
+
+
+def _converter(
+    backend: str, stream: Optional[str], json_backend: str
+) -> Converter:
+    """Pick the function converting one file.
+
+    Records of a stream are parsed by iter_json_records, with the json
+    module, as orjson cannot decode a value off the front of a buffer.
+    """
+    if stream is None:
+        return functools.partial(
+            _convert, backend=backend, json_backend=json_backend
+        )
+    return functools.partial(_convert_stream, backend=backend, style=stream)
+
+
+def convert_file(
+    source_path: str,
+    target_path: Optional[str] = None,
+    backend: str = "auto",
+    stream: Optional[str] = None,
+    json_backend: str = "auto",
+) -> bool:
+    """Convert a JSON file to YAML.
+
+    Args:
+        source_path: The path to the source JSON file.
+        target_path: The path to the target YAML file, or None to print to stdout.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        stream: Convert a large array or JSON Lines file record by record,
+            into one of STREAM_STYLES.
+        json_backend: The JSON backend, see json_backend.BACKENDS.
+
+    Returns:
+        Whether the file was converted.
+    """
+    return convert_one(
+        _converter(backend, stream, json_backend), source_path, target_path
+    )
+
+
+def _find_files(
+    source_dir: str, target_dir: Optional[str], extensions: Tuple[str, ...]
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """Find the JSON files in a directory and the YAML files to write."""
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            if file.endswith(extensions) and file not in _MANIFEST_FILES:
+                target_path = None
+                if target_dir is not None:
+                    target_path = os.path.join(
+                        target_dir, os.path.splitext(file)[0] + ".yaml"
+                    )
+                yield os.path.join(root, file), target_path
+
+
+def convert_directory(  # pylint: disable=too-many-arguments
+    source_dir: str,
+    target_dir: Optional[str] = None,
+    jobs: int = 1,
+    *,
+    backend: str = "auto",
+    stream: Optional[str] = None,
+    incremental: bool = False,
+    json_backend: str = "auto",
+) -> ConversionSummary:
+    """Convert all JSON files in a directory to YAML.
+
+    Dumping YAML is CPU bound, so with more than one job the files are
+    spread over a pool of processes. Errors and output are printed in the
+    order the files were found either way.
+
+    Args:
+        source_dir: The path to the source directory.
+        target_dir: The path to the target directory, or None to print to stdout.
+        jobs: The number of worker processes, or 0 for one per CPU.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        stream: Convert the files record by record, into one of
+            STREAM_STYLES. JSON Lines files are converted too.
+        incremental: Whether to only convert files changed since the last
+            incremental run, see batch_convert.Manifest. Needs a target
+            directory.
+        json_backend: The JSON backend, see json_backend.BACKENDS.
+
+    Returns:
+        The number of files converted and the errors of the others.
+    """
+    if stream is None:
+        extensions: Tuple[str, ...] = (".json",)
+    else:
+        extensions = (".json",) + LINES_EXTENSIONS
+        if target_dir is None:
+            # Records go straight to stdout, which workers would interleave
+            jobs = 1
+    return convert_files(
+        _converter(backend, stream, json_backend),
+        _find_files(source_dir, target_dir, extensions),
+        jobs,
+        (
+            _manifest(source_dir, target_dir, f"stream={stream}")
+            if incremental
+            else None
+        ),
+    )
+
+
+def _manifest(
+    source_dir: str, target_dir: Optional[str], options: str
+) -> Manifest:
+    """Load the manifest of incremental conversions into a directory."""
+    if target_dir is None:
+        raise ValueError("incremental conversion needs a target directory")
+    return Manifest.load(
+        os.path.join(target_dir, MANIFEST_FILE),
+        "json_to_yaml " + options,
+        source_dir,
+    )
 
 
 def main() -> None:
@@ -59,24 +466,62 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Convert JSON files to YAML")
     parser.add_argument(
         "source",
-        metavar="source_file",
+        metavar="source_file_or_dir",
         type=str,
-        help="the path to the source JSON file to convert",
+        help="the path to the source JSON file or directory to convert",
     )
     parser.add_argument(
         "target",
-        metavar="target_file",
+        metavar="target",
         type=str,
         nargs="?",
         default=None,
-        help="the path to the target YAML file to write (default: stdout)",
+        help="the path to the target YAML file or directory (default: stdout)",
+    )
+    add_backend_argument(parser)
+    add_json_backend_argument(parser)
+    add_jobs_argument(parser)
+    add_incremental_argument(parser)
+    parser.add_argument(
+        "--stream",
+        choices=STREAM_STYLES,
+        default=None,
+        help=(
+            "convert a large array or JSON Lines input record by record, "
+            "into a YAML sequence or a stream of YAML documents"
+        ),
     )
     args = parser.parse_args()
 
     source_path: str = args.source
-    target_path: str = args.target
+    target_path: Optional[str] = args.target
+    check_backend(parser, args.yaml_backend)
+    check_json_backend(parser, args.json_backend)
+    check_incremental(parser, args.incremental, source_path, target_path)
 
-    convert_file(source_path, target_path)
+    if os.path.isdir(source_path):
+        if target_path is not None and os.path.isfile(target_path):
+            parser.error("target must be a directory when source is one")
+        report(
+            convert_directory(
+                source_path,
+                target_path,
+                args.jobs,
+                backend=args.yaml_backend,
+                stream=args.stream,
+                incremental=args.incremental,
+                json_backend=args.json_backend,
+            ),
+            to_stdout=target_path is not None,
+        )
+    else:
+        convert_file(
+            source_path,
+            target_path,
+            args.yaml_backend,
+            args.stream,
+            args.json_backend,
+        )
 
 
 if __name__ == "__main__":
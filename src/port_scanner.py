@@ -1,70 +1,1153 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Port Scanner"""
-# version: 0.1.2
+# version: 0.2.0
 # license: MIT
 # author: Anthony Pagan
 # repo: https://github.com/get-tony/pyutils
+# pylint: disable=too-many-lines
 
 import asyncio
+import base64
+import contextlib
+import copy
+import csv
+import functools
+import hashlib
+import io
+import ipaddress
+import itertools
+import json
+import multiprocessing
+import os
+import queue
 import random
+import sys
+import time
+import zlib
 import argparse
-from typing import List
+from collections import OrderedDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+)
 
+# Define system encoding
+ENCODING: str = sys.getfilesystemencoding() or sys.getdefaultencoding()
 
-async def scanner(ip: str, port: int, timeout: float = 0.5) -> None:
+# Maximum number of connection attempts in flight at once
+DEFAULT_CONCURRENCY: int = 500
+
+# Number of hosts whose ports are interleaved while scanning
+DEFAULT_HOST_WINDOW: int = 256
+
+# Bounds for timeouts derived from measured round-trip times
+DEFAULT_MIN_TIMEOUT: float = 0.05
+DEFAULT_MAX_TIMEOUT: float = 3.0
+
+# Number of results buffered by ResultWriter before writing
+DEFAULT_BATCH_SIZE: int = 1000
+
+# Number of results a worker process sends to the parent at once
+SHARD_BATCH_SIZE: int = 256
+
+# Longest time a worker process holds on to a partial batch (seconds)
+SHARD_FLUSH_INTERVAL: float = 0.2
+
+# Seconds between checkpoint saves
+DEFAULT_CHECKPOINT_INTERVAL: float = 10.0
+
+# Banner grabbing defaults
+DEFAULT_BANNER_SIZE: int = 1024
+DEFAULT_BANNER_TIMEOUT: float = 2.0
+DEFAULT_BANNER_CONCURRENCY: int = 100
+
+# Port states
+OPEN: str = "open"
+CLOSED: str = "closed"
+FILTERED: str = "filtered"
+ERROR: str = "error"
+STATES: Tuple[str, ...] = (OPEN, CLOSED, FILTERED, ERROR)
+
+
+class RttEstimator:
+    """Derive a connect timeout from measured round-trip times.
+
+    Uses the smoothed RTT and RTT variance estimator from TCP (RFC 6298).
+    Until the first sample arrives the initial timeout is used.
+    """
+
+    __slots__ = ("initial", "min_timeout", "max_timeout", "srtt", "rttvar")
+
+    def __init__(
+        self,
+        initial: float = 0.5,
+        min_timeout: float = DEFAULT_MIN_TIMEOUT,
+        max_timeout: float = DEFAULT_MAX_TIMEOUT,
+    ) -> None:
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt: Optional[float] = None
+        self.rttvar: float = 0.0
+
+    def update(self, sample: float) -> None:
+        """Fold a round-trip time sample (in seconds) into the estimate."""
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+
+    @property
+    def timeout(self) -> float:
+        """The current connect timeout in seconds."""
+        if self.srtt is None:
+            return self.initial
+        timeout = self.srtt + 4 * self.rttvar
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+
+class ScanResult(NamedTuple):  # pylint: disable=too-few-public-methods
+    """The outcome of probing a single port."""
+
+    ip: str
+    port: int
+    state: str
+    latency: float
+    error: Optional[str] = None
+    banner: Optional[str] = None
+
+
+class ScanReport:
+    """Aggregate counts and open ports of a finished scan."""
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = dict.fromkeys(STATES, 0)
+        self.open: List[ScanResult] = []
+        self.elapsed: float = 0.0
+
+    def add(self, result: ScanResult) -> None:
+        """Account for a single result."""
+        self.counts[result.state] += 1
+        if result.state == OPEN:
+            self.open.append(result)
+
+    @property
+    def total(self) -> int:
+        """The number of probes made."""
+        return sum(self.counts.values())
+
+
+async def _connect(
+    ip: str,
+    port: int,
+    timeout: float,
+    rtt: Optional[RttEstimator],
+) -> Tuple[ScanResult, Optional[asyncio.StreamReader], Optional[Any]]:
+    """Probe a port, returning the open streams if the connect succeeds."""
+    loop = asyncio.get_running_loop()
+    if rtt is not None:
+        timeout = rtt.timeout
+    started = loop.time()
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip, port), timeout=timeout
+        )
+        latency = loop.time() - started
+        if rtt is not None:
+            rtt.update(latency)
+        return ScanResult(ip, port, OPEN, latency), reader, writer
+    except asyncio.TimeoutError:
+        result = ScanResult(ip, port, FILTERED, loop.time() - started)
+    except ConnectionRefusedError:
+        latency = loop.time() - started
+        if rtt is not None:
+            rtt.update(latency)
+        result = ScanResult(ip, port, CLOSED, latency)
+    except Exception as exc:  # pylint: disable=broad-except
+        result = ScanResult(ip, port, ERROR, loop.time() - started, str(exc))
+    return result, None, None
+
+
+async def _close(writer: asyncio.StreamWriter) -> None:
+    """Close a connection, ignoring errors from the peer."""
+    writer.close()
+    with contextlib.suppress(OSError):
+        await writer.wait_closed()
+
+
+async def scanner(
+    ip: str,
+    port: int,
+    timeout: float = 0.5,
+    rtt: Optional[RttEstimator] = None,
+) -> ScanResult:
     """Scan a single port asynchronously.
 
     Args:
         ip: The IP address to scan.
         port: The port number to scan.
         timeout: The timeout for each port scan.
+        rtt: The host's RTT estimator. When given, its timeout is used
+            instead of ``timeout`` and it is updated with the measured
+            connect time.
 
     Returns:
-        None.
+        The result of the probe.
+    """
+    result, _, writer = await _connect(ip, port, timeout, rtt)
+    if writer is not None:
+        await _close(writer)
+    return result
+
+
+async def grab_banner(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    size: int = DEFAULT_BANNER_SIZE,
+    timeout: float = DEFAULT_BANNER_TIMEOUT,
+) -> Optional[str]:
+    """Read what a service sends first, then close the connection.
+
+    Args:
+        reader: The connection's reader.
+        writer: The connection's writer.
+        size: The maximum number of bytes to read.
+        timeout: How long to wait for the service to send something.
+
+    Returns:
+        The banner, with undecodable bytes escaped, or None if the service
+        sent nothing.
     """
     try:
-        _, writer = await asyncio.wait_for(
-            asyncio.open_connection(ip, port), timeout=timeout
+        data = await asyncio.wait_for(reader.read(size), timeout=timeout)
+    except (asyncio.TimeoutError, OSError):
+        data = b""
+    finally:
+        await _close(writer)
+    return data.decode("utf-8", "backslashreplace") or None
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """Pace events to a steady rate.
+
+    Tokens refill at ``rate`` per second up to ``capacity``. Every call to
+    acquire() takes a token, waiting for it when the bucket is empty.
+    Waiters reserve tokens in advance, so they are served in order and the
+    rate holds however many coroutines share the bucket.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1.0, rate / 100) if capacity is None else capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """Take a token, waiting until one is available."""
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
         )
-        print(f"{ip}:{port} Connected")
-        writer.close()
-        await writer.wait_closed()
-    except asyncio.TimeoutError:
-        pass
-    except ConnectionRefusedError:
-        print(f"{ip}:{port} Connection refused")
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class _HostState:  # pylint: disable=too-few-public-methods
+    """In-flight bookkeeping for a single host."""
+
+    __slots__ = ("semaphore", "users", "rtt", "bucket")
+
+    def __init__(
+        self,
+        limit: int,
+        rtt: Optional[RttEstimator],
+        bucket: Optional[TokenBucket],
+    ) -> None:
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+        self.rtt = rtt
+        self.bucket = bucket
+
+
+class _HostTable:
+    """Per-host state, evicting the least recently used idle hosts."""
+
+    def __init__(
+        self,
+        limit: int,
+        max_hosts: int,
+        rtt_factory: Optional[Callable[[], RttEstimator]] = None,
+        bucket_factory: Optional[Callable[[], TokenBucket]] = None,
+    ) -> None:
+        self.limit = limit
+        self.max_hosts = max_hosts
+        self.rtt_factory = rtt_factory
+        self.bucket_factory = bucket_factory
+        self._hosts: "OrderedDict[str, _HostState]" = OrderedDict()
+
+    def acquire(self, ip: str) -> _HostState:
+        """Return the state for a host, creating it if needed."""
+        state = self._hosts.get(ip)
+        if state is None:
+            state = _HostState(
+                self.limit,
+                self.rtt_factory() if self.rtt_factory else None,
+                self.bucket_factory() if self.bucket_factory else None,
+            )
+            self._hosts[ip] = state
+            self._evict()
+        else:
+            self._hosts.move_to_end(ip)
+        state.users += 1
+        return state
+
+    def release(self, state: _HostState) -> None:
+        """Drop a reference taken by acquire()."""
+        state.users -= 1
+
+    def _evict(self) -> None:
+        """Forget idle hosts once the table grows past its size."""
+        if len(self._hosts) <= self.max_hosts:
+            return
+        for ip in list(self._hosts):
+            if len(self._hosts) <= self.max_hosts:
+                break
+            if self._hosts[ip].users == 0:
+                del self._hosts[ip]
+
+
+def parse_host_spec(spec: str) -> Iterable[str]:
+    """Parse a host specification into a lazy iterable of addresses.
+
+    Specifications can be a single address or hostname, a network in CIDR
+    notation (``10.0.0.0/16``, ``2001:db8::/120``), or an inclusive range
+    of addresses (``10.0.0.1-10.0.0.50`` or ``10.0.0.1-50``).
+
+    Args:
+        spec: The host specification.
+
+    Returns:
+        An iterable of addresses. Networks and ranges are not expanded
+        until iterated.
+
+    Raises:
+        ValueError: If the specification is not valid.
+    """
+    spec = spec.strip()
+    if not spec:
+        raise ValueError("empty host specification")
+    if "/" in spec:
+        network = ipaddress.ip_network(spec, strict=False)
+        return map(str, network.hosts())
+    if "-" in spec:
+        first, _, last = spec.partition("-")
+        try:
+            start = ipaddress.ip_address(first)
+        except ValueError:
+            # Hostnames may contain dashes
+            return [spec]
+        if start.version == 4 and last.isdigit():
+            last = first.rsplit(".", 1)[0] + "." + last
+        end = ipaddress.ip_address(last)
+        if end.version != start.version or end < start:
+            raise ValueError(f"invalid address range: {spec}")
+        return (
+            str(type(start)(value))
+            for value in range(int(start), int(end) + 1)
+        )
+    return [spec]
+
+
+def read_targets(path: str) -> Iterator[str]:
+    """Lazily read host specifications from a file.
+
+    Blank lines and lines starting with ``#`` are skipped. Each
+    specification is checked as it is read, without being expanded.
+
+    Args:
+        path: The path to the file.
+
+    Yields:
+        Host specifications.
+
+    Raises:
+        ValueError: If a specification is not valid. The message names the
+            file and line.
+    """
+    with open(path, "r", encoding=ENCODING) as target_file:
+        for number, line in enumerate(target_file, start=1):
+            line = line.split("#", 1)[0].strip()
+            if line:
+                try:
+                    parse_host_spec(line)
+                except ValueError as exc:
+                    raise ValueError(f"{path}:{number}: {exc}") from exc
+                yield line
+
+
+def expand_hosts(specs: Iterable[str]) -> Iterator[str]:
+    """Lazily expand host specifications into addresses.
+
+    Args:
+        specs: Host specifications, see parse_host_spec().
+
+    Yields:
+        Addresses and hostnames.
+    """
+    for spec in specs:
+        yield from parse_host_spec(spec)
+
+
+def parse_ports(specs: Iterable[str]) -> List[int]:
+    """Parse port specifications such as ``1-1024,8080``.
+
+    Args:
+        specs: Port numbers, inclusive ranges, or comma separated lists of
+            either.
+
+    Returns:
+        The port numbers in the order given, without duplicates.
+
+    Raises:
+        ValueError: If a port is not valid.
+    """
+    ports: Dict[int, None] = {}
+    for spec in specs:
+        for part in spec.split(","):
+            first, _, last = part.strip().partition("-")
+            start = int(first)
+            end = int(last) if last else start
+            if not 1 <= start <= end <= 65535:
+                raise ValueError(f"invalid port range: {part}")
+            ports.update(dict.fromkeys(range(start, end + 1)))
+    return list(ports)
+
+
+def iter_targets(  # pylint: disable=too-many-arguments,too-many-locals
+    ips: Iterable[str],
+    ports: Sequence[int],
+    randomize: bool = False,
+    host_window: int = DEFAULT_HOST_WINDOW,
+    *,
+    seed: Optional[int] = None,
+    shard: int = 0,
+    shards: int = 1,
+) -> Iterator[Tuple[str, int]]:
+    """Lazily generate (ip, port) pairs to scan.
+
+    Hosts are consumed in windows of ``host_window`` and the ports of every
+    host in a window are interleaved, so per-host limits do not stall the
+    scan and only one window of hosts is held in memory at a time.
+
+    Args:
+        ips: The IP addresses to scan.
+        ports: The port numbers to scan.
+        randomize: Whether to randomize the order of port scans. The
+            targets of each host window are visited in a pseudo-random
+            permutation computed on the fly.
+        host_window: The number of hosts to interleave.
+        seed: The seed for randomizing. Generators with the same seed and
+            arguments produce the same order.
+        shard: The index of the shard to generate.
+        shards: The number of shards the targets are split into. Every
+            ``shards``-th target from ``shard`` onwards is generated.
+
+    Yields:
+        (ip, port) tuples.
+    """
+    rng = random.Random(seed)
+    ip_iter = iter(ips)
+    ports = list(ports)
+    offset = 0
+    while True:
+        window = list(itertools.islice(ip_iter, host_window))
+        if not window:
+            return
+        count = len(ports) * len(window)
+        size, permute = (
+            _permutation(count, rng) if randomize else (count, None)
+        )
+        for position in range((shard - offset) % shards, size, shards):
+            index = permute(position) if permute else position
+            if index < count:
+                port_index, ip_index = divmod(index, len(window))
+                yield window[ip_index], ports[port_index]
+        offset += size
+
+
+def _permutation(
+    count: int, rng: random.Random
+) -> Tuple[int, Callable[[int], int]]:
+    """Build a pseudo-random permutation that needs no memory per item.
+
+    Returns the smallest power of two ``size`` covering ``count`` and a
+    keyed bijection on ``range(size)``. Mapping ``range(size)`` and
+    skipping values of ``count`` or more visits every index below
+    ``count`` exactly once, in random order.
+    """
+    bits = max(1, (count - 1).bit_length())
+    size = 1 << bits
+    mask = size - 1
+    shift = max(1, bits // 2)
+    rounds = [(rng.randrange(size), rng.randrange(size) | 1) for _ in range(3)]
+
+    def permute(value: int) -> int:
+        # Each step (xor, odd multiply, xorshift) is invertible mod size
+        for key, multiplier in rounds:
+            value = ((value ^ key) * multiplier) & mask
+            value ^= value >> shift
+        return value
+
+    return size, permute
+
+
+async def scan_async(  # pylint: disable=too-many-arguments,too-many-locals,too-many-statements
+    targets: Iterable[Tuple[str, int]],
+    timeout: float = 0.5,
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    host_concurrency: Optional[int] = None,
+    adaptive: bool = False,
+    min_timeout: float = DEFAULT_MIN_TIMEOUT,
+    max_timeout: float = DEFAULT_MAX_TIMEOUT,
+    rate: Optional[float] = None,
+    host_rate: Optional[float] = None,
+    banners: bool = False,
+    banner_size: int = DEFAULT_BANNER_SIZE,
+    banner_timeout: float = DEFAULT_BANNER_TIMEOUT,
+    banner_concurrency: int = DEFAULT_BANNER_CONCURRENCY,
+) -> AsyncIterator[ScanResult]:
+    """Scan (ip, port) targets with a bounded pool of workers.
+
+    Targets are pulled lazily and results are yielded as they complete,
+    so memory use does not depend on how many targets there are.
+
+    Args:
+        targets: The (ip, port) pairs to scan.
+        timeout: The timeout for each port scan.
+        concurrency: The maximum number of connections in flight.
+        host_concurrency: The maximum number of connections in flight to a
+            single host (default: no per-host limit).
+        adaptive: Whether to derive each host's timeout from its measured
+            round-trip times, starting from ``timeout``.
+        min_timeout: The lower bound for adaptive timeouts.
+        max_timeout: The upper bound for adaptive timeouts.
+        rate: The maximum number of connections started per second
+            (default: no limit).
+        host_rate: The maximum number of connections started per second
+            to a single host (default: no limit).
+        banners: Whether to read a banner from open ports. Open
+            connections are handed to a separate pool of readers, so slow
+            services do not hold up the scan.
+        banner_size: The maximum number of bytes to read for a banner.
+        banner_timeout: How long to wait for a banner.
+        banner_concurrency: The maximum number of banners read at once.
+
+    Yields:
+        The result of each probe, in completion order.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    if host_concurrency is not None and host_concurrency < 1:
+        raise ValueError("host_concurrency must be at least 1")
+    if banner_concurrency < 1:
+        raise ValueError("banner_concurrency must be at least 1")
+
+    rtt_factory = None
+    if adaptive:
+        rtt_factory = functools.partial(
+            RttEstimator, timeout, min_timeout, max_timeout
+        )
+    hosts = _HostTable(
+        host_concurrency or concurrency,
+        max_hosts=max(concurrency, DEFAULT_HOST_WINDOW) * 2,
+        rtt_factory=rtt_factory,
+        bucket_factory=(
+            functools.partial(TokenBucket, host_rate) if host_rate else None
+        ),
+    )
+    bucket = TokenBucket(rate) if rate else None
+    target_iter = iter(targets)
+    results: "asyncio.Queue[Optional[ScanResult]]" = asyncio.Queue(concurrency)
+    handoff: "asyncio.Queue[Optional[Tuple[ScanResult, Any, Any]]]" = (
+        asyncio.Queue(banner_concurrency)
+    )
+
+    async def worker() -> None:
+        for ip, port in target_iter:
+            state = hosts.acquire(ip)
+            reader = writer = None
+            try:
+                async with state.semaphore:
+                    if state.bucket is not None:
+                        await state.bucket.acquire()
+                    if bucket is not None:
+                        await bucket.acquire()
+                    if banners:
+                        result, reader, writer = await _connect(
+                            ip, port, timeout, state.rtt
+                        )
+                    else:
+                        result = await scanner(
+                            ip, port, timeout=timeout, rtt=state.rtt
+                        )
+            finally:
+                hosts.release(state)
+            if writer is not None:
+                await handoff.put((result, reader, writer))
+            else:
+                await results.put(result)
+
+    async def banner_worker() -> None:
+        while (item := await handoff.get()) is not None:
+            result, reader, writer = item
+            banner = await grab_banner(
+                reader, writer, banner_size, banner_timeout
+            )
+            await results.put(result._replace(banner=banner))
+
+    async def produce() -> None:
+        readers = []
+        if banners:
+            readers = [
+                asyncio.ensure_future(banner_worker())
+                for _ in range(banner_concurrency)
+            ]
+        try:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            for _ in readers:
+                await handoff.put(None)
+            await asyncio.gather(*readers)
+        except Exception:
+            await results.put(None)
+            raise
+        finally:
+            for reader_task in readers:
+                reader_task.cancel()
+        await results.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while (result := await results.get()) is not None:
+            yield result
+        await producer
+    finally:
+        producer.cancel()
+
+
+async def collect(
+    results: AsyncIterator[ScanResult],
+    sink: Optional[Callable[[ScanResult], None]] = None,
+) -> ScanReport:
+    """Aggregate a stream of results, passing each one to a sink.
+
+    Args:
+        results: The results to aggregate.
+        sink: A callable that receives every result.
+
+    Returns:
+        The aggregated report.
+    """
+    report = ScanReport()
+    started = time.monotonic()
+    async for result in results:
+        report.add(result)
+        if sink is not None:
+            sink(result)
+    report.elapsed = time.monotonic() - started
+    return report
+
+
+class Checkpoint:  # pylint: disable=too-many-instance-attributes
+    """Track which ports of each host have been scanned.
+
+    Partly scanned hosts keep a bitmap indexed by port number; hosts with
+    every port scanned are only remembered by address. save() writes the
+    state atomically, compressing the bitmaps, so an interrupted scan can
+    be resumed by loading the file and skipping finished targets.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ports: Sequence[int],
+        interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        self.ports_digest = hashlib.sha256(
+            ",".join(map(str, sorted(set(ports)))).encode()
+        ).hexdigest()
+        self.port_count = len(set(ports))
+        self.complete: Set[str] = set()
+        self.partial: Dict[str, bytearray] = {}
+        self.counts: Dict[str, int] = {}
+        self.saved = time.monotonic()
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        ports: Sequence[int],
+        interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    ) -> "Checkpoint":
+        """Load a checkpoint, or start a new one if the file is missing.
+
+        Raises:
+            ValueError: If the checkpoint was made with different ports.
+        """
+        checkpoint = cls(path, ports, interval)
+        try:
+            with open(path, "r", encoding=ENCODING) as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return checkpoint
+        if state["ports"] != checkpoint.ports_digest:
+            raise ValueError(f"{path} was made with a different port list")
+        checkpoint.complete = set(state["complete"])
+        for ip, packed in state["partial"].items():
+            bitmap = bytearray(zlib.decompress(base64.b64decode(packed)))
+            checkpoint.partial[ip] = bitmap
+            checkpoint.counts[ip] = int.from_bytes(bitmap, "big").bit_count()
+        return checkpoint
+
+    def is_done(self, ip: str, port: int) -> bool:
+        """Whether a target has already been scanned."""
+        if ip in self.complete:
+            return True
+        bitmap = self.partial.get(ip)
+        return bitmap is not None and bool(bitmap[port >> 3] & 1 << (port & 7))
+
+    def mark(self, ip: str, port: int) -> None:
+        """Record that a target has been scanned."""
+        if ip in self.complete:
+            return
+        bitmap = self.partial.get(ip)
+        if bitmap is None:
+            bitmap = self.partial[ip] = bytearray(8192)
+            self.counts[ip] = 0
+        if bitmap[port >> 3] & 1 << (port & 7):
+            return
+        bitmap[port >> 3] |= 1 << (port & 7)
+        self.counts[ip] += 1
+        if self.counts[ip] >= self.port_count:
+            self.complete.add(ip)
+            del self.partial[ip]
+            del self.counts[ip]
+
+    @property
+    def due(self) -> bool:
+        """Whether the checkpoint interval has passed since the last save."""
+        return time.monotonic() - self.saved >= self.interval
+
+    def save(self) -> None:
+        """Atomically write the checkpoint file."""
+        state = {
+            "ports": self.ports_digest,
+            "complete": sorted(self.complete),
+            "partial": {
+                ip: base64.b64encode(zlib.compress(bitmap)).decode("ascii")
+                for ip, bitmap in self.partial.items()
+            },
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding=ENCODING) as checkpoint_file:
+            json.dump(state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.path)
+        self.saved = time.monotonic()
+
+
+def _record(
+    sink: Optional[Callable[[ScanResult], None]], checkpoint: Checkpoint
+) -> Callable[[ScanResult], None]:
+    """Wrap a sink so that every result is marked in the checkpoint.
+
+    Sinks with a flush() method are flushed before each save, so their
+    output never lags behind the checkpoint.
+    """
+    flush = getattr(sink, "flush", None)
+
+    def record(result: ScanResult) -> None:
+        if sink is not None:
+            sink(result)
+        checkpoint.mark(result.ip, result.port)
+        if checkpoint.due:
+            if flush is not None:
+                flush()
+            checkpoint.save()
+
+    return record
+
+
+def _scan_shard(
+    messages: "multiprocessing.Queue[Tuple[str, Any]]",
+    shard: int,
+    shards: int,
+    job: Dict[str, Any],
+) -> None:
+    """Scan one shard of the targets and send the results to the parent."""
+
+    async def run() -> None:
+        targets = iter_targets(
+            expand_hosts(job["ips"]),
+            job["ports"],
+            randomize=job["randomize"],
+            seed=job["seed"],
+            shard=shard,
+            shards=shards,
+        )
+        if job["skip"] is not None:
+            targets = _unfinished(targets, job["skip"])
+        batch: List[ScanResult] = []
+        flushed = time.monotonic()
+        async for result in scan_async(
+            targets, timeout=job["timeout"], **job["options"]
+        ):
+            batch.append(result)
+            if (
+                len(batch) >= SHARD_BATCH_SIZE
+                or time.monotonic() - flushed >= SHARD_FLUSH_INTERVAL
+            ):
+                messages.put(("results", batch))
+                batch = []
+                flushed = time.monotonic()
+        if batch:
+            messages.put(("results", batch))
+
+    try:
+        asyncio.run(run())
     except Exception as exc:  # pylint: disable=broad-except
-        print(f"Error {ip}:{port} {exc}")
+        messages.put(("error", f"shard {shard}: {exc!r}"))
+    else:
+        messages.put(("done", shard))
+
+
+def _unfinished(
+    targets: Iterable[Tuple[str, int]], checkpoint: Checkpoint
+) -> Iterator[Tuple[str, int]]:
+    """Skip targets that the checkpoint has already recorded."""
+    for ip, port in targets:
+        if not checkpoint.is_done(ip, port):
+            yield ip, port
 
 
-def scan(
-    ips: List[str],
-    ports: List[int],
+def _receive(
+    messages: "multiprocessing.Queue[Tuple[str, Any]]",
+    processes: List[multiprocessing.Process],
+) -> Iterator[List[ScanResult]]:
+    """Yield batches of results from worker processes until all finish."""
+    running = len(processes)
+    while running:
+        try:
+            kind, payload = messages.get(timeout=1.0)
+        except queue.Empty as exc:
+            if any(process.exitcode for process in processes):
+                raise RuntimeError("scan worker exited unexpectedly") from exc
+            continue
+        if kind == "error":
+            raise RuntimeError(f"scan worker failed: {payload}")
+        if kind == "done":
+            running -= 1
+        else:
+            yield payload
+
+
+def _in_order(
+    batches: Iterable[List[ScanResult]],
+    expected: Iterator[Tuple[str, int]],
+) -> Iterator[ScanResult]:
+    """Reorder results arriving in completion order into target order."""
+    pending: Dict[Tuple[str, int], List[ScanResult]] = {}
+    next_target = next(expected, None)
+    for batch in batches:
+        for result in batch:
+            pending.setdefault((result.ip, result.port), []).append(result)
+        while next_target in pending:
+            waiting = pending[next_target]
+            yield waiting.pop(0)
+            if not waiting:
+                del pending[next_target]
+            next_target = next(expected, None)
+
+
+def _scan_sharded(
+    job: Dict[str, Any],
+    sink: Optional[Callable[[ScanResult], None]],
+    workers: int,
+) -> ScanReport:
+    """Scan with a pool of processes, merging results in target order."""
+    options = job["options"]
+    options["concurrency"] = (
+        options.get("concurrency", DEFAULT_CONCURRENCY) // workers
+    )
+    options["banner_concurrency"] = (
+        options.get("banner_concurrency", DEFAULT_BANNER_CONCURRENCY)
+        // workers
+    )
+    if options.get("host_concurrency"):
+        options["host_concurrency"] //= workers
+    # Every worker paces its own share, so together they keep to the caps
+    for key in ("rate", "host_rate"):
+        if options.get(key):
+            options[key] /= workers
+
+    context = multiprocessing.get_context()
+    messages = context.Queue()
+    processes = [
+        context.Process(
+            target=_scan_shard,
+            args=(messages, shard, workers, job),
+            daemon=True,
+        )
+        for shard in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    report = ScanReport()
+    started = time.monotonic()
+    expected = iter_targets(
+        expand_hosts(job["ips"]),
+        job["ports"],
+        randomize=job["randomize"],
+        seed=job["seed"],
+    )
+    if job["skip"] is not None:
+        expected = _unfinished(expected, job["skip"])
+    try:
+        for result in _in_order(_receive(messages, processes), expected):
+            report.add(result)
+            if sink is not None:
+                sink(result)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    report.elapsed = time.monotonic() - started
+    return report
+
+
+def scan(  # pylint: disable=too-many-arguments
+    ips: Iterable[str],
+    ports: Sequence[int],
     timeout: float = 0.5,
     randomize: bool = False,
-) -> None:
+    *,
+    sink: Optional[Callable[[ScanResult], None]] = None,
+    workers: int = 1,
+    checkpoint: Optional[Checkpoint] = None,
+    **options: Any,
+) -> ScanReport:
     """Scan a range of ports on a list of IP addresses.
 
     Args:
-        ips: The list of IP addresses to scan.
+        ips: The hosts to scan. Networks and address ranges are expanded
+            lazily, see parse_host_spec().
         ports: The list of port numbers to scan.
         timeout: The timeout for each port scan.
         randomize: Whether to randomize the order of port scans.
+        sink: A callable that receives every result as it completes.
+        workers: The number of processes to split the scan across, at
+            most the smallest concurrency limit. With more than one, the
+            limits are shared between the processes and results are passed
+            to ``sink`` in target order.
+        checkpoint: Records the progress of the scan. Targets it has
+            already recorded are skipped, and it is saved periodically and
+            when the scan ends or is interrupted.
+        options: Keyword arguments passed on to scan_async().
 
     Returns:
-        None.
+        The aggregated report.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    record = sink if checkpoint is None else _record(sink, checkpoint)
+    # Every process takes at least one slot of each concurrency limit, so
+    # there are never more processes than the smallest limit has slots
+    workers = min(
+        workers,
+        options.get("concurrency", DEFAULT_CONCURRENCY),
+        options.get("banner_concurrency", DEFAULT_BANNER_CONCURRENCY),
+        options.get("host_concurrency") or workers,
+    )
+    try:
+        if workers > 1:
+            job = {
+                "ips": list(ips),
+                "ports": list(ports),
+                "timeout": timeout,
+                "randomize": randomize,
+                "seed": random.randrange(2**32),
+                "options": options,
+                # A frozen copy, as the checkpoint changes during the scan
+                "skip": copy.deepcopy(checkpoint),
+            }
+            return _scan_sharded(job, record, workers)
+        targets = iter_targets(expand_hosts(ips), ports, randomize=randomize)
+        if checkpoint is not None:
+            targets = _unfinished(targets, checkpoint)
+        return asyncio.run(
+            collect(scan_async(targets, timeout=timeout, **options), record)
+        )
+    finally:
+        if checkpoint is not None:
+            flush = getattr(sink, "flush", None)
+            if flush is not None:
+                flush()
+            checkpoint.save()
+
+
+class ResultWriter:
+    """Write results to a stream in batches.
+
+    Formats:
+        text: One human readable line per open or closed port.
+        jsonl: One JSON object per result.
+        csv: A header row followed by one row per result.
     """
-    tasks = []
-    for ip in ips:
-        for port in ports:
-            tasks.append(scanner(ip, port, timeout=timeout))
 
-    if randomize:
-        random.shuffle(tasks)
+    FORMATS: Tuple[str, ...] = ("text", "jsonl", "csv")
+
+    def __init__(
+        self,
+        stream: TextIO,
+        output_format: str = "text",
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        header: bool = True,
+    ) -> None:
+        if output_format not in self.FORMATS:
+            raise ValueError(f"unknown output format: {output_format}")
+        self.stream = stream
+        self.output_format = output_format
+        self.batch_size = batch_size
+        self._buffer: List[str] = []
+        if output_format == "csv" and header:
+            self._buffer.append(",".join(ScanResult._fields) + "\n")
+
+    def __call__(self, result: ScanResult) -> None:
+        """Buffer a result, writing the batch once it is full."""
+        line = self._format(result)
+        if line:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.batch_size:
+                self.flush()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+        """Write out buffered results."""
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            self._buffer.clear()
+        self.stream.flush()
+
+    def _format(self, result: ScanResult) -> str:
+        """Format a result as a line of output."""
+        if self.output_format == "jsonl":
+            record = result._asdict()
+            record["latency"] = round(result.latency, 6)
+            return json.dumps(record) + "\n"
+        if self.output_format == "csv":
+            out = io.StringIO()
+            csv.writer(out, lineterminator="\n").writerow(
+                (
+                    *result[:3],
+                    round(result.latency, 6),
+                    result.error or "",
+                    result.banner or "",
+                )
+            )
+            return out.getvalue()
+        if result.state == OPEN:
+            banner = f" {result.banner.strip()!r}" if result.banner else ""
+            return f"{result.ip}:{result.port} Connected{banner}\n"
+        if result.state == CLOSED:
+            return f"{result.ip}:{result.port} Connection refused\n"
+        if result.state == ERROR:
+            return f"Error {result.ip}:{result.port} {result.error}\n"
+        return ""
+
+
+def add_timeout_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options setting fixed or adaptive timeouts."""
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        metavar="timeout",
+        type=float,
+        default=0.5,
+        help=(
+            "Timeout for each scan, or the initial timeout with --adaptive "
+            "(default: 0.5 seconds)"
+        ),
+    )
+    parser.add_argument(
+        "-a",
+        "--adaptive",
+        action="store_true",
+        help="Derive each host's timeout from its measured round-trip time",
+    )
+    parser.add_argument(
+        "--min-timeout",
+        metavar="timeout",
+        type=float,
+        default=DEFAULT_MIN_TIMEOUT,
+        help=(
+            "Lower bound for adaptive timeouts "
+            f"(default: {DEFAULT_MIN_TIMEOUT} seconds)"
+        ),
+    )
+    parser.add_argument(
+        "--max-timeout",
+        metavar="timeout",
+        type=float,
+        default=DEFAULT_MAX_TIMEOUT,
+        help=(
+            "Upper bound for adaptive timeouts "
+            f"(default: {DEFAULT_MAX_TIMEOUT} seconds)"
+        ),
+    )
+
 
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(asyncio.gather(*tasks))
+def add_output_argument(
+    parser: argparse.ArgumentParser, help_text: str
+) -> None:
+    """Add the option naming the file results are written to."""
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="file",
+        type=str,
+        default=None,
+        help=help_text,
+    )
 
 
 def main() -> None:
@@ -76,40 +1159,184 @@ def main() -> None:
         "ips",
         metavar="ip",
         type=str,
-        nargs="+",
-        help="IP addresses to scan",
+        nargs="*",
+        help=(
+            "IP addresses, hostnames, networks (10.0.0.0/24) or address "
+            "ranges (10.0.0.1-50) to scan"
+        ),
+    )
+    parser.add_argument(
+        "-i",
+        "--input-file",
+        metavar="file",
+        type=str,
+        default=None,
+        help="Read targets from a file, one per line",
     )
     parser.add_argument(
         "-p",
         "--ports",
         metavar="port",
-        type=int,
+        type=str,
         nargs="+",
-        default=list(range(1, 65536)),
-        help="ports to scan (default: all)",
+        default=["1-65535"],
+        help="ports or port ranges to scan, e.g. 1-1024,8080 (default: all)",
     )
+    add_timeout_arguments(parser)
     parser.add_argument(
-        "-t",
-        "--timeout",
+        "-r",
+        "--randomize",
+        action="store_true",
+        help="Randomize the order of port scans",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        metavar="count",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=(
+            "Maximum connections in flight "
+            f"(default: {DEFAULT_CONCURRENCY})"
+        ),
+    )
+    parser.add_argument(
+        "--host-concurrency",
+        metavar="count",
+        type=int,
+        default=None,
+        help="Maximum connections in flight per host (default: no limit)",
+    )
+    add_output_argument(parser, "Write results to a file (default: stdout)")
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=ResultWriter.FORMATS,
+        default="text",
+        help="Output format (default: text)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="count",
+        type=int,
+        default=1,
+        help=(
+            "Number of processes to split the scan across; results are "
+            "written in target order (default: 1)"
+        ),
+    )
+    parser.add_argument(
+        "--rate",
+        metavar="count",
+        type=float,
+        default=None,
+        help="Maximum connections started per second (default: no limit)",
+    )
+    parser.add_argument(
+        "--host-rate",
+        metavar="count",
+        type=float,
+        default=None,
+        help=(
+            "Maximum connections started per second per host "
+            "(default: no limit)"
+        ),
+    )
+    parser.add_argument(
+        "-b",
+        "--banners",
+        action="store_true",
+        help="Read the banner of open ports",
+    )
+    parser.add_argument(
+        "--banner-timeout",
         metavar="timeout",
         type=float,
-        default=0.5,
-        help="Timeout for each scan (default: 0.5 seconds)",
+        default=DEFAULT_BANNER_TIMEOUT,
+        help=(
+            "How long to wait for a banner "
+            f"(default: {DEFAULT_BANNER_TIMEOUT} seconds)"
+        ),
     )
     parser.add_argument(
-        "-r",
-        "--randomize",
+        "--checkpoint",
+        metavar="file",
+        type=str,
+        default=None,
+        help="Periodically save scan progress to a file",
+    )
+    parser.add_argument(
+        "--resume",
         action="store_true",
-        help="Randomize the order of port scans",
+        help="Skip targets already recorded in the --checkpoint file",
     )
     args = parser.parse_args()
 
-    ips: List[str] = args.ips
-    ports: List[int] = args.ports
+    if not args.ips and args.input_file is None:
+        parser.error("no targets given")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    try:
+        for spec in args.ips:
+            parse_host_spec(spec)
+        if args.input_file is not None:
+            # Check the whole file before the scan starts writing results
+            for _ in read_targets(args.input_file):
+                pass
+        ports: List[int] = parse_ports(args.ports)
+    except (OSError, ValueError) as exc:
+        parser.error(str(exc))
+
+    ips: Iterable[str] = args.ips
+    if args.input_file is not None:
+        ips = itertools.chain(ips, read_targets(args.input_file))
     timeout: float = args.timeout
     randomize: bool = args.randomize
 
-    scan(ips, ports, timeout=timeout, randomize=randomize)
+    checkpoint = None
+    if args.checkpoint is not None:
+        try:
+            checkpoint = (
+                Checkpoint.load(args.checkpoint, ports)
+                if args.resume
+                else Checkpoint(args.checkpoint, ports)
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
+
+    def run(stream: TextIO, header: bool = True) -> None:
+        with ResultWriter(stream, args.format, header=header) as writer:
+            scan(
+                ips,
+                ports,
+                timeout=timeout,
+                randomize=randomize,
+                sink=writer,
+                workers=args.workers,
+                checkpoint=checkpoint,
+                concurrency=args.concurrency,
+                host_concurrency=args.host_concurrency,
+                adaptive=args.adaptive,
+                min_timeout=args.min_timeout,
+                max_timeout=args.max_timeout,
+                rate=args.rate,
+                host_rate=args.host_rate,
+                banners=args.banners,
+                banner_timeout=args.banner_timeout,
+            )
+
+    if args.output is None:
+        run(sys.stdout)
+    else:
+        # Resumed scans add to the results of the interrupted run
+        with open(
+            args.output,
+            "a" if args.resume else "w",
+            encoding=ENCODING,
+            newline="",
+        ) as output_file:
+            run(output_file, header=output_file.tell() == 0)
 
 
 if __name__ == "__main__":
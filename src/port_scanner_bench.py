@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark port_scanner against a local mock target server."""
+
+# version: 0.1.0
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+from port_scanner import (
+    CLOSED,
+    FILTERED,
+    OPEN,
+    add_output_argument,
+    add_timeout_arguments,
+    scan,
+)
+
+# Define system encoding
+ENCODING: str = sys.getfilesystemencoding() or sys.getdefaultencoding()
+
+# Loopback address the mock targets listen on
+MOCK_HOST: str = "127.0.0.2"
+
+# Seconds between samples of the open file descriptor count
+FD_SAMPLE_INTERVAL: float = 0.05
+
+
+class MockTargetServer:  # pylint: disable=too-many-instance-attributes
+    """Serve open, filtered and closed ports on a loopback address.
+
+    Open ports accept connections (optionally sending a banner) from an
+    event loop in a background thread. Filtered ports are listening
+    sockets whose accept queue is kept full, so the kernel drops new
+    connection attempts and they time out just like a filtering firewall.
+    Every other port on the address refuses connections.
+    """
+
+    def __init__(
+        self,
+        open_count: int,
+        filtered_count: int,
+        host: str = MOCK_HOST,
+        banner: bytes = b"",
+    ) -> None:
+        self.host = host
+        self.banner = banner
+        self.open_count = open_count
+        self.filtered_count = filtered_count
+        self.open_ports: List[int] = []
+        self.filtered_ports: List[int] = []
+        self._sockets: List[socket.socket] = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever)
+
+    def __enter__(self) -> "MockTargetServer":
+        self._thread.start()
+        for _ in range(self.open_count):
+            server = asyncio.run_coroutine_threadsafe(
+                asyncio.start_server(self._handle, self.host, 0), self._loop
+            ).result()
+            self.open_ports.append(server.sockets[0].getsockname()[1])
+        for _ in range(self.filtered_count):
+            listener = socket.socket()
+            listener.bind((self.host, 0))
+            listener.listen(0)
+            # Fill the accept queue so further SYNs are dropped
+            filler = socket.create_connection(listener.getsockname())
+            self._sockets.extend((listener, filler))
+            self.filtered_ports.append(listener.getsockname()[1])
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        for sock in self._sockets:
+            sock.close()
+
+    def closed_ports(self, count: int) -> List[int]:
+        """Return ports on the address that refuse connections."""
+        used = set(self.open_ports) | set(self.filtered_ports)
+        candidates = (port for port in range(1, 65536) if port not in used)
+        return list(itertools.islice(candidates, count))
+
+    async def _handle(
+        self, _reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if self.banner:
+            writer.write(self.banner)
+            await writer.drain()
+        writer.close()
+
+
+def _open_fds() -> Optional[int]:
+    """Return the number of open file descriptors, where available."""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def _run_case(
+    results: "multiprocessing.Queue[Dict[str, Any]]",
+    ports: List[int],
+    options: Dict[str, Any],
+) -> None:
+    """Scan the mock server in a fresh process and report the metrics."""
+    baseline = _open_fds()
+    peak_fds = baseline
+    done = threading.Event()
+
+    def sample_fds() -> None:
+        nonlocal peak_fds
+        while not done.wait(FD_SAMPLE_INTERVAL):
+            peak_fds = max(peak_fds, _open_fds())
+
+    sampler = threading.Thread(target=sample_fds)
+    if baseline is not None:
+        sampler.start()
+    report = scan([MOCK_HOST], ports, **options)
+    done.set()
+    if baseline is not None:
+        sampler.join()
+        peak_fds = max(peak_fds, _open_fds())
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024
+    results.put(
+        {
+            "probes": report.total,
+            "open": report.counts[OPEN],
+            "closed": report.counts[CLOSED],
+            "filtered": report.counts[FILTERED],
+            "elapsed": report.elapsed,
+            "probes_per_sec": report.total / report.elapsed,
+            "peak_fds": None if baseline is None else peak_fds - baseline,
+            "peak_rss_mb": round(max_rss / 2**20, 1),
+        }
+    )
+
+
+def run_benchmarks(
+    port_counts: List[int],
+    concurrencies: List[int],
+    server: MockTargetServer,
+    options: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """Scan the mock server with every combination of settings.
+
+    Args:
+        port_counts: The numbers of ports to scan.
+        concurrencies: The concurrency settings to scan with.
+        server: The running mock server.
+        options: Keyword arguments passed on to scan().
+
+    Returns:
+        The metrics of each run.
+    """
+    context = multiprocessing.get_context()
+    cases = []
+    for port_count, concurrency in itertools.product(
+        port_counts, concurrencies
+    ):
+        ports = server.open_ports + server.filtered_ports
+        ports += server.closed_ports(max(0, port_count - len(ports)))
+        results = context.Queue()
+        case_options = dict(options, concurrency=concurrency)
+        process = context.Process(
+            target=_run_case, args=(results, ports, case_options)
+        )
+        process.start()
+        metrics = results.get()
+        process.join()
+        cases.append(
+            {"ports": len(ports), "concurrency": concurrency, **metrics}
+        )
+        print(
+            f"ports={len(ports):>6} concurrency={concurrency:>5} "
+            f"probes/s={metrics['probes_per_sec']:>9.0f} "
+            f"elapsed={metrics['elapsed']:>7.2f}s "
+            f"peak_rss={metrics['peak_rss_mb']:>6}MB "
+            f"peak_fds={metrics['peak_fds']}"
+        )
+    return cases
+
+
+def main() -> None:
+    """Parse command line arguments and run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    # Every combination of these settings is benchmarked
+    for flags, what, default in (
+        (("-p", "--ports"), "Numbers of ports to scan", [1000, 10000]),
+        (
+            ("-c", "--concurrency"),
+            "Concurrency settings to scan with",
+            [100, 500],
+        ),
+    ):
+        parser.add_argument(
+            *flags,
+            metavar="count",
+            type=int,
+            nargs="+",
+            default=default,
+            help=f"{what} (default: {' '.join(map(str, default))})",
+        )
+    parser.add_argument(
+        "--open",
+        metavar="count",
+        type=int,
+        default=20,
+        help="Number of open ports to serve (default: 20)",
+    )
+    parser.add_argument(
+        "--filtered",
+        metavar="count",
+        type=int,
+        default=20,
+        help="Number of filtered ports to serve (default: 20)",
+    )
+    add_timeout_arguments(parser)
+    parser.add_argument(
+        "-b",
+        "--banners",
+        action="store_true",
+        help="Serve and read banners on open ports",
+    )
+    add_output_argument(parser, "Save the results as JSON")
+    args = parser.parse_args()
+
+    options = {
+        "timeout": args.timeout,
+        "adaptive": args.adaptive,
+        "min_timeout": args.min_timeout,
+        "max_timeout": args.max_timeout,
+        "banners": args.banners,
+    }
+    banner = b"SSH-2.0-MockTarget\r\n" if args.banners else b""
+    with MockTargetServer(args.open, args.filtered, banner=banner) as server:
+        cases = run_benchmarks(args.ports, args.concurrency, server, options)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding=ENCODING) as output_file:
+            json.dump(
+                {"options": options, "cases": cases}, output_file, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
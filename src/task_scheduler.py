@@ -1,17 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-"""Task Scheduler"""
-# version: 0.3.2
+"""Task Scheduler
+
+Tasks are kept in a JSON snapshot and an append-only journal through
+TaskStore, which reads them on first access rather than on import, or in
+an indexed SQLite database through SqliteTaskStore. Run without a command
+for the interactive menu, or with add, list or delete from scripts.
+"""
+# version: 0.6.0
 # license: MIT
 # author: Anthony Pagan
 # repo: https://github.com/get-tony/pyutils
 
+import argparse
 import sys
 import json
 import os
 import datetime
-from typing import List, Dict
-
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
 
 # Define system encoding
 ENCODING: str = sys.getfilesystemencoding() or sys.getdefaultencoding()
@@ -19,55 +26,503 @@ ENCODING: str = sys.getfilesystemencoding() or sys.getdefaultencoding()
 # Define the data file to store tasks
 TASKS_FILE: str = "tasks.json"
 
-# Load tasks from the data file (if it exists)
-tasks: List[Dict[str, str]] = []
-if os.path.exists(TASKS_FILE):
-    with open(TASKS_FILE, "r", encoding=ENCODING) as task_file:
-        tasks = json.load(task_file)
+# Format of due dates, as entered and as stored
+DATE_FORMAT: str = "%Y-%m-%d"
+
+# Suffix of the journal of changes made since the snapshot was written
+JOURNAL_SUFFIX: str = ".journal"
+
+# Operations the journal may hold before it is compacted, at least
+COMPACT_MIN_OPS: int = 1000
+
+Task = Dict[str, Any]
+
+# Tables of SQLite task stores. AUTOINCREMENT keeps IDs from being reused.
+SQLITE_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    due_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_due_date ON tasks (due_date);
+CREATE INDEX IF NOT EXISTS tasks_name ON tasks (name);
+"""
+
+
+def parse_date(text: str) -> datetime.date:
+    """Parse a due date.
+
+    Args:
+        text: The date as YYYY-MM-DD.
+
+    Returns:
+        The date.
+
+    Raises:
+        ValueError: The text is not a valid date.
+    """
+    return datetime.datetime.strptime(text, DATE_FORMAT).date()
+
+
+def _apply(tasks: Dict[int, Task], operation: Dict[str, Any]) -> None:
+    """Apply a journal operation. Applying it twice changes nothing."""
+    if operation["op"] == "add":
+        task = operation["task"]
+        tasks[task["id"]] = task
+    else:
+        tasks.pop(operation["id"], None)
+
+
+def _fsync_directory(path: str) -> None:
+    """Make a rename in the directory of a file durable, where possible."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    descriptor = os.open(
+        os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY
+    )
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class TaskStore:
+    """Tasks kept in a JSON snapshot and an append-only journal.
+
+    Each change is appended to the journal, a JSON Lines file next to the
+    snapshot, as an add or delete operation keyed by the task ID, so saving
+    a change costs the same however many tasks there are. Once the journal
+    holds more operations than half the tasks, and at least
+    COMPACT_MIN_OPS, it is folded into a new snapshot, which keeps the
+    cost of compacting constant per change. The snapshot is
+    written to a temporary file and renamed over the old one before the
+    journal is emptied.
+
+    Operations are idempotent, so replaying a journal over a snapshot that
+    already includes it is harmless, and a last line torn by a crash is
+    ignored. The files are only read when the tasks are first accessed, so
+    creating a store is free and a store can be kept around for many
+    operations. Only one store should write to the files at a time.
+
+    IDs of deleted tasks are never reused: the snapshot records the next
+    ID along with the tasks.
+
+    Args:
+        path: The path to the snapshot, a JSON object holding the tasks and
+            the next ID. Snapshots that are a plain list of tasks are read
+            too.
+    """
+
+    def __init__(self, path: str = TASKS_FILE) -> None:
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self._tasks: Optional[Dict[int, Task]] = None
+        self._next_id = 1
+        self._operations = 0
+        self._journal_size = 0
+        self._torn = False
+
+    @property
+    def tasks(self) -> List[Task]:
+        """The tasks in the order they were added."""
+        return list(self._loaded().values())
+
+    @property
+    def next_id(self) -> int:
+        """The ID the next task added gets."""
+        self._loaded()
+        return self._next_id
+
+    def __len__(self) -> int:
+        return len(self._loaded())
+
+    def __iter__(self) -> Iterator[Task]:
+        return iter(self.tasks)
+
+    def _loaded(self) -> Dict[int, Task]:
+        """Return the tasks by ID, reading the files on first access."""
+        if self._tasks is None:
+            self._tasks = self._load_snapshot()
+            self._replay_journal(self._tasks)
+            self._next_id = max(self._next_id, max(self._tasks, default=0) + 1)
+        return self._tasks
+
+    def _load_snapshot(self) -> Dict[int, Task]:
+        """Read the snapshot, giving tasks saved before IDs one."""
+        try:
+            with open(self.path, "r", encoding=ENCODING) as task_file:
+                snapshot = json.load(task_file)
+        except FileNotFoundError:
+            return {}
+        if isinstance(snapshot, dict):
+            self._next_id = max(self._next_id, snapshot["next_id"])
+            snapshot = snapshot["tasks"]
+        tasks = {}
+        for number, task in enumerate(snapshot, start=1):
+            task.setdefault("id", number)
+            tasks[task["id"]] = task
+        return tasks
+
+    def _replay_journal(self, tasks: Dict[int, Task]) -> None:
+        """Apply the operations of the journal to the snapshot.
+
+        Raises:
+            ValueError: A line other than the last one is not valid.
+        """
+        try:
+            with open(self.journal_path, "rb") as journal:
+                for line in journal:
+                    if not line.endswith(b"\n"):
+                        # Torn by a crash while it was being written
+                        self._torn = True
+                        break
+                    operation = json.loads(line)
+                    _apply(tasks, operation)
+                    if operation["op"] == "add":
+                        self._next_id = max(
+                            self._next_id, operation["task"]["id"] + 1
+                        )
+                    self._operations += 1
+                    self._journal_size += len(line)
+        except FileNotFoundError:
+            pass
+
+    def _append(self, operation: Dict[str, Any]) -> None:
+        """Durably append an operation to the journal and apply it."""
+        tasks = self._loaded()
+        line = (json.dumps(operation) + "\n").encode("ascii")
+        with open(self.journal_path, "ab") as journal:
+            if self._torn:
+                journal.truncate(self._journal_size)
+                self._torn = False
+            journal.write(line)
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._journal_size += len(line)
+        self._operations += 1
+        _apply(tasks, operation)
+        if self._operations > max(COMPACT_MIN_OPS, len(tasks) // 2):
+            self.compact()
+
+    def compact(self) -> None:
+        """Write the tasks to a new snapshot and empty the journal."""
+        tasks = self._loaded()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding=ENCODING) as task_file:
+            json.dump(
+                {"next_id": self._next_id, "tasks": list(tasks.values())},
+                task_file,
+            )
+            task_file.flush()
+            os.fsync(task_file.fileno())
+        os.replace(temp_path, self.path)
+        _fsync_directory(self.path)
+        # Only now that the snapshot includes them can the operations go
+        with open(self.journal_path, "wb") as journal:
+            os.fsync(journal.fileno())
+        self._operations = 0
+        self._journal_size = 0
+        self._torn = False
+
+    def add(self, name: str, due_date: datetime.date) -> Task:
+        """Add a task and save it.
+
+        Args:
+            name: The name of the task.
+            due_date: The date the task is due.
+
+        Returns:
+            The task, with a new ID and the due date as YYYY-MM-DD.
+        """
+        self._loaded()
+        task = {
+            "id": self._next_id,
+            "name": name,
+            "due_date": due_date.isoformat(),
+        }
+        self._next_id += 1
+        self._append({"op": "add", "task": task})
+        return task
+
+    def remove(self, task_id: int) -> Task:
+        """Delete a task by ID and save the change.
+
+        Args:
+            task_id: The ID of the task.
+
+        Returns:
+            The deleted task.
+
+        Raises:
+            KeyError: There is no task with that ID.
+        """
+        task = self._loaded()[task_id]
+        self._append({"op": "delete", "id": task_id})
+        return task
+
+    def delete(self, number: int) -> Task:
+        """Delete a task by position and save the change.
 
+        Args:
+            number: The position of the task, starting at 1.
 
-def save_tasks() -> None:
-    """Save tasks to the data file."""
-    with open(TASKS_FILE, "w", encoding=ENCODING) as save_file:
-        json.dump(tasks, save_file)
+        Returns:
+            The deleted task.
 
+        Raises:
+            IndexError: There is no task with that number.
+        """
+        if not 1 <= number <= len(self):
+            raise IndexError(f"no task number {number}")
+        return self.remove(list(self._loaded())[number - 1])
 
-def add_task() -> None:
+    def query(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        name: Optional[str] = None,
+        due_from: Optional[datetime.date] = None,
+        due_to: Optional[datetime.date] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Task]:
+        """Return a page of the tasks matching a name or due dates.
+
+        Args:
+            name: The name of the tasks.
+            due_from: The earliest due date of the tasks.
+            due_to: The latest due date of the tasks.
+            offset: The number of matching tasks to skip.
+            limit: The largest number of tasks to return.
+
+        Returns:
+            The tasks by due date if a due date was given, otherwise by ID.
+        """
+        tasks = [
+            task
+            for task in self._loaded().values()
+            if name in (None, task["name"])
+            and (due_from is None or task["due_date"] >= due_from.isoformat())
+            and (due_to is None or task["due_date"] <= due_to.isoformat())
+        ]
+        if due_from or due_to:
+            tasks.sort(key=lambda task: (task["due_date"], task["id"]))
+        return tasks[offset : None if limit is None else offset + limit]
+
+    def reset(self, tasks: Iterable[Task], next_id: int = 1) -> None:
+        """Replace all tasks, keeping their IDs, and write a new snapshot.
+
+        Args:
+            tasks: The new tasks.
+            next_id: The ID the next task added gets, at least.
+        """
+        self._tasks = {task["id"]: dict(task) for task in tasks}
+        self._next_id = max(next_id, max(self._tasks, default=0) + 1)
+        self.compact()
+
+
+class SqliteTaskStore:
+    """Tasks kept in an SQLite database.
+
+    Tasks get IDs that are never reused, and due dates and names are
+    indexed, so looking up the tasks due in a range of dates or with a
+    name reads only the rows returned, however many tasks there are. Each
+    change is committed on its own. The database is created if needed and
+    opened on first access.
+
+    Args:
+        path: The path to the database.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        """Return the connection, opening the database on first use."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.executescript(SQLITE_SCHEMA)
+        return self._connection
+
+    def close(self) -> None:
+        """Close the database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @property
+    def tasks(self) -> List[Task]:
+        """The tasks in the order they were added."""
+        return self.query()
+
+    def __len__(self) -> int:
+        return self._db().execute("SELECT count(*) FROM tasks").fetchone()[0]
+
+    def __iter__(self) -> Iterator[Task]:
+        return iter(self.tasks)
+
+    def add(self, name: str, due_date: datetime.date) -> Task:
+        """Add a task and save it.
+
+        Args:
+            name: The name of the task.
+            due_date: The date the task is due.
+
+        Returns:
+            The task, with a new ID and the due date as YYYY-MM-DD.
+        """
+        with self._db() as database:
+            cursor = database.execute(
+                "INSERT INTO tasks (name, due_date) VALUES (?, ?)",
+                (name, due_date.isoformat()),
+            )
+        return {
+            "id": cursor.lastrowid,
+            "name": name,
+            "due_date": due_date.isoformat(),
+        }
+
+    def remove(self, task_id: int) -> Task:
+        """Delete a task by ID and save the change.
+
+        Args:
+            task_id: The ID of the task.
+
+        Returns:
+            The deleted task.
+
+        Raises:
+            KeyError: There is no task with that ID.
+        """
+        with self._db() as database:
+            row = database.execute(
+                "SELECT id, name, due_date FROM tasks WHERE id = ?",
+                (task_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(task_id)
+            database.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+        return dict(zip(("id", "name", "due_date"), row))
+
+    def query(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        name: Optional[str] = None,
+        due_from: Optional[datetime.date] = None,
+        due_to: Optional[datetime.date] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Task]:
+        """Return a page of the tasks matching a name or due dates.
+
+        See TaskStore.query, which this answers from the indexes.
+        """
+        conditions = []
+        if name is not None:
+            conditions.append("name = :name")
+        if due_from is not None:
+            conditions.append("due_date >= :due_from")
+        if due_to is not None:
+            conditions.append("due_date <= :due_to")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "due_date, id" if due_from or due_to else "id"
+        rows = self._db().execute(
+            f"SELECT id, name, due_date FROM tasks {where} "
+            f"ORDER BY {order} LIMIT :limit OFFSET :offset",
+            {
+                "name": name,
+                "due_from": due_from and due_from.isoformat(),
+                "due_to": due_to and due_to.isoformat(),
+                "limit": -1 if limit is None else limit,
+                "offset": offset,
+            },
+        )
+        return [dict(zip(("id", "name", "due_date"), row)) for row in rows]
+
+    def import_json(self, path: str) -> int:
+        """Import the tasks of a TaskStore, keeping their IDs.
+
+        Args:
+            path: The path to the snapshot of the TaskStore.
+
+        Returns:
+            The number of tasks imported. Tasks with the same IDs as
+            imported ones are replaced. IDs the TaskStore already used are
+            not given to new tasks.
+        """
+        store = TaskStore(path)
+        tasks = store.tasks
+        with self._db() as database:
+            database.executemany(
+                "INSERT OR REPLACE INTO tasks (id, name, due_date) "
+                "VALUES (:id, :name, :due_date)",
+                tasks,
+            )
+            if self._last_id() < store.next_id - 1:
+                database.execute(
+                    "DELETE FROM sqlite_sequence WHERE name = 'tasks'"
+                )
+                database.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) "
+                    "VALUES ('tasks', ?)",
+                    (store.next_id - 1,),
+                )
+        return len(tasks)
+
+    def export_json(self, path: str) -> None:
+        """Write all tasks to a new TaskStore snapshot, keeping their IDs."""
+        TaskStore(path).reset(self.tasks, self._last_id() + 1)
+
+    def _last_id(self) -> int:
+        """Return the highest ID ever given to a task."""
+        row = (
+            self._db()
+            .execute("SELECT seq FROM sqlite_sequence WHERE name = 'tasks'")
+            .fetchone()
+        )
+        return 0 if row is None else row[0]
+
+
+# Either kind of task store
+Store = Union[TaskStore, SqliteTaskStore]
+
+
+def format_task(task: Task) -> str:
+    """Format a task as a line of a listing."""
+    return f"{task['id']}. {task['name']} (Due: {task['due_date']})"
+
+
+def add_task(store: Store) -> None:
     """Add a task to the list."""
     task_name: str = input("Enter the task name: ")
     due_date: str = input("Enter the due date (YYYY-MM-DD): ")
 
     try:
-        due_date = datetime.datetime.strptime(due_date, "%Y-%m-%d").date()
+        store.add(task_name, parse_date(due_date))
     except ValueError:
         print("Invalid date format. Please use YYYY-MM-DD.")
         return
 
-    tasks.append({"name": task_name, "due_date": due_date})
-    save_tasks()
     print(f"Task '{task_name}' added successfully!")
 
 
-def view_tasks() -> None:
+def view_tasks(store: Store) -> None:
     """View the list of tasks."""
     print("Tasks:")
-    for idx, task in enumerate(tasks, start=1):
-        print(f"{idx}. {task['name']} (Due: {task['due_date']})")
+    for task in store:
+        print(format_task(task))
 
 
-def delete_task() -> None:
+def delete_task(store: Store) -> None:
     """Delete a task from the list."""
-    view_tasks()
-    task_index: str = input("Enter the task number to delete: ")
+    view_tasks(store)
+    task_id: str = input("Enter the task number to delete: ")
 
     try:
-        task_index = int(task_index)
-        if 1 <= task_index <= len(tasks):
-            deleted_task: Dict[str, str] = tasks.pop(task_index - 1)
-            save_tasks()
-            print(f"Task '{deleted_task['name']}' deleted successfully!")
-        else:
-            print("Invalid task number.")
+        deleted_task = store.remove(int(task_id))
+        print(f"Task '{deleted_task['name']}' deleted successfully!")
+    except KeyError:
+        print("Invalid task number.")
     except ValueError:
         print("Invalid input. Please enter a valid task number.")
 
@@ -80,21 +535,129 @@ Task Scheduler Menu:
 4. Quit
 """
 
-while True:
-    print("\n" + SCHEDULER_MENU)
 
-    choice: str = input("Enter your choice: ")
+def run_menu(store: Store) -> None:
+    """Run the interactive menu until the user quits."""
+    while True:
+        print("\n" + SCHEDULER_MENU)
+
+        choice: str = input("Enter your choice: ")
+
+        match choice:
+            case "1":
+                add_task(store)
+            case "2":
+                view_tasks(store)
+            case "3":
+                delete_task(store)
+            case "4":
+                break
+            case _:
+                print("Invalid choice. Please choose a valid option.")
+
+    print("Goodbye!")
+
+
+def _parser() -> argparse.ArgumentParser:
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(description="Schedule tasks.")
+    parser.add_argument(
+        "-f",
+        "--file",
+        default=TASKS_FILE,
+        help=f"the file tasks are kept in (default: {TASKS_FILE})",
+    )
+    parser.add_argument(
+        "--db",
+        metavar="DATABASE",
+        help="keep tasks in an SQLite database instead of the file",
+    )
+    commands = parser.add_subparsers(
+        dest="command", help="run a command instead of the menu"
+    )
+    add_parser = commands.add_parser("add", help="add a task")
+    add_parser.add_argument("name", help="the name of the task")
+    add_parser.add_argument(
+        "due_date", type=parse_date, help="the due date (YYYY-MM-DD)"
+    )
+    list_parser = commands.add_parser("list", help="list the tasks")
+    due = list_parser.add_mutually_exclusive_group()
+    due.add_argument(
+        "--overdue", action="store_true", help="only tasks due before today"
+    )
+    due.add_argument(
+        "--due-within",
+        metavar="DAYS",
+        type=int,
+        help="only tasks due from today to DAYS days from now",
+    )
+    list_parser.add_argument("--name", help="only tasks with this name")
+    list_parser.add_argument(
+        "--limit", type=int, help="list at most this many tasks"
+    )
+    list_parser.add_argument(
+        "--offset", type=int, default=0, help="skip this many tasks first"
+    )
+    delete_parser = commands.add_parser("delete", help="delete a task")
+    delete_parser.add_argument(
+        "id", type=int, help="the task number shown by list"
+    )
+    for command, help_text in (
+        ("import", "import the tasks of a JSON file into the database"),
+        ("export", "write the tasks of the database to a JSON file"),
+    ):
+        commands.add_parser(command, help=help_text).add_argument(
+            "json_file", help="the JSON file"
+        )
+    return parser
 
-    match choice:
-        case "1":
-            add_task()
-        case "2":
-            view_tasks()
-        case "3":
-            delete_task()
-        case "4":
-            break
+
+def _list_tasks(store: Store, args: argparse.Namespace) -> None:
+    """Print the tasks matching the list options."""
+    today = datetime.date.today()
+    due_from = due_to = None
+    if args.overdue:
+        due_to = today - datetime.timedelta(days=1)
+    elif args.due_within is not None:
+        due_from = today
+        due_to = today + datetime.timedelta(days=args.due_within)
+    for task in store.query(
+        name=args.name,
+        due_from=due_from,
+        due_to=due_to,
+        offset=args.offset,
+        limit=args.limit,
+    ):
+        print(format_task(task))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Parse command line arguments and run a command or the menu."""
+    parser = _parser()
+    args = parser.parse_args(argv)
+
+    store: Store = TaskStore(args.file)
+    if args.db is not None:
+        store = SqliteTaskStore(args.db)
+    match args.command:
+        case "add":
+            store.add(args.name, args.due_date)
+        case "list":
+            _list_tasks(store, args)
+        case "delete":
+            try:
+                store.remove(args.id)
+            except KeyError:
+                parser.error(f"no task number {args.id}")
+        case "import" | "export" if not isinstance(store, SqliteTaskStore):
+            parser.error(f"{args.command} needs a database, see --db")
+        case "import":
+            print(f"Imported {store.import_json(args.json_file)} tasks.")
+        case "export":
+            store.export_json(args.json_file)
         case _:
-            print("Invalid choice. Please choose a valid option.")
+            run_menu(store)
+
 
-print("Goodbye!")
+if __name__ == "__main__":
+    main()
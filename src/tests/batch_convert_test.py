@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the batch_convert module."""
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import os
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from batch_convert import (
+    ConversionError,
+    Manifest,
+    convert_files,
+    convert_one,
+)
+
+
+def upper(source_path: str, target_path: Optional[str]) -> Optional[str]:
+    """Convert a name, or a file's content, to upper case."""
+    if not source_path:
+        raise ConversionError("empty name")
+    if target_path is None:
+        return source_path.upper()
+    content = Path(source_path).read_text(encoding="utf-8")
+    if content == "fail":
+        raise ConversionError(f"{source_path} fails, {target_path} kept")
+    with open(target_path, "x", encoding="utf-8") as target_file:
+        target_file.write(content.upper())
+    return None
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_convert_files(tmp_path, capsys, jobs):
+    """Test that output and errors are printed in order."""
+    (tmp_path / "b").write_text("b")
+    target = str(tmp_path / "target")
+    paths = [
+        ("a", None),
+        ("", None),
+        (str(tmp_path / "b"), target),
+        ("c", None),
+    ]
+    summary = convert_files(upper, paths, jobs=jobs)
+    assert summary.converted == 3
+    assert summary.errors == [("", "empty name")]
+    assert capsys.readouterr().out == "A\nERROR: empty name\nC\n"
+    assert str(summary) == "Converted 3 files, 1 failed."
+
+
+def test_convert_one(capsys):
+    """Test that a single failure is printed instead of raised."""
+    assert not convert_one(upper, "", None)
+    assert convert_one(upper, "a", None)
+    assert capsys.readouterr().out == "ERROR: empty name\nA\n"
+
+
+def _age(path: Path) -> None:
+    """Move a file's mtime out of the racy window."""
+    os.utime(path, ns=(0, 10**18))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_files_incremental(tmp_path, jobs):
+    """Test that only changed sources are converted, and orphans deleted."""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    target_dir = tmp_path / "target"
+    target_dir.mkdir()
+    for name in ("a", "b", "c"):
+        (source_dir / name).write_text(name)
+        _age(source_dir / name)
+    manifest_path = str(target_dir / "manifest.json")
+
+    def run():
+        paths = [
+            (str(path), str(target_dir / path.name))
+            for path in sorted(source_dir.iterdir())
+        ]
+        manifest = Manifest.load(manifest_path, "options")
+        return convert_files(upper, paths, jobs, manifest)
+
+    summary = run()
+    assert (summary.converted, summary.skipped, summary.deleted) == (3, 0, 0)
+    assert (target_dir / "a").read_text() == "A"
+
+    # Nothing changed: no source is read
+    summary = run()
+    assert (summary.converted, summary.skipped, summary.deleted) == (0, 3, 0)
+
+    # A touched but unchanged file is hashed, not converted; a changed one
+    # replaces its target; a deleted one loses its target
+    os.utime(source_dir / "a", ns=(0, 2 * 10**18))
+    (source_dir / "b").write_text("bb")
+    _age(source_dir / "b")
+    (source_dir / "c").unlink()
+    summary = run()
+    assert (summary.converted, summary.skipped, summary.deleted) == (1, 1, 1)
+    assert (target_dir / "b").read_text() == "BB"
+    assert not (target_dir / "c").exists()
+
+    # A failed conversion keeps the old target and is retried next time
+    (source_dir / "b").write_text("fail")
+    summary = run()
+    assert summary.errors == [
+        (
+            str(source_dir / "b"),
+            f"{source_dir / 'b'} fails, {target_dir / 'b'} kept",
+        )
+    ]
+    assert (target_dir / "b").read_text() == "BB"
+    assert not [path for path in os.listdir(target_dir) if ".tmp" in path]
+    (source_dir / "b").write_text("ok")
+    assert run().converted == 1
+    assert (target_dir / "b").read_text() == "OK"
+
+    # Changed options convert everything again
+    manifest = Manifest.load(manifest_path, "other")
+    assert not manifest.entries
+
+
+def test_convert_files_shared_target(tmp_path):
+    """Test that sources from two directories keep each other's targets."""
+    target_dir = tmp_path / "target"
+    target_dir.mkdir()
+    manifest_path = str(target_dir / "manifest.json")
+    for name in ("a", "b"):
+        source_dir = tmp_path / name
+        source_dir.mkdir()
+        (source_dir / name).write_text(name)
+        paths = [(str(source_dir / name), str(target_dir / name))]
+        manifest = Manifest.load(manifest_path, "options", str(source_dir))
+        assert convert_files(upper, paths, 1, manifest).deleted == 0
+    assert sorted(os.listdir(target_dir)) == ["a", "b", "manifest.json"]
+
+    # Only the orphans of the directory being converted are deleted
+    (tmp_path / "a" / "a").unlink()
+    manifest = Manifest.load(manifest_path, "options", str(tmp_path / "a"))
+    assert convert_files(upper, [], 1, manifest).deleted == 1
+    assert sorted(os.listdir(target_dir)) == ["b", "manifest.json"]
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the clean_tree module."""
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from clean_tree import (
+    CleanRoot,
+    PatternMatcher,
+    ScanIndex,
+    SizeReport,
+    discover_roots,
+    disk_usage,
+    find_unwanted_items,
+    find_unwanted_matches,
+    main,
+    measure_unwanted_items,
+    remove_unwanted_items,
+    walk_roots,
+)
+
+# pylint: disable=redefined-outer-name
+
+
+@pytest.fixture
+def tree(tmp_path: Path) -> Path:
+    """Create a small project tree with unwanted items."""
+    (tmp_path / "pkg" / "__pycache__").mkdir(parents=True)
+    (tmp_path / "pkg" / "__pycache__" / "mod.pyc").write_text("")
+    (tmp_path / "pkg" / "module.py").write_text("")
+    (tmp_path / "node_modules" / "dep" / "__pycache__").mkdir(parents=True)
+    (tmp_path / ".coverage").write_text("")
+    return tmp_path
+
+
+def test_find_unwanted_items(tree):
+    """Test that matches are found at every depth."""
+    found = set(
+        find_unwanted_items(tree, {"__pycache__", ".coverage", "node_modules"})
+    )
+    assert found == {
+        tree / "pkg" / "__pycache__",
+        tree / "node_modules",
+        tree / ".coverage",
+    }
+
+
+def test_find_unwanted_items_prunes(tree):
+    """Test that matched directories are not descended into."""
+    found = set(find_unwanted_items(tree, {"node_modules", "__pycache__"}))
+    assert tree / "node_modules" / "dep" / "__pycache__" not in found
+
+
+def test_find_unwanted_items_is_lazy(tree):
+    """Test that matches are streamed as they are found."""
+    items = find_unwanted_items(tree, {".coverage"})
+    assert next(items) == tree / ".coverage"
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_remove_unwanted_items(tree, jobs):
+    """Test that files and whole trees are removed and accounted for."""
+    big = tree / "node_modules" / "big"
+    big.mkdir()
+    for index in range(600):
+        (big / f"file{index}").write_text("x")
+    (big / "nested" / "deeper").mkdir(parents=True)
+    (big / "nested" / "deeper" / "data").write_text("12345")
+    (tree / "pkg" / "link").symlink_to(tree / "pkg" / "__pycache__")
+    link_size = os.lstat(tree / "pkg" / "link").st_size
+
+    items = [
+        tree / "node_modules",
+        tree / ".coverage",
+        tree / "pkg" / "__pycache__",
+        tree / "pkg" / "link",
+    ]
+    summary = remove_unwanted_items(items, jobs=jobs)
+
+    assert not summary.errors
+    assert not any(os.path.lexists(item) for item in items)
+    assert (tree / "pkg" / "module.py").exists()
+    assert summary.items == summary.removed == 4
+    assert summary.files == 600 + 1 + 1 + 1 + 1
+    assert summary.dirs == 7
+    assert summary.bytes == 600 + 5 + link_size
+
+
+def test_remove_unwanted_items_errors(tree):
+    """Test that failures are collected instead of raised."""
+    summary = remove_unwanted_items([tree / "missing", tree / ".coverage"])
+    assert [path for path, _ in summary.errors] == [str(tree / "missing")]
+    assert (summary.items, summary.removed) == (2, 1)
+    assert summary.files == 1
+
+
+@pytest.mark.parametrize("jobs", ["0", "-2"])
+def test_main_jobs(tree, monkeypatch, jobs):
+    """Test that a non-positive number of threads is a usage error."""
+    monkeypatch.setattr(sys, "argv", ["clean_tree.py", str(tree), "-j", jobs])
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+    assert exc_info.value.code == 2
+
+
+def test_pattern_matcher():
+    """Test names, wildcards, anchors, directory rules and negation."""
+    matcher = PatternMatcher(
+        [
+            "# comment",
+            "",
+            "__pycache__",
+            "*.py[cod]",
+            "!keep.pyc",
+            "build/",
+            "/dist",
+            "**/tmp/*.log",
+            "docs/**/*.tmp",
+        ]
+    )
+    assert matcher.match("a/b/__pycache__", True) == "__pycache__"
+    assert matcher.match("a/mod.pyc", False) == "*.py[cod]"
+    assert matcher.match("a/keep.pyc", False) is None
+    assert matcher.match("a/mod.py", False) is None
+    assert matcher.match("src/build", True) == "build/"
+    assert matcher.match("src/build", False) is None
+    assert matcher.match("dist", True) == "/dist"
+    assert matcher.match("src/dist", True) is None
+    assert matcher.match("tmp/run.log", False) == "**/tmp/*.log"
+    assert matcher.match("a/b/tmp/run.log", False) == "**/tmp/*.log"
+    assert matcher.match("a/tmp/sub/run.log", False) is None
+    assert matcher.match("docs/x.tmp", False) == "docs/**/*.tmp"
+    assert matcher.match("docs/a/b/x.tmp", False) == "docs/**/*.tmp"
+
+
+def test_pattern_matcher_precedence():
+    """Test that later patterns override earlier ones."""
+    assert PatternMatcher(["!*.log", "*.log"]).match("a.log", False)
+    assert not PatternMatcher(["*.log", "!debug.log"]).match(
+        "debug.log", False
+    )
+    assert PatternMatcher(["*.log", "!debug.log", "debug*"]).match(
+        "debug.log", False
+    )
+
+
+def test_find_unwanted_items_patterns(tree):
+    """Test that the walker uses paths relative to the root."""
+    (tree / "pkg" / "build").mkdir()
+    (tree / "build").write_text("")
+    found = set(find_unwanted_items(tree, PatternMatcher(["*.pyc", "build/"])))
+    assert found == {
+        tree / "pkg" / "__pycache__" / "mod.pyc",
+        tree / "pkg" / "build",
+    }
+
+
+def _age(tree: Path) -> None:
+    """Move every directory mtime out of the racy window."""
+    for path in [tree, *[p for p in tree.rglob("*") if p.is_dir()]]:
+        os.utime(path, ns=(0, 10**18))
+
+
+def test_scan_index(tree):
+    """Test that unchanged directories are served from the index."""
+    matcher = PatternMatcher(["__pycache__", ".coverage"])
+    _age(tree)
+    index = ScanIndex.load(tree / "index", matcher)
+    first = set(find_unwanted_items(tree, matcher, index))
+    index.save()
+
+    # A change that leaves the mtime alone is not noticed
+    (tree / "pkg" / "extra" / "__pycache__").mkdir(parents=True)
+    os.utime(tree / "pkg", ns=(0, 10**18))
+    index = ScanIndex.load(tree / "index", matcher)
+    assert set(find_unwanted_items(tree, matcher, index)) == first
+
+    # A full listing finds it and reports the stale entry
+    index = ScanIndex.load(tree / "index", matcher)
+    index.trusted = False
+    found = set(find_unwanted_items(tree, matcher, index))
+    assert tree / "pkg" / "extra" / "__pycache__" in found
+    assert index.stale() == ["pkg"]
+
+
+def test_scan_index_invalidation(tree):
+    """Test that new entries, racy and outdated indexes are relisted."""
+    matcher = PatternMatcher(["__pycache__", ".coverage"])
+    index = ScanIndex.load(tree / "index", matcher)
+    list(find_unwanted_items(tree, matcher, index))
+    index.save()
+    # Directories modified just now are never trusted
+    assert ScanIndex.load(tree / "index", matcher).cached[""][0] == -1
+
+    _age(tree)
+    index = ScanIndex.load(tree / "index", matcher)
+    list(find_unwanted_items(tree, matcher, index))
+    index.save()
+    (tree / "pkg" / "__pycache__" / "new.pyc").write_text("")
+    (tree / "__pycache__").mkdir()
+    index = ScanIndex.load(tree / "index", matcher)
+    assert tree / "__pycache__" in set(
+        find_unwanted_items(tree, matcher, index)
+    )
+
+    other = PatternMatcher(["*.pyc"])
+    assert not ScanIndex.load(tree / "index", other).cached
+    (tree / "index").write_text("{not json")
+    assert not ScanIndex.load(tree / "index", matcher).cached
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_measure_unwanted_items(tree, jobs):
+    """Test that sizes are streamed in walk order and totalled per pattern."""
+    (tree / "pkg" / "__pycache__" / "other.pyc").write_text("1234")
+    (tree / "node_modules" / "dep" / "index.js").write_text("12345678")
+    (tree / ".coverage").write_text("12")
+    matches = list(
+        find_unwanted_matches(tree, ["__pycache__", ".coverage", "node_*"])
+    )
+    items = list(measure_unwanted_items(iter(matches), jobs=jobs))
+    assert [(item.path, item.pattern) for item in items] == matches
+
+    report = SizeReport()
+    for item in items:
+        report.add(item)
+    summary = report.as_dict()
+    assert summary["bytes"] == 4 + 8 + 2
+    assert summary["files"] == 4
+    assert [row["pattern"] for row in summary["patterns"]] == [
+        "node_*",
+        "__pycache__",
+        ".coverage",
+    ]
+    assert "Total: 14 B in 3 items and 4 files." in str(report)
+
+
+def test_disk_usage_missing(tree):
+    """Test that missing items take up no space."""
+    assert disk_usage(str(tree / "missing")) == (0, 0)
+
+
+def test_nested_config(tree):
+    """Test that nested configuration files cascade like '.gitignore'."""
+    (tree / "pkg" / ".clean_tree").write_text("!__pycache__\n/module.py\n")
+    (tree / "pkg" / "sub").mkdir()
+    (tree / "pkg" / "sub" / "module.py").write_text("")
+    matcher = PatternMatcher(["__pycache__", ".coverage"])
+    found = set(find_unwanted_items(tree, matcher, config_name=".clean_tree"))
+    assert found == {
+        tree / ".coverage",
+        tree / "pkg" / "module.py",
+        tree / "node_modules" / "dep" / "__pycache__",
+    }
+    # Without cascading, nested files are ordinary files
+    assert tree / "pkg" / "__pycache__" in set(
+        find_unwanted_items(tree, matcher)
+    )
+
+
+def test_nested_config_index(tree):
+    """Test that editing a nested configuration file invalidates listings."""
+    (tree / "pkg" / ".clean_tree").write_text("")
+    matcher = PatternMatcher(["__pycache__"])
+    _age(tree)
+    index = ScanIndex.load(tree / "index", matcher)
+    list(find_unwanted_items(tree, matcher, index, ".clean_tree"))
+    index.save()
+
+    (tree / "pkg" / ".clean_tree").write_text("!__pycache__\n")
+    os.utime(tree / "pkg", ns=(0, 10**18))
+    index = ScanIndex.load(tree / "index", matcher)
+    assert list(find_unwanted_items(tree, matcher, index, ".clean_tree")) == [
+        tree / "node_modules" / "dep" / "__pycache__"
+    ]
+
+
+def test_walk_roots(tree):
+    """Test that roots are discovered and walked in parallel."""
+    roots = []
+    for name in ("one", "two", "three"):
+        root = tree / "work" / name
+        (root / "deep" / "__pycache__").mkdir(parents=True)
+        (root / ".clean_tree").write_text("__pycache__\n")
+        roots.append(root)
+    # Nested configuration files do not make more roots
+    (tree / "work" / "one" / "deep" / ".clean_tree").write_text("")
+
+    assert list(discover_roots(tree)) == sorted(roots)
+    matcher = PatternMatcher(["__pycache__"])
+    clean_roots = [CleanRoot(root, matcher) for root in roots]
+    expected = {
+        (root / "deep" / "__pycache__", "__pycache__") for root in roots
+    }
+    assert set(walk_roots(clean_roots)) == expected
+    assert set(walk_roots(clean_roots, jobs=2)) == expected
+
+    # Stopping early does not leave walkers blocked
+    matches = walk_roots(clean_roots, jobs=2)
+    next(matches)
+    matches.close()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the json_backend module."""
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import datetime
+import json
+import math
+
+import pytest
+
+import json_to_yaml
+import yaml_to_json
+from json_backend import HAS_ORJSON, dumps, loads
+
+needs_orjson = pytest.mark.skipif(
+    not HAS_ORJSON, reason="orjson is not installed"
+)
+
+DOCUMENT = {
+    "name": "Test",
+    "unicode": "naïve café ✓  ",
+    "escapes": 'quote " backslash \\ tab \t control \x01 </script>',
+    "numbers": [0, -1, 3.5, 0.1, -2.25e-10, 2**63, -(2**63)],
+    "flags": [True, False, None],
+    "nested": {"list": [{"b": 1}, {"a": [1, 2, {"c": "d"}]}], "empty": {}},
+    "empty": [],
+}
+
+OPTIONS = [
+    {"compact": True},
+    {"indent": True},
+    {"compact": True, "sort_keys": True},
+    {"indent": True, "sort_keys": True},
+]
+
+
+@needs_orjson
+@pytest.mark.parametrize("options", OPTIONS)
+def test_backends_identical(options):
+    """Test that both backends write the same text and read it back."""
+    text = dumps(DOCUMENT, backend="orjson", **options)
+    assert text == dumps(DOCUMENT, backend="stdlib", **options)
+    assert loads(text, "orjson") == loads(text, "stdlib") == DOCUMENT
+
+
+@needs_orjson
+@pytest.mark.parametrize("options", OPTIONS)
+def test_backends_identical_floats(options):
+    """Test that floats orjson writes differently are left to json."""
+    value = {
+        "nan": math.nan,
+        "infinity": [math.inf, -math.inf],
+        "exponent": [1e100, -2.5e-10, 1e16],
+        "plain": [0.5, 1e15, 0.0001],
+    }
+    text = dumps(value, backend="orjson", **options)
+    assert text == dumps(value, backend="stdlib", **options)
+    assert "NaN" in text and "-Infinity" in text and "1e+100" in text
+
+
+@pytest.mark.parametrize("backend", ["auto", "orjson", "stdlib"])
+def test_dumps_default(backend):
+    """Test that the default output is that of json.dumps."""
+    if backend == "orjson" and not HAS_ORJSON:
+        pytest.skip("orjson is not installed")
+    value = {"name": "T\u00ebst", "n": [1, 2]}
+    assert dumps(value, backend=backend) == json.dumps(value)
+    assert dumps(value, backend=backend) == (
+        '{"name": "T\\u00ebst", "n": [1, 2]}'
+    )
+    assert dumps(DOCUMENT, sort_keys=True, backend=backend) == json.dumps(
+        DOCUMENT, sort_keys=True
+    )
+
+
+@pytest.mark.parametrize("backend", ["auto", "stdlib"])
+def test_dumps_format(backend):
+    """Test compact and indented output, and dates written as ISO 8601."""
+    value = {
+        "b": datetime.date(2002, 12, 14),
+        "a": datetime.datetime(
+            2001, 12, 14, 21, 59, 43, 100000, datetime.timezone.utc
+        ),
+    }
+    assert dumps(value, compact=True, sort_keys=True, backend=backend) == (
+        '{"a":"2001-12-14T21:59:43.100000+00:00","b":"2002-12-14"}'
+    )
+    assert dumps(value, sort_keys=True, backend=backend) == (
+        '{"a": "2001-12-14T21:59:43.100000+00:00", "b": "2002-12-14"}'
+    )
+    assert dumps([1, {"x": None}], indent=True, backend=backend) == (
+        '[\n  1,\n  {\n    "x": null\n  }\n]'
+    )
+
+
+@pytest.mark.parametrize("backend", ["auto", "stdlib"])
+def test_fallback(backend):
+    """Test values and input orjson does not handle."""
+    assert dumps({1: 2**64}, compact=True, backend=backend) == (
+        '{"1":18446744073709551616}'
+    )
+    assert loads("[18446744073709551616]", backend) == [2**64]
+    with pytest.raises(json.JSONDecodeError, match="line 1 column 6"):
+        loads('{"a" 1}', backend)
+    with pytest.raises(TypeError):
+        dumps({"a": object()}, backend=backend)
+    with pytest.raises(ValueError):
+        dumps(1, backend="fast")
+    with pytest.raises(ValueError):
+        dumps(1, compact=True, indent=True, backend=backend)
+
+
+@needs_orjson
+def test_converters_identical(tmp_path):
+    """Test that converting files gives the same bytes with both backends."""
+    source = tmp_path / "source.json"
+    source.write_text(json.dumps(DOCUMENT), encoding="utf-8")
+    outputs = set()
+    for backend in ("orjson", "stdlib"):
+        yaml_path = tmp_path / f"{backend}.yaml"
+        json_path = tmp_path / f"{backend}.json"
+        assert json_to_yaml.convert_file(
+            source, yaml_path, json_backend=backend
+        )
+        assert yaml_to_json.convert_file(
+            yaml_path, json_path, json_backend=backend, indent=True
+        )
+        outputs.add((yaml_path.read_bytes(), json_path.read_bytes()))
+    assert len(outputs) == 1
+    assert json.loads(json_path.read_bytes()) == DOCUMENT
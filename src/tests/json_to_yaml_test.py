@@ -6,13 +6,15 @@
 # repo: https://github.com/get-tony/pyutils
 # Requires: pyyaml
 
+import io
 import json
 import os
 import sys
+import pytest
 import yaml
 
-from json_to_yaml import convert_file
-
+import json_to_yaml
+from json_to_yaml import convert_directory, convert_file, iter_json_records
 
 # Define system encoding
 ENCODING = sys.getfilesystemencoding() or sys.getdefaultencoding()
@@ -75,3 +77,166 @@ def test_convert_file_source_not_found(tmp_path, capsys):
     target_path = tmp_path / "test.yaml"
     convert_file(source_path, target_path)
     assert "ERROR" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_directory(tmp_path, capsys, jobs):
+    """Test that every JSON file in a directory is converted to YAML."""
+    source_dir = tmp_path / "json"
+    target_dir = tmp_path / "yaml"
+    for path in (source_dir / "nested", target_dir):
+        path.mkdir(parents=True)
+    for index in range(10):
+        (source_dir / f"file{index}.json").write_text(f'{{"index": {index}}}')
+    (source_dir / "nested" / "other.json").write_text('["a", "b"]')
+    (source_dir / "broken.json").write_text("{")
+    (source_dir / "notes.txt").write_text("not converted")
+
+    summary = convert_directory(source_dir, target_dir, jobs=jobs)
+
+    assert summary.converted == 11
+    assert [path for path, _ in summary.errors] == [
+        str(source_dir / "broken.json")
+    ]
+    assert "ERROR" in capsys.readouterr().out
+    for index in range(10):
+        with open(target_dir / f"file{index}.yaml", encoding=ENCODING) as file:
+            assert yaml.safe_load(file) == {"index": index}
+    with open(target_dir / "other.yaml", encoding=ENCODING) as file:
+        assert yaml.safe_load(file) == ["a", "b"]
+
+
+def test_convert_directory_incremental_in_place(tmp_path):
+    """Test that the manifest is not converted along with the JSON files."""
+    (tmp_path / "one.json").write_text('{"a": 1}')
+    assert convert_directory(tmp_path, tmp_path, incremental=True).converted
+    summary = convert_directory(tmp_path, tmp_path, incremental=True)
+    assert (summary.converted, summary.errors) == (0, [])
+    assert sorted(os.listdir(tmp_path)) == [
+        ".convert_manifest.json",
+        "one.json",
+        "one.yaml",
+    ]
+
+
+def test_main_negative_jobs(tmp_path, monkeypatch):
+    """Test that a negative number of processes is a usage error."""
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["json_to_yaml.py", str(tmp_path), str(tmp_path), "-j", "-1"],
+    )
+    with pytest.raises(SystemExit) as exc_info:
+        json_to_yaml.main()
+    assert exc_info.value.code == 2
+
+
+@pytest.mark.parametrize(
+    "args", [["one.json", "target", "-u"], [".", "-u"]], ids=["file", "stdout"]
+)
+def test_main_incremental_needs_dirs(tmp_path, monkeypatch, args):
+    """Test that -u without a source and target directory is an error."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "one.json").write_text("{}")
+    monkeypatch.setattr(sys, "argv", ["json_to_yaml.py", *args])
+    with pytest.raises(SystemExit) as exc_info:
+        json_to_yaml.main()
+    assert exc_info.value.code == 2
+
+
+RECORDS = [
+    {"id": 1, "name": "one", "tags": ["a", "b"]},
+    12345678901234567890,
+    -1.5e-10,
+    'text with "quotes" and ] , [',
+    [],
+    {},
+    None,
+    True,
+    [{"nested": [1, [2, [3]]]}],
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 16])
+def test_iter_json_records(monkeypatch, chunk_size):
+    """Test that records are parsed across chunk boundaries."""
+    monkeypatch.setattr(json_to_yaml, "READ_CHUNK_SIZE", chunk_size)
+    array = io.StringIO(
+        " [ " + " ,\n ".join(map(json.dumps, RECORDS)) + " ]\n"
+    )
+    assert list(iter_json_records(array)) == RECORDS
+    lines = io.StringIO("\n".join(map(json.dumps, RECORDS)) + "\n")
+    assert list(iter_json_records(lines, lines=True)) == RECORDS
+    assert not list(iter_json_records(io.StringIO("[]")))
+    assert list(iter_json_records(io.StringIO('{"a": 1}'))) == [{"a": 1}]
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["[1, 2", "[1 2]", "[1, 2] 3", "[1,]", "[0x]", "[1.]", "[1, 2, 3e]"],
+)
+@pytest.mark.parametrize("chunk_size", [1, 1 << 16])
+def test_iter_json_records_invalid(monkeypatch, text, chunk_size):
+    """Test that malformed arrays are rejected where json.loads fails."""
+    monkeypatch.setattr(json_to_yaml, "READ_CHUNK_SIZE", chunk_size)
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads(text)
+    with pytest.raises(json.JSONDecodeError) as error:
+        list(iter_json_records(io.StringIO(text)))
+    assert str(error.value) == str(expected.value)
+
+
+@pytest.mark.parametrize("chunk_size", [4, 1 << 16])
+def test_iter_json_records_error_position(monkeypatch, chunk_size):
+    """Test that errors point into the file and stop reading it."""
+    monkeypatch.setattr(json_to_yaml, "READ_CHUNK_SIZE", chunk_size)
+    text = "[\n" + ",\n".join(['{"a": [1, 2]}'] * 20 + ["{x}"] * 2000) + "]"
+    with pytest.raises(json.JSONDecodeError) as expected:
+        json.loads(text)
+    source = io.StringIO(text)
+    with pytest.raises(json.JSONDecodeError) as error:
+        list(iter_json_records(source))
+    assert str(error.value) == str(expected.value)
+    assert (error.value.lineno, error.value.colno) == (22, 2)
+    if chunk_size < 1 << 16:
+        assert source.tell() < len(text) // 2
+
+
+def test_convert_file_stream(tmp_path):
+    """Test that arrays and JSON Lines stream to sequences and documents."""
+    source = tmp_path / "array.json"
+    source.write_text(json.dumps(RECORDS))
+    convert_file(source, tmp_path / "sequence.yaml", stream="sequence")
+    assert (tmp_path / "sequence.yaml").read_text() == yaml.safe_dump(RECORDS)
+
+    lines = tmp_path / "records.jsonl"
+    lines.write_text("\n".join(map(json.dumps, RECORDS)))
+    convert_file(lines, tmp_path / "documents.yaml", stream="documents")
+    with open(tmp_path / "documents.yaml", encoding=ENCODING) as file:
+        assert list(yaml.safe_load_all(file)) == RECORDS
+
+    empty = tmp_path / "empty.json"
+    empty.write_text("[]")
+    convert_file(empty, tmp_path / "empty.yaml", stream="sequence")
+    assert (tmp_path / "empty.yaml").read_text() == yaml.safe_dump([])
+
+
+def test_convert_file_stream_single_value(tmp_path):
+    """Test that a value other than an array is written as it is."""
+    source = tmp_path / "object.json"
+    source.write_text(json.dumps(RECORDS[0]))
+    convert_file(source, tmp_path / "plain.yaml")
+    convert_file(source, tmp_path / "sequence.yaml", stream="sequence")
+    assert (tmp_path / "sequence.yaml").read_text() == (
+        tmp_path / "plain.yaml"
+    ).read_text()
+
+
+def test_convert_file_stream_error(tmp_path, capsys):
+    """Test that records before a malformed one are kept."""
+    source = tmp_path / "broken.json"
+    source.write_text('[{"a": 1}, {"b": 2}, {"c": ]')
+    target = tmp_path / "broken.yaml"
+    assert not convert_file(source, target, stream="sequence")
+    assert "not valid JSON" in capsys.readouterr().out
+    assert yaml.safe_load(target.read_text()) == [{"a": 1}, {"b": 2}]
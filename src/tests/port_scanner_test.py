@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the port scanner module."""
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import asyncio
+import io
+import itertools
+import json
+import socket
+import time
+
+import pytest
+
+import port_scanner
+from port_scanner import (
+    CLOSED,
+    Checkpoint,
+    OPEN,
+    ResultWriter,
+    RttEstimator,
+    ScanResult,
+    TokenBucket,
+    collect,
+    expand_hosts,
+    iter_targets,
+    parse_ports,
+    read_targets,
+    scan_async,
+)
+
+
+def free_port() -> int:
+    """Return a loopback port that nothing is listening on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_iter_targets_is_lazy():
+    """Test that targets are generated without expanding every host."""
+
+    def hosts():
+        yield "10.0.0.1"
+        yield "10.0.0.2"
+        raise AssertionError("host window read too far")
+
+    targets = iter_targets(hosts(), [22, 80], host_window=1)
+    assert next(targets) == ("10.0.0.1", 22)
+    assert next(targets) == ("10.0.0.1", 80)
+
+
+def test_iter_targets_interleaves_hosts():
+    """Test that the ports of every host in a window are interleaved."""
+    targets = list(iter_targets(["a", "b", "c"], [1, 2], host_window=2))
+    assert targets == [
+        ("a", 1),
+        ("b", 1),
+        ("a", 2),
+        ("b", 2),
+        ("c", 1),
+        ("c", 2),
+    ]
+
+
+def test_scan_async_limits(monkeypatch):
+    """Test that the scan respects the global and per-host limits."""
+    in_flight = {}
+    peaks = {"total": 0}
+
+    async def fake_scanner(ip, _port, **_options):
+        in_flight[ip] = in_flight.get(ip, 0) + 1
+        peaks[ip] = max(peaks.get(ip, 0), in_flight[ip])
+        peaks["total"] = max(peaks["total"], sum(in_flight.values()))
+        await asyncio.sleep(0.001)
+        in_flight[ip] -= 1
+        return ScanResult(ip, _port, CLOSED, 0.001)
+
+    monkeypatch.setattr(port_scanner, "scanner", fake_scanner)
+    targets = iter_targets(["a", "b", "c", "d"], range(50))
+    report = asyncio.run(
+        collect(scan_async(targets, concurrency=6, host_concurrency=2))
+    )
+    assert report.counts[CLOSED] == 200
+    assert peaks["total"] == 6
+    assert all(peaks[ip] == 2 for ip in "abcd")
+
+
+def test_scan_async_results():
+    """Test that open and refused ports are reported."""
+    closed_port = free_port()
+
+    async def run():
+        server = await asyncio.start_server(
+            lambda _reader, writer: writer.close(), "127.0.0.1", 0
+        )
+        open_port = server.sockets[0].getsockname()[1]
+        async with server:
+            results = [
+                result
+                async for result in scan_async(
+                    [("127.0.0.1", open_port), ("127.0.0.1", closed_port)]
+                )
+            ]
+        return open_port, results
+
+    open_port, results = asyncio.run(run())
+    states = {result.port: result.state for result in results}
+    assert states == {open_port: OPEN, closed_port: CLOSED}
+    assert all(result.latency >= 0 for result in results)
+
+
+def test_result_writer_formats():
+    """Test the text, JSON Lines and CSV output formats."""
+    results = [
+        ScanResult("10.0.0.1", 22, OPEN, 0.001),
+        ScanResult("10.0.0.1", 23, CLOSED, 0.002),
+        ScanResult("10.0.0.1", 24, "filtered", 0.5),
+    ]
+    outputs = {}
+    for output_format in ResultWriter.FORMATS:
+        stream = io.StringIO()
+        with ResultWriter(stream, output_format, batch_size=2) as writer:
+            for result in results:
+                writer(result)
+        outputs[output_format] = stream.getvalue().splitlines()
+
+    assert outputs["text"] == [
+        "10.0.0.1:22 Connected",
+        "10.0.0.1:23 Connection refused",
+    ]
+    assert [json.loads(line)["state"] for line in outputs["jsonl"]] == [
+        "open",
+        "closed",
+        "filtered",
+    ]
+    assert outputs["csv"][0] == "ip,port,state,latency,error,banner"
+    assert outputs["csv"][1] == "10.0.0.1,22,open,0.001,,"
+
+
+def test_rtt_estimator_timeout():
+    """Test that the timeout follows the measured round-trip times."""
+    rtt = RttEstimator(0.5, min_timeout=0.01, max_timeout=2.0)
+    assert rtt.timeout == 0.5
+    for _ in range(20):
+        rtt.update(0.002)
+    assert 0.01 <= rtt.timeout < 0.05
+    for _ in range(50):
+        rtt.update(1.0)
+    assert 1.0 <= rtt.timeout <= 2.0
+    rtt.update(10.0)
+    assert rtt.timeout == 2.0
+
+
+def test_scan_async_adaptive(monkeypatch):
+    """Test that refused connects shrink the host's timeout."""
+    closed_port = free_port()
+    timeouts = []
+    real_scanner = port_scanner.scanner
+
+    async def recording_scanner(ip, port, **options):
+        timeouts.append(options["rtt"].timeout)
+        return await real_scanner(ip, port, **options)
+
+    monkeypatch.setattr(port_scanner, "scanner", recording_scanner)
+    targets = [("127.0.0.1", closed_port)] * 5
+    asyncio.run(
+        collect(
+            scan_async(
+                targets,
+                timeout=5.0,
+                concurrency=1,
+                adaptive=True,
+                min_timeout=0.02,
+            )
+        )
+    )
+    assert timeouts[0] == 5.0
+    assert timeouts[-1] < 1.0
+
+
+def test_expand_hosts():
+    """Test networks, ranges and literal hosts."""
+    assert list(expand_hosts(["10.0.0.0/30"])) == ["10.0.0.1", "10.0.0.2"]
+    assert list(expand_hosts(["10.0.0.254-10.0.1.1"])) == [
+        "10.0.0.254",
+        "10.0.0.255",
+        "10.0.1.0",
+        "10.0.1.1",
+    ]
+    assert list(expand_hosts(["10.0.0.1-3"])) == [
+        "10.0.0.1",
+        "10.0.0.2",
+        "10.0.0.3",
+    ]
+    assert list(expand_hosts(["::1", "2001:db8::/127", "my-host"])) == [
+        "::1",
+        "2001:db8::",
+        "2001:db8::1",
+        "my-host",
+    ]
+    with pytest.raises(ValueError):
+        list(expand_hosts(["10.0.0.9-10.0.0.1"]))
+
+
+def test_expand_hosts_is_lazy():
+    """Test that large networks are not expanded up front."""
+    hosts = expand_hosts(["10.0.0.0/8"])
+    assert list(itertools.islice(hosts, 2)) == ["10.0.0.1", "10.0.0.2"]
+
+
+def test_read_targets(tmp_path):
+    """Test reading host specifications from a file."""
+    target_file = tmp_path / "targets.txt"
+    target_file.write_text("# lab\n10.0.0.1\n\n10.0.1.0/31  # rack\n")
+    assert list(read_targets(str(target_file))) == [
+        "10.0.0.1",
+        "10.0.1.0/31",
+    ]
+
+    target_file.write_text("10.0.0.1\n# lab\n10.0.0.9-10.0.0.1\n")
+    targets = read_targets(str(target_file))
+    assert next(targets) == "10.0.0.1"
+    with pytest.raises(ValueError, match=r"targets\.txt:3: invalid"):
+        next(targets)
+
+
+def test_parse_ports():
+    """Test port lists and ranges."""
+    assert parse_ports(["1-3,8080", "2", "443"]) == [1, 2, 3, 8080, 443]
+    for spec in ("0", "65536", "10-1", "http"):
+        with pytest.raises(ValueError):
+            parse_ports([spec])
+
+
+def test_iter_targets_shards():
+    """Test that shards partition the targets without overlap."""
+    hosts = [f"10.0.0.{host}" for host in range(5)]
+    for randomize in (False, True):
+        everything = list(iter_targets(hosts, range(7), randomize, 3, seed=1))
+        shards = [
+            list(
+                iter_targets(
+                    hosts, range(7), randomize, 3, seed=1, shard=i, shards=3
+                )
+            )
+            for i in range(3)
+        ]
+        assert len(everything) == 35
+        assert sorted(sum(shards, [])) == sorted(everything)
+    ordered = list(iter_targets(hosts, range(7), host_window=3))
+    assert (
+        list(iter_targets(hosts, range(7), host_window=3, shard=1, shards=3))
+        == ordered[1::3]
+    )
+
+
+def test_scan_workers_in_order():
+    """Test that a multi-process scan reports results in target order."""
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        open_port = server.getsockname()[1]
+        ports = [open_port, *(free_port() for _ in range(5))]
+        results = []
+        report = port_scanner.scan(
+            ["127.0.0.1"], ports, sink=results.append, workers=3
+        )
+    assert [result.port for result in results] == ports
+    assert report.total == 6
+    assert [result.port for result in report.open] == [open_port]
+
+
+def test_scan_workers_share_rate():
+    """Test that worker processes split the rate limit between them."""
+    ports = [free_port() for _ in range(40)]
+    started = time.monotonic()
+    report = port_scanner.scan(["127.0.0.1"], ports, workers=2, rate=100)
+    assert report.total == 40
+    # 40 connections at 100 per second, not 100 per second per worker
+    assert time.monotonic() - started >= 0.35
+
+
+def test_scan_workers_within_limits(monkeypatch):
+    """Test that no more workers run than the concurrency limits allow."""
+    calls = []
+    # pylint: disable-next=protected-access
+    scan_sharded = port_scanner._scan_sharded
+
+    def record_sharded(job, sink, workers):
+        report = scan_sharded(job, sink, workers)
+        calls.append((workers, job["options"]))
+        return report
+
+    monkeypatch.setattr(port_scanner, "_scan_sharded", record_sharded)
+    port_scanner.scan(["127.0.0.1"], [], workers=4, host_concurrency=1)
+    assert not calls
+    port_scanner.scan(
+        ["127.0.0.1"], [], workers=4, concurrency=7, host_concurrency=3
+    )
+    assert [workers for workers, _ in calls] == [3]
+    options = calls[0][1]
+    # Each of the 3 workers gets a third, rounded down
+    assert (options["concurrency"], options["host_concurrency"]) == (2, 1)
+
+
+def test_iter_targets_randomized_permutation():
+    """Test that randomizing visits every target exactly once."""
+    hosts = [f"10.0.0.{host}" for host in range(10)]
+    ordered = list(iter_targets(hosts, range(100), host_window=4))
+    shuffled = list(iter_targets(hosts, range(100), True, 4, seed=7))
+    assert shuffled != ordered
+    assert sorted(shuffled) == sorted(ordered)
+    assert shuffled == list(iter_targets(hosts, range(100), True, 4, seed=7))
+
+
+def test_token_bucket_rate():
+    """Test that the bucket paces acquisitions to its rate."""
+
+    async def run():
+        bucket = TokenBucket(200, capacity=1)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(41)))
+        return time.monotonic() - started
+
+    assert 0.18 <= asyncio.run(run()) < 0.5
+
+
+def test_scan_async_host_rate(monkeypatch):
+    """Test that the per-host rate limit applies to each host."""
+    starts = {}
+
+    async def fake_scanner(ip, port, **_options):
+        starts.setdefault(ip, []).append(time.monotonic())
+        return ScanResult(ip, port, CLOSED, 0.0)
+
+    monkeypatch.setattr(port_scanner, "scanner", fake_scanner)
+    targets = iter_targets(["a", "b"], range(11))
+    asyncio.run(collect(scan_async(targets, host_rate=100)))
+    for times in starts.values():
+        assert times[-1] - times[0] >= 0.09
+
+
+def test_checkpoint_round_trip(tmp_path):
+    """Test that a saved checkpoint skips finished targets on load."""
+    path = str(tmp_path / "scan.checkpoint")
+    ports = [22, 80, 443]
+    checkpoint = Checkpoint(path, ports)
+    checkpoint.mark("10.0.0.1", 22)
+    for port in ports:
+        checkpoint.mark("10.0.0.2", port)
+    checkpoint.save()
+
+    loaded = Checkpoint.load(path, ports)
+    assert loaded.is_done("10.0.0.1", 22)
+    assert not loaded.is_done("10.0.0.1", 80)
+    assert loaded.is_done("10.0.0.2", 443)
+    assert loaded.complete == {"10.0.0.2"}
+    with pytest.raises(ValueError):
+        Checkpoint.load(path, [22])
+
+
+def test_scan_resume(tmp_path):
+    """Test that a resumed scan only probes unfinished targets."""
+    ports = [free_port() for _ in range(4)]
+    for workers in (1, 2):
+        path = str(tmp_path / f"scan-{workers}.checkpoint")
+        checkpoint = Checkpoint(path, ports)
+        checkpoint.mark("127.0.0.1", ports[0])
+        checkpoint.mark("127.0.0.1", ports[2])
+        checkpoint.save()
+
+        results = []
+        port_scanner.scan(
+            ["127.0.0.1"],
+            ports,
+            sink=results.append,
+            workers=workers,
+            checkpoint=Checkpoint.load(path, ports),
+        )
+        assert sorted(result.port for result in results) == sorted(
+            [ports[1], ports[3]]
+        )
+        assert Checkpoint.load(path, ports).complete == {"127.0.0.1"}
+
+
+def test_scan_async_banners():
+    """Test that banners are read from open ports only."""
+    closed_port = free_port()
+
+    async def greet(_reader, writer):
+        writer.write(b"SSH-2.0-Test\r\n")
+        await writer.drain()
+
+    async def silent(reader, _writer):
+        await reader.read()
+
+    async def run():
+        greeter = await asyncio.start_server(greet, "127.0.0.1", 0)
+        quiet = await asyncio.start_server(silent, "127.0.0.1", 0)
+        ports = [
+            greeter.sockets[0].getsockname()[1],
+            quiet.sockets[0].getsockname()[1],
+            closed_port,
+        ]
+        async with greeter, quiet:
+            results = [
+                result
+                async for result in scan_async(
+                    [("127.0.0.1", port) for port in ports],
+                    banners=True,
+                    banner_timeout=0.2,
+                    banner_concurrency=1,
+                )
+            ]
+        return ports, {result.port: result for result in results}
+
+    ports, results = asyncio.run(run())
+    assert results[ports[0]].banner == "SSH-2.0-Test\r\n"
+    assert results[ports[1]].state == OPEN
+    assert results[ports[1]].banner is None
+    assert results[closed_port].state == CLOSED
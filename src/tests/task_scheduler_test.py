@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the task_scheduler module."""
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import datetime
+import json
+
+import pytest
+
+import task_scheduler
+from task_scheduler import SqliteTaskStore, TaskStore, main
+
+
+def test_task_store(tmp_path):
+    """Test that tasks are loaded lazily, added and deleted."""
+    path = tmp_path / "tasks.json"
+    store = TaskStore(str(path))
+    assert len(store) == 0
+
+    store.add("first", datetime.date(2024, 1, 2))
+    store.add("second", datetime.date(2024, 3, 4))
+    assert not path.exists()
+
+    store = TaskStore(str(path))
+    assert store.delete(1)["name"] == "first"
+    with pytest.raises(IndexError):
+        store.delete(2)
+    with pytest.raises(KeyError):
+        store.remove(1)
+    assert TaskStore(str(path)).tasks == [
+        {"id": 2, "name": "second", "due_date": "2024-03-04"}
+    ]
+
+
+def test_task_store_journal(tmp_path, monkeypatch):
+    """Test compaction, replays and crashes while writing."""
+    monkeypatch.setattr(task_scheduler, "COMPACT_MIN_OPS", 4)
+    path = tmp_path / "tasks.json"
+    # Snapshots written before IDs existed get them by position
+    path.write_text('[{"name": "old", "due_date": "2023-01-01"}]')
+    store = TaskStore(str(path))
+    for day in range(1, 6):
+        store.add(f"task {day}", datetime.date(2024, 1, day))
+    snapshot = json.loads(path.read_text())
+    assert [task["id"] for task in snapshot["tasks"]] == [1, 2, 3, 4, 5, 6]
+    assert snapshot["next_id"] == 7
+    journal_path = tmp_path / "tasks.json.journal"
+    assert journal_path.read_bytes() == b""
+
+    # Replaying a journal the snapshot already includes changes nothing
+    store.remove(2)
+    journal = journal_path.read_bytes()
+    store.compact()
+    journal_path.write_bytes(journal + b'{"op": "delete", "id"')
+    store = TaskStore(str(path))
+    assert [task["id"] for task in store] == [1, 3, 4, 5, 6]
+
+    # A torn last line is ignored, then replaced by the next operation
+    assert store.add("new", datetime.date(2024, 2, 1))["id"] == 7
+    assert [task["id"] for task in TaskStore(str(path))] == [1, 3, 4, 5, 6, 7]
+
+
+def test_task_store_stable_ids(tmp_path):
+    """Test that IDs of deleted tasks are not reused after compacting."""
+    path = str(tmp_path / "tasks.json")
+    store = TaskStore(path)
+    store.add("first", datetime.date(2024, 1, 1))
+    store.add("second", datetime.date(2024, 1, 2))
+    store.remove(2)
+    store.compact()
+    store = TaskStore(path)
+    assert store.add("third", datetime.date(2024, 1, 3))["id"] == 3
+    store.remove(3)
+
+    # IDs carry over between the two kinds of store
+    db_path = str(tmp_path / "tasks.db")
+    database = SqliteTaskStore(db_path)
+    database.import_json(path)
+    assert database.add("fourth", datetime.date(2024, 1, 4))["id"] == 4
+    database.remove(4)
+    database.export_json(path)
+    database.close()
+    assert TaskStore(path).add("fifth", datetime.date(2024, 1, 5))["id"] == 5
+
+
+def test_main(tmp_path, capsys):
+    """Test the non-interactive commands."""
+    path = str(tmp_path / "tasks.json")
+    main(["-f", path, "add", "first", "2024-01-02"])
+    main(["-f", path, "add", "second", "2024-03-04"])
+    main(["-f", path, "delete", "1"])
+    main(["-f", path, "list"])
+    assert capsys.readouterr().out == "2. second (Due: 2024-03-04)\n"
+
+    with pytest.raises(SystemExit):
+        main(["-f", path, "add", "third", "tomorrow"])
+    with pytest.raises(SystemExit):
+        main(["-f", path, "delete", "5"])
+
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_query(tmp_path, kind):
+    """Test name and due date queries, their order and pages."""
+    if kind == "json":
+        store = TaskStore(str(tmp_path / "tasks.json"))
+    else:
+        store = SqliteTaskStore(str(tmp_path / "tasks.db"))
+    for day in (5, 1, 3, 1, 9):
+        store.add(f"day {day}", datetime.date(2024, 1, day))
+
+    def ids(**filters):
+        return [task["id"] for task in store.query(**filters)]
+
+    assert ids() == [1, 2, 3, 4, 5]
+    assert ids(offset=1, limit=2) == [2, 3]
+    assert ids(name="day 1") == [2, 4]
+    assert ids(due_to=datetime.date(2024, 1, 4)) == [2, 4, 3]
+    assert ids(due_from=datetime.date(2024, 1, 3), limit=2) == [3, 1]
+    assert store.remove(5)["name"] == "day 9"
+    assert len(store) == 4
+
+
+def test_sqlite_task_store(tmp_path, capsys):
+    """Test stable IDs and importing and exporting JSON snapshots."""
+    json_path = str(tmp_path / "tasks.json")
+    db_path = str(tmp_path / "tasks.db")
+    main(["-f", json_path, "add", "first", "2000-01-01"])
+    main(["-f", json_path, "add", "second", "2999-01-01"])
+    main(["-f", json_path, "delete", "1"])
+    main(["--db", db_path, "import", json_path])
+    main(["--db", db_path, "add", "third", "2000-01-02"])
+
+    store = SqliteTaskStore(db_path)
+    # IDs of deleted tasks are not reused
+    store.remove(3)
+    assert store.add("fourth", datetime.date(2000, 1, 3))["id"] == 4
+    store.close()
+    capsys.readouterr()
+    main(["--db", db_path, "list", "--overdue"])
+    assert capsys.readouterr().out == "4. fourth (Due: 2000-01-03)\n"
+
+    export_path = str(tmp_path / "export.json")
+    main(["--db", db_path, "export", export_path])
+    assert TaskStore(export_path).tasks == [
+        {"id": 2, "name": "second", "due_date": "2999-01-01"},
+        {"id": 4, "name": "fourth", "due_date": "2000-01-03"},
+    ]
+    with pytest.raises(SystemExit):
+        main(["-f", json_path, "export", export_path])
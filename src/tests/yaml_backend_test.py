@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tests for the yaml_backend module."""
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+
+import json
+
+import pytest
+import yaml
+
+import json_to_yaml
+import yaml_to_json
+from yaml_backend import HAS_LIBYAML, safe_dumper, safe_loader
+
+needs_libyaml = pytest.mark.skipif(
+    not HAS_LIBYAML, reason="PyYAML was built without libyaml"
+)
+
+DOCUMENT = {
+    "name": "Test",
+    "unicode": "naïve café ✓",
+    "numbers": [0, -1, 3.5, 1e100, 12345678901234567890],
+    "flags": [True, False, None],
+    "nested": {"list": [{"a": 1}, {"b": [1, 2, {"c": "d"}]}], "empty": {}},
+    "text": "line one\nline two\n" + "long " * 40,
+    "quoted": ["yes", "no", "on", "1.0", "null", "", " padded ", "a: b"],
+}
+
+
+def test_pick_backend():
+    """Test that the pure Python classes can always be chosen."""
+    assert safe_loader("python") is yaml.SafeLoader
+    assert safe_dumper("python") is yaml.SafeDumper
+    with pytest.raises(ValueError):
+        safe_loader("fast")
+
+
+@needs_libyaml
+def test_auto_prefers_libyaml():
+    """Test that libyaml is used when it is available."""
+    assert safe_loader() is yaml.CSafeLoader
+    assert safe_dumper("auto") is yaml.CSafeDumper
+
+
+@needs_libyaml
+def test_backends_identical(tmp_path):
+    """Test that both backends convert files to the same bytes."""
+    source = tmp_path / "source.json"
+    source.write_text(json.dumps(DOCUMENT), encoding="utf-8")
+    outputs = {}
+    for backend in ("c", "python"):
+        yaml_path = tmp_path / f"{backend}.yaml"
+        json_path = tmp_path / f"{backend}.json"
+        assert json_to_yaml.convert_file(source, yaml_path, backend=backend)
+        assert yaml_to_json.convert_file(yaml_path, json_path, backend=backend)
+        outputs[backend] = (yaml_path.read_bytes(), json_path.read_bytes())
+    assert outputs["c"] == outputs["python"]
+    assert json.loads(outputs["c"][1]) == DOCUMENT
@@ -9,9 +9,9 @@ import json
 import sys
 import pytest
 
+import yaml_to_json
 from yaml_to_json import convert_directory, convert_file
 
-
 # pylint: disable=redefined-outer-name
 
 # Define system encoding
@@ -59,3 +59,133 @@ def test_convert_directory(yaml_file, json_file, tmp_path):
     ) as open_json_file_2:
         json_content_2 = json.load(open_json_file_2)
     assert json_content_2 == {"name": "Test 2"}
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_convert_directory_jobs(tmp_path, capsys, jobs):
+    """Test that files are converted in parallel and errors are reported."""
+    source_dir = tmp_path / "source"
+    (source_dir / "nested").mkdir(parents=True)
+    target_dir = tmp_path / "target"
+    target_dir.mkdir()
+    for index in range(10):
+        (source_dir / f"file{index}.yaml").write_text(f"index: {index}\n")
+    (source_dir / "nested" / "other.yml").write_text("- a\n- b\n")
+    (source_dir / "broken.yaml").write_text("key: [unclosed\n")
+
+    summary = convert_directory(source_dir, target_dir, jobs=jobs)
+
+    assert summary.converted == 11
+    assert [path for path, _ in summary.errors] == [
+        str(source_dir / "broken.yaml")
+    ]
+    assert "ERROR" in capsys.readouterr().out
+    for index in range(10):
+        content = json.loads((target_dir / f"file{index}.json").read_text())
+        assert content == {"index": index}
+    assert json.loads((target_dir / "other.json").read_text()) == ["a", "b"]
+
+
+def test_convert_file_lines(tmp_path, capsys):
+    """Test that every document of a YAML stream becomes a JSON line."""
+    source = tmp_path / "stream.yaml"
+    source.write_text("a: 1\n---\n- x\n- y\n---\n---\nb: {c: true}\n")
+    target = tmp_path / "stream.jsonl"
+    assert convert_file(source, target, lines=True)
+    records = target.read_text().splitlines()
+    assert [json.loads(record) for record in records] == [
+        {"a": 1},
+        ["x", "y"],
+        None,
+        {"b": {"c": True}},
+    ]
+
+    assert convert_file(source, lines=True)
+    assert capsys.readouterr().out.splitlines() == records
+
+
+def test_convert_file_lines_error(tmp_path, capsys):
+    """Test that documents before a broken one are kept."""
+    source = tmp_path / "stream.yaml"
+    source.write_text("a: 1\n---\nb: 2\n---\nc: [\n")
+    target = tmp_path / "stream.jsonl"
+    assert not convert_file(source, target, lines=True)
+    assert "document 3" in capsys.readouterr().out
+    assert target.read_text() == '{"a": 1}\n{"b": 2}\n'
+
+
+def test_convert_directory_lines(tmp_path):
+    """Test that directories are converted to JSON Lines files."""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    target_dir = tmp_path / "target"
+    target_dir.mkdir()
+    (source_dir / "one.yml").write_text("a: 1\n---\na: 2\n")
+    summary = convert_directory(source_dir, target_dir, jobs=2, lines=True)
+    assert summary.converted == 1
+    assert (target_dir / "one.jsonl").read_text() == '{"a": 1}\n{"a": 2}\n'
+
+
+def test_convert_directory_incremental(tmp_path):
+    """Test that reruns only convert changed files and replace targets."""
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    target_dir = tmp_path / "target"
+    target_dir.mkdir()
+    (source_dir / "one.yaml").write_text("a: 1\n")
+    (source_dir / "two.yaml").write_text("b: 2\n")
+    summary = convert_directory(source_dir, target_dir, incremental=True)
+    assert summary.converted == 2
+
+    (source_dir / "one.yaml").write_text("a: 10\n")
+    (source_dir / "two.yaml").unlink()
+    summary = convert_directory(source_dir, target_dir, incremental=True)
+    assert (summary.converted, summary.deleted) == (1, 1)
+    assert json.loads((target_dir / "one.json").read_text()) == {"a": 10}
+    assert not (target_dir / "two.json").exists()
+
+
+def test_main_negative_jobs(tmp_path, monkeypatch):
+    """Test that a negative number of processes is a usage error."""
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["yaml_to_json.py", str(tmp_path), str(tmp_path), "-j", "-1"],
+    )
+    with pytest.raises(SystemExit) as exc_info:
+        yaml_to_json.main()
+    assert exc_info.value.code == 2
+
+
+@pytest.mark.parametrize(
+    "args", [["one.yaml", "target", "-u"], [".", "-u"]], ids=["file", "stdout"]
+)
+def test_main_incremental_needs_dirs(tmp_path, monkeypatch, args):
+    """Test that -u without a source and target directory is an error."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "one.yaml").write_text("{}")
+    monkeypatch.setattr(sys, "argv", ["yaml_to_json.py", *args])
+    with pytest.raises(SystemExit) as exc_info:
+        yaml_to_json.main()
+    assert exc_info.value.code == 2
+
+
+def test_convert_file_format(tmp_path):
+    """Test the default, compact and indented output."""
+    source = tmp_path / "one.yaml"
+    source.write_text("b: 1\na: [x, \u00e9]\n")
+    target = tmp_path / "one.json"
+    assert convert_file(source, target)
+    assert target.read_text() == '{"b": 1, "a": ["x", "\\u00e9"]}'
+    target.unlink()
+    assert convert_file(source, target, compact=True)
+    assert target.read_text() == '{"b":1,"a":["x","\u00e9"]}'
+    target.unlink()
+    assert convert_file(source, target, indent=True, sort_keys=True)
+    assert target.read_text() == (
+        '{\n  "a": [\n    "x",\n    "\u00e9"\n  ],\n  "b": 1\n}'
+    )
+    with pytest.raises(ValueError):
+        convert_file(source, lines=True, indent=True)
+    with pytest.raises(ValueError):
+        convert_file(source, compact=True, indent=True)
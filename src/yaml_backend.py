@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Pick the PyYAML loader and dumper, preferring the libyaml based ones.
+
+PyYAML only uses libyaml when asked to, through the CSafeLoader and
+CSafeDumper classes it provides when it was built against libyaml. They
+produce the same results as the pure Python classes, several times faster.
+"""
+# version: 0.1.0
+# license: MIT
+# author: Anthony Pagan
+# repo: https://github.com/get-tony/pyutils
+# Requires: pyyaml
+
+import argparse
+from typing import Any
+import yaml
+
+# Backends to choose from: libyaml if available, libyaml, or pure Python
+BACKENDS = ("auto", "c", "python")
+
+# Whether PyYAML was built against libyaml
+HAS_LIBYAML: bool = getattr(yaml, "__with_libyaml__", False)
+
+
+def _pick(backend: str, c_name: str, python_class: Any) -> Any:
+    """Return the libyaml class or the pure Python one for a backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown YAML backend: {backend}")
+    c_class = getattr(yaml, c_name, None) if HAS_LIBYAML else None
+    if backend == "python" or (backend == "auto" and c_class is None):
+        return python_class
+    if c_class is None:
+        raise ValueError("PyYAML was built without libyaml")
+    return c_class
+
+
+def safe_loader(backend: str = "auto") -> Any:
+    """Return the safe loader class of a backend.
+
+    Args:
+        backend: One of BACKENDS.
+
+    Returns:
+        CSafeLoader or SafeLoader.
+
+    Raises:
+        ValueError: The backend is unknown or not available.
+    """
+    return _pick(backend, "CSafeLoader", yaml.SafeLoader)
+
+
+def safe_dumper(backend: str = "auto") -> Any:
+    """Return the safe dumper class of a backend.
+
+    Args:
+        backend: One of BACKENDS.
+
+    Returns:
+        CSafeDumper or SafeDumper.
+
+    Raises:
+        ValueError: The backend is unknown or not available.
+    """
+    return _pick(backend, "CSafeDumper", yaml.SafeDumper)
+
+
+def add_backend_argument(parser: argparse.ArgumentParser) -> None:
+    """Add the option choosing the YAML backend."""
+    parser.add_argument(
+        "--yaml-backend",
+        choices=BACKENDS,
+        default="auto",
+        help=(
+            "YAML implementation: libyaml when available, libyaml, or pure "
+            "Python (default: auto)"
+        ),
+    )
+
+
+def check_backend(parser: argparse.ArgumentParser, backend: str) -> None:
+    """Exit with a usage error if a backend is not available."""
+    try:
+        safe_loader(backend)
+    except ValueError as exc:
+        parser.error(str(exc))
@@ -1,70 +1,229 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Convert YAML files to JSON files."""
-# version: 0.2.0
+# version: 0.4.0
 # license: MIT
 # author: Anthony Pagan
 # repo: https://github.com/get-tony/pyutils
 # Requires: pyyaml
 
 import argparse
-import json
+import functools
 import os
 import sys
-from typing import Optional
+from typing import Any, Callable, Iterator, Optional, TextIO, Tuple
 import yaml
 
+from batch_convert import (
+    ConversionError,
+    MANIFEST_FILE,
+    ConversionSummary,
+    Manifest,
+    add_incremental_argument,
+    add_jobs_argument,
+    check_incremental,
+    convert_files,
+    convert_one,
+    open_source,
+    open_target,
+    report,
+)
+from json_backend import add_json_backend_argument, check_json_backend, dumps
+from yaml_backend import (
+    add_backend_argument,
+    check_backend,
+    safe_loader,
+)
 
 # Define system encoding
 ENCODING: str = sys.getfilesystemencoding() or sys.getdefaultencoding()
 
+# Buffer size of JSON Lines files being written
+WRITE_BUFFER_SIZE: int = 1 << 20
 
-def convert_file(
-    source_file_path: str, target_file_path: Optional[str] = None
-) -> None:
+# Serializes a loaded document, see _dumper
+Dumper = Callable[[Any], str]
+
+
+def _convert(
+    source_file_path: str,
+    target_file_path: Optional[str] = None,
+    backend: str = "auto",
+    dump: Dumper = dumps,
+) -> Optional[str]:
     """Convert a single YAML file to JSON.
 
     Args:
         source_file_path: The path to the source YAML file.
         target_file_path: The path to the target JSON file.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        dump: The function serializing the document, see _dumper.
 
     Returns:
-        None.
+        The JSON text if there is no target file, otherwise None.
+
+    Raises:
+        ConversionError: The file could not be read, parsed or written.
     """
     # Open the source file
     try:
         with open(source_file_path, "r", encoding=ENCODING) as source_file:
-            source_content = yaml.safe_load(source_file)
-    except FileNotFoundError:
-        print(f"ERROR: {source_file_path} not found")
-        return
+            source_content = yaml.load(
+                source_file, Loader=safe_loader(backend)
+            )
+    except FileNotFoundError as exc:
+        raise ConversionError(f"{source_file_path} not found") from exc
+    except (OSError, UnicodeDecodeError, yaml.YAMLError) as exc:
+        raise ConversionError(
+            f"{source_file_path} could not be read: {exc}"
+        ) from exc
 
     # Convert the YAML to JSON
-    output = json.dumps(source_content)
+    try:
+        output = dump(source_content)
+    except (TypeError, ValueError) as exc:
+        raise ConversionError(
+            f"{source_file_path} could not be converted: {exc}"
+        ) from exc
 
     # Write to the target file or stdout
     if target_file_path is None:
-        print(output)
-    else:
-        try:
-            with open(target_file_path, "x", encoding=ENCODING) as target_file:
-                target_file.write(output)
-        except FileExistsError:
-            print(f"ERROR: {target_file_path} already exists")
+        return output
+    try:
+        with open(target_file_path, "x", encoding=ENCODING) as target_file:
+            target_file.write(output)
+    except FileExistsError as exc:
+        raise ConversionError(f"{target_file_path} already exists") from exc
+    except OSError as exc:
+        raise ConversionError(
+            f"{target_file_path} could not be written: {exc}"
+        ) from exc
+    return None
 
 
-def convert_directory(
-    source_dir_path: str, target_dir_path: Optional[str] = None
+def _convert_lines(
+    source_file_path: str,
+    target_file_path: Optional[str] = None,
+    backend: str = "auto",
+    dump: Dumper = dumps,
 ) -> None:
-    """Convert all YAML files in a directory to JSON.
+    """Convert a stream of YAML documents to JSON Lines.
+
+    Documents are parsed and written one at a time through a buffered
+    writer, so memory use is bounded by the largest document rather than
+    the whole stream.
 
     Args:
-        source_dir_path: The path to the source directory.
-        target_dir_path: The path to the target directory.
+        source_file_path: The path to the source YAML file.
+        target_file_path: The path to the target JSON Lines file, or None
+            to write the records to stdout as they are converted.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        dump: The function serializing each document, see _dumper.
+
+    Raises:
+        ConversionError: The file could not be read, parsed or written.
+            The documents before the failing one are kept.
+    """
+    with open_source(source_file_path, ENCODING) as source_file:
+        if target_file_path is None:
+            _write_lines(source_file, sys.stdout, backend, dump)
+            return
+        with open_target(
+            target_file_path, ENCODING, WRITE_BUFFER_SIZE
+        ) as target_file:
+            _write_lines(source_file, target_file, backend, dump)
+
+
+def _write_lines(
+    source_file: TextIO, target_file: TextIO, backend: str, dump: Dumper
+) -> None:
+    """Write every document of a YAML stream as a JSON Lines record."""
+    number = 1
+    try:
+        for document in yaml.load_all(
+            source_file, Loader=safe_loader(backend)
+        ):
+            target_file.write(dump(document) + "\n")
+            number += 1
+    except (
+        OSError,
+        UnicodeDecodeError,
+        yaml.YAMLError,
+        TypeError,
+        ValueError,
+    ) as exc:
+        raise ConversionError(
+            f"{source_file.name} document {number} could not be "
+            f"converted: {exc}"
+        ) from exc
+
+
+def _dumper(json_backend: str, lines: bool, **options: bool) -> Dumper:
+    """Pick the function serializing documents."""
+    if options["indent"] and lines:
+        raise ValueError("JSON Lines records cannot be indented")
+    if options["indent"] and options["compact"]:
+        raise ValueError("compact output cannot be indented")
+    return functools.partial(dumps, backend=json_backend, **options)
+
+
+def convert_file(  # pylint: disable=too-many-arguments
+    source_file_path: str,
+    target_file_path: Optional[str] = None,
+    backend: str = "auto",
+    lines: bool = False,
+    *,
+    json_backend: str = "auto",
+    compact: bool = False,
+    indent: bool = False,
+    sort_keys: bool = False,
+) -> bool:
+    """Convert a single YAML file to JSON.
+
+    Args:
+        source_file_path: The path to the source YAML file.
+        target_file_path: The path to the target JSON file.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        lines: Whether to stream every document of the file as JSON Lines.
+        json_backend: The JSON backend, see json_backend.BACKENDS.
+        compact: Whether to write the JSON without spaces, which orjson
+            writes faster.
+        indent: Whether to indent the JSON by two spaces.
+        sort_keys: Whether to sort the keys of objects.
 
     Returns:
-        None.
+        Whether the file was converted.
+
+    Raises:
+        ValueError: indent was asked for along with lines or compact.
     """
+    return convert_one(
+        functools.partial(
+            _convert_lines if lines else _convert,
+            backend=backend,
+            dump=_dumper(
+                json_backend,
+                lines,
+                compact=compact,
+                indent=indent,
+                sort_keys=sort_keys,
+            ),
+        ),
+        source_file_path,
+        target_file_path,
+    )
+
+
+def _target_name(file_name: str, lines: bool) -> str:
+    """Name the JSON or JSON Lines file a YAML file is converted to."""
+    extension = ".jsonl" if lines else ".json"
+    return file_name.replace(".yaml", extension).replace(".yml", extension)
+
+
+def _find_files(
+    source_dir_path: str, target_dir_path: Optional[str], lines: bool
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """Find the YAML files in a directory and the JSON files to write."""
     for root, _, files in os.walk(source_dir_path):
         for file in files:
             if file.endswith(".yaml") or file.endswith(".yml"):
@@ -73,12 +232,93 @@ def convert_directory(
                     target_file_path = None
                 else:
                     target_file_path = os.path.join(
-                        target_dir_path,
-                        file.replace(".yaml", ".json").replace(
-                            ".yml", ".json"
-                        ),
+                        target_dir_path, _target_name(file, lines)
                     )
-                convert_file(source_file_path, target_file_path)
+                yield source_file_path, target_file_path
+
+
+def convert_directory(  # pylint: disable=too-many-arguments
+    source_dir_path: str,
+    target_dir_path: Optional[str] = None,
+    jobs: int = 1,
+    *,
+    backend: str = "auto",
+    lines: bool = False,
+    incremental: bool = False,
+    json_backend: str = "auto",
+    compact: bool = False,
+    indent: bool = False,
+    sort_keys: bool = False,
+) -> ConversionSummary:
+    """Convert all YAML files in a directory to JSON.
+
+    Parsing YAML is CPU bound, so with more than one job the files are
+    spread over a pool of processes. Errors and output are printed in the
+    order the files were found either way.
+
+    Args:
+        source_dir_path: The path to the source directory.
+        target_dir_path: The path to the target directory.
+        jobs: The number of worker processes, or 0 for one per CPU.
+        backend: The YAML backend, see yaml_backend.BACKENDS.
+        lines: Whether to stream every document of the files as JSON
+            Lines.
+        incremental: Whether to only convert files changed since the last
+            incremental run, see batch_convert.Manifest. Needs a target
+            directory.
+        json_backend: The JSON backend, see json_backend.BACKENDS.
+        compact: Whether to write the JSON without spaces, which orjson
+            writes faster.
+        indent: Whether to indent the JSON by two spaces.
+        sort_keys: Whether to sort the keys of objects.
+
+    Returns:
+        The number of files converted and the errors of the others.
+
+    Raises:
+        ValueError: indent was asked for along with lines or compact.
+    """
+    converter = functools.partial(
+        _convert_lines if lines else _convert,
+        backend=backend,
+        dump=_dumper(
+            json_backend,
+            lines,
+            compact=compact,
+            indent=indent,
+            sort_keys=sort_keys,
+        ),
+    )
+    if lines and target_dir_path is None:
+        # Records go straight to stdout, which workers would interleave
+        jobs = 1
+    manifest = None
+    if incremental:
+        manifest = _manifest(
+            source_dir_path,
+            target_dir_path,
+            f"lines={lines} compact={compact} indent={indent} "
+            f"sort_keys={sort_keys}",
+        )
+    return convert_files(
+        converter,
+        _find_files(source_dir_path, target_dir_path, lines),
+        jobs,
+        manifest,
+    )
+
+
+def _manifest(
+    source_dir_path: str, target_dir_path: Optional[str], options: str
+) -> Manifest:
+    """Load the manifest of incremental conversions into a directory."""
+    if target_dir_path is None:
+        raise ValueError("incremental conversion needs a target directory")
+    return Manifest.load(
+        os.path.join(target_dir_path, MANIFEST_FILE),
+        "yaml_to_json " + options,
+        source_dir_path,
+    )
 
 
 def main() -> None:
@@ -98,21 +338,65 @@ def main() -> None:
         default=None,
         help="the target JSON file or directory",
     )
+    add_jobs_argument(parser)
+    add_incremental_argument(parser)
+    add_backend_argument(parser)
+    add_json_backend_argument(parser)
+    layout = parser.add_mutually_exclusive_group()
+    layout.add_argument(
+        "--compact",
+        action="store_true",
+        help=(
+            "write the JSON without spaces and with non-ASCII characters "
+            "as is, which orjson writes faster"
+        ),
+    )
+    layout.add_argument(
+        "--indent",
+        action="store_true",
+        help="indent the JSON by two spaces",
+    )
+    parser.add_argument(
+        "--sort-keys",
+        action="store_true",
+        help="sort the keys of objects",
+    )
+    parser.add_argument(
+        "-l",
+        "--lines",
+        action="store_true",
+        help=(
+            "stream every document of multi-document YAML as JSON Lines, "
+            "in bounded memory"
+        ),
+    )
     args = parser.parse_args()
+    check_backend(parser, args.yaml_backend)
+    check_json_backend(parser, args.json_backend)
+    if args.lines and args.indent:
+        parser.error("JSON Lines records cannot be indented")
 
     source_path: str = args.source
     target_path: Optional[str] = args.target
+    check_incremental(parser, args.incremental, source_path, target_path)
 
     # Convert a single file
     if os.path.isfile(source_path):
         if target_path is not None and os.path.isdir(target_path):
             target_path = os.path.join(
                 target_path,
-                os.path.basename(source_path)
-                .replace(".yaml", ".json")
-                .replace(".yml", ".json"),
+                _target_name(os.path.basename(source_path), args.lines),
             )
-        convert_file(source_path, target_path)
+        convert_file(
+            source_path,
+            target_path,
+            backend=args.yaml_backend,
+            lines=args.lines,
+            json_backend=args.json_backend,
+            compact=args.compact,
+            indent=args.indent,
+            sort_keys=args.sort_keys,
+        )
     # Convert a directory
     elif os.path.isdir(source_path):
         if target_path is not None and os.path.isfile(target_path):
@@ -120,7 +404,19 @@ def main() -> None:
                 "ERROR: target must be a directory when source is a directory"
             )
             return
-        convert_directory(source_path, target_path)
+        summary = convert_directory(
+            source_path,
+            target_path,
+            jobs=args.jobs,
+            backend=args.yaml_backend,
+            lines=args.lines,
+            incremental=args.incremental,
+            json_backend=args.json_backend,
+            compact=args.compact,
+            indent=args.indent,
+            sort_keys=args.sort_keys,
+        )
+        report(summary, to_stdout=target_path is not None)
     # Invalid source path
     else:
         print(f"ERROR: {source_path} is not a valid file or directory")